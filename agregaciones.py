@@ -0,0 +1,349 @@
+"""
+Motor de agregación compartido por las pestañas del dashboard.
+
+Todas las métricas y gráficos son sumas o recuentos por aeropuerto, empresa
+o mes. Cada fila se asigna una sola vez a su celda (aeropuerto x empresa x
+mes) y los agregados de un estado de filtros se obtienen en una única pasada
+vectorizada sobre las filas seleccionadas; el resto de vistas (evolución,
+rankings, meses) se derivan de esas celdas. Los resultados se memorizan por
+estado de filtros normalizado en una caché de consultas (LRU en memoria por
+defecto; ver cache_consultas.py).
+
+Además se materializa al cargar un cubo OLAP con las medidas de todas las
+celdas. Mientras el filtro de importes no excluya filas, los agregados se
+responden desde el cubo (los meses incompletos del rango de fechas se
+completan con las pocas filas de sus bordes) sin recorrer el resto de filas.
+Junto al cubo se guardan histogramas del %baja por celda, de los que sale su
+distribución (ver distribucion.py).
+"""
+import numpy as np
+import pandas as pd
+
+from cache_consultas import CacheMemoria, clave_filtros
+from distribucion import HistogramasCeldas
+from indice_filtros import IMPORTE_COL, limites_fecha_ns
+from instrumentacion import marcar_fallo, registrar_cache
+
+PRESUPUESTO_COL = 'Presupuesto base sin impuestos'
+EXPEDIENTE_COL = 'Número de expediente'
+AHORRO_COL = 'Porcentaje_Ahorro'
+
+MESES = ['January', 'February', 'March', 'April', 'May', 'June',
+         'July', 'August', 'September', 'October', 'November', 'December']
+
+# Medidas acumuladas por celda (columnas de la matriz de medidas)
+MEDIDAS = ('filas', 'expedientes', 'presupuesto', 'adjudicado', 'ahorro_suma', 'ahorro_n')
+FILAS, EXPEDIENTES, PRESUPUESTO, ADJUDICADO, AHORRO_SUMA, AHORRO_N = range(len(MEDIDAS))
+
+# Granularidades de la serie temporal: día, semana (empieza en lunes) y mes
+GRANULARIDADES = ('D', 'W', 'M')
+
+
+def sumar_por(coordenadas, medidas, n_grupos):
+    """Suma las medidas de las celdas por grupo; las coordenadas negativas se ignoran"""
+    validas = coordenadas >= 0
+    grupos = coordenadas[validas]
+    return np.column_stack([
+        np.bincount(grupos, weights=medidas[validas, j], minlength=n_grupos)
+        for j in range(medidas.shape[1])
+    ])
+
+
+def _a_ns(fecha):
+    """Fecha numpy (de cualquier unidad) como entero int64 en nanosegundos"""
+    return int(fecha.astype('datetime64[ns]').astype(np.int64))
+
+
+def _ranking(nombres, valores):
+    """Serie ordenada de mayor a menor; los empates quedan en orden alfabético"""
+    return pd.Series(valores, index=nombres).sort_values(ascending=False, kind='stable')
+
+
+class BaseAgregacion:
+    """Celdas aeropuerto x empresa x mes y medidas por fila, calculadas una vez por versión"""
+
+    def __init__(self, df, indice):
+        self.aeropuertos = indice.aeropuertos.valores
+        self.empresas = indice.empresas.valores
+        codigos_aeropuerto = indice.aeropuertos.codigos.astype(np.int64)
+        codigos_empresa = indice.empresas.codigos.astype(np.int64)
+
+        # Mes de cada fila como índice dentro de los meses presentes (-1 si no hay fecha)
+        meses = indice.fechas.valores.view('datetime64[ns]').astype('datetime64[M]')
+        con_fecha = ~np.isnat(meses)
+        self.meses, mes_de_fila = np.unique(meses[con_fecha], return_inverse=True)
+        codigos_mes = np.full(len(df), -1, dtype=np.int64)
+        codigos_mes[con_fecha] = mes_de_fila
+
+        # Clave única por combinación; el +1 reserva el 0 para los valores nulos
+        n_aeropuertos = len(self.aeropuertos) + 1
+        n_empresas = len(self.empresas) + 1
+        n_meses = len(self.meses) + 1
+        claves = ((codigos_aeropuerto + 1) * n_empresas + codigos_empresa + 1) * n_meses + codigos_mes + 1
+        claves_celda, self.celda_de_fila = np.unique(claves, return_inverse=True)
+        self.n_celdas = len(claves_celda)
+
+        resto, mes = np.divmod(claves_celda, n_meses)
+        aeropuerto, empresa = np.divmod(resto, n_empresas)
+        self.celda_aeropuerto = aeropuerto - 1
+        self.celda_empresa = empresa - 1
+        self.celda_mes = mes - 1
+
+        # Fecha de cada fila en nanosegundos (NaT como mínimo int64) para las series diarias y semanales
+        self._fechas_ns = indice.fechas.valores
+
+        # Las filas sin empresa (nula o vacía) no cuentan en el análisis de empresas
+        self.empresa_valida = np.array([bool(e) for e in self.empresas], dtype=bool)
+
+        # Medidas por fila; los nulos no suman, igual que en pandas
+        presupuesto = df[PRESUPUESTO_COL].to_numpy(dtype=np.float64)
+        adjudicado = df[IMPORTE_COL].to_numpy(dtype=np.float64)
+        ahorro = df[AHORRO_COL].to_numpy(dtype=np.float64)
+        self._expediente_informado = df[EXPEDIENTE_COL].notna().to_numpy(dtype=np.float64)
+        self._presupuesto = np.nan_to_num(presupuesto)
+        self._adjudicado = np.nan_to_num(adjudicado)
+        self._ahorro_informado = (~np.isnan(ahorro)).astype(np.float64)
+        self._ahorro = np.nan_to_num(ahorro)
+
+    def sumar_filas(self, posiciones):
+        """Matriz (celdas x medidas) con las sumas de las filas seleccionadas"""
+        celdas = self.celda_de_fila[posiciones]
+        n = self.n_celdas
+        medidas = np.empty((n, len(MEDIDAS)))
+        medidas[:, FILAS] = np.bincount(celdas, minlength=n)
+        medidas[:, EXPEDIENTES] = np.bincount(celdas, weights=self._expediente_informado[posiciones], minlength=n)
+        medidas[:, PRESUPUESTO] = np.bincount(celdas, weights=self._presupuesto[posiciones], minlength=n)
+        medidas[:, ADJUDICADO] = np.bincount(celdas, weights=self._adjudicado[posiciones], minlength=n)
+        medidas[:, AHORRO_SUMA] = np.bincount(celdas, weights=self._ahorro[posiciones], minlength=n)
+        medidas[:, AHORRO_N] = np.bincount(celdas, weights=self._ahorro_informado[posiciones], minlength=n)
+        return medidas
+
+    def serie_por_periodo(self, posiciones, granularidad):
+        """Serie por día o por semana de las filas seleccionadas, con las columnas de la mensual"""
+        fechas = self._fechas_ns[posiciones]
+        con_fecha = fechas != np.iinfo(np.int64).min
+        posiciones, fechas = posiciones[con_fecha], fechas[con_fecha]
+        dias = fechas.view('datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+        if granularidad == 'W':
+            # El 1970-01-01 fue jueves: se retrocede hasta el lunes de su semana
+            dias = dias - (dias + 3) % 7
+        elif granularidad != 'D':
+            raise ValueError(f"Granularidad desconocida: {granularidad}")
+        periodos, periodo_de_fila = np.unique(dias, return_inverse=True)
+        n = len(periodos)
+        return pd.DataFrame({
+            'Fecha': periodos.astype('datetime64[D]').astype('datetime64[ns]'),
+            EXPEDIENTE_COL: np.bincount(periodo_de_fila, weights=self._expediente_informado[posiciones], minlength=n).astype(np.int64),
+            PRESUPUESTO_COL: np.bincount(periodo_de_fila, weights=self._presupuesto[posiciones], minlength=n),
+            IMPORTE_COL: np.bincount(periodo_de_fila, weights=self._adjudicado[posiciones], minlength=n),
+        })
+
+
+class CuboOLAP:
+    """Medidas precalculadas de cada celda aeropuerto x empresa x mes"""
+
+    def __init__(self, base, indice):
+        self.base = base
+        self.indice = indice
+        # Las filas sin importe nunca pasan el filtro de importes: no entran en el cubo
+        importes = indice.importes.valores
+        con_importe = np.flatnonzero(~np.isnan(importes))
+        self.medidas = base.sumar_filas(con_importe)
+        self.importe_min = float(importes[con_importe].min()) if len(con_importe) else np.inf
+        self.importe_max = float(importes[con_importe].max()) if len(con_importe) else -np.inf
+        self.celda_aeropuerto = base.celda_aeropuerto.astype(np.int32)
+        self.celda_empresa = base.celda_empresa.astype(np.int32)
+        self.celda_mes = base.celda_mes.astype(np.int32)
+
+    def responde(self, filtros):
+        """Indica si el estado de filtros se puede resolver desde el cubo"""
+        importe_min, importe_max = filtros.rango_importes
+        return importe_min <= self.importe_min and importe_max >= self.importe_max
+
+    def descomponer(self, filtros):
+        """Celdas que el estado de filtros toma completas del cubo y filas de los meses incompletos
+
+        Devuelve una máscara sobre las celdas y las posiciones de las filas de
+        los bordes del rango de fechas que cumplen los filtros.
+        """
+        # Celdas de los aeropuertos y empresas elegidos (la comprobación es por celda, no por fila)
+        seleccion = np.ones(self.base.n_celdas, dtype=bool)
+        if filtros.aeropuertos:
+            codigos = [self.indice.aeropuertos.codigo(a) for a in filtros.aeropuertos]
+            seleccion &= np.isin(self.celda_aeropuerto, codigos)
+        if filtros.empresas:
+            codigos = [self.indice.empresas.codigo(e) for e in filtros.empresas]
+            seleccion &= np.isin(self.celda_empresa, codigos)
+        if not filtros.rango_fechas:
+            return seleccion, np.empty(0, dtype=np.intp)
+
+        # Meses completos dentro del rango [desde, hasta): se leen del cubo
+        desde, hasta = limites_fecha_ns(filtros.rango_fechas)
+        mes_desde = np.datetime64(int(desde), 'ns').astype('datetime64[M]')
+        if _a_ns(mes_desde) < desde:
+            mes_desde += 1
+        mes_hasta = np.datetime64(int(hasta), 'ns').astype('datetime64[M]')
+        if mes_desde < mes_hasta:
+            i, j = np.searchsorted(self.base.meses, [mes_desde, mes_hasta])
+            seleccion &= (self.celda_mes >= i) & (self.celda_mes < j)
+            bordes = [(desde, _a_ns(mes_desde)), (_a_ns(mes_hasta), hasta)]
+        else:
+            seleccion[:] = False
+            bordes = [(desde, hasta)]
+
+        # Los meses incompletos de los extremos se toman fila a fila
+        mapa = self.indice.seleccion(filtros.aeropuertos, filtros.empresas)
+        partes = []
+        for inicio_ns, fin_ns in bordes:
+            inicio, fin = self.indice.fechas.limites(inicio_ns, fin_ns, hasta_incluido=False)
+            posiciones = self.indice.fechas.filas(inicio, fin)
+            posiciones = posiciones[~np.isnan(self.indice.importes.valores[posiciones])]
+            if mapa is not None:
+                posiciones = posiciones[mapa.contiene(posiciones)]
+            partes.append(posiciones)
+        return seleccion, np.concatenate(partes)
+
+    def medidas_filtradas(self, filtros):
+        """Matriz (celdas x medidas) del estado de filtros, a partir del cubo"""
+        seleccion, bordes = self.descomponer(filtros)
+        medidas = self.medidas * seleccion[:, None]
+        if len(bordes):
+            medidas += self.base.sumar_filas(bordes)
+        return medidas
+
+
+class Agregados:
+    """Resultados de un estado de filtros listos para métricas y gráficos"""
+
+    def __init__(self, base, medidas):
+        totales = medidas.sum(axis=0)
+        self.total_licitaciones = int(totales[FILAS])
+        self.presupuesto_total = totales[PRESUPUESTO]
+        self.adjudicado_total = totales[ADJUDICADO]
+        self.porcentaje_baja_medio = totales[AHORRO_SUMA] / totales[AHORRO_N] if totales[AHORRO_N] else np.nan
+
+        # Evolución por mes natural (solo meses con licitaciones)
+        por_mes = sumar_por(base.celda_mes, medidas, len(base.meses))
+        hay = por_mes[:, FILAS] > 0
+        self.mensual = pd.DataFrame({
+            'Fecha': base.meses[hay].astype('datetime64[ns]'),
+            EXPEDIENTE_COL: por_mes[hay, EXPEDIENTES].astype(np.int64),
+            PRESUPUESTO_COL: por_mes[hay, PRESUPUESTO],
+            IMPORTE_COL: por_mes[hay, ADJUDICADO],
+        })
+
+        # Licitaciones por mes del año, sumando todos los años
+        mes_del_anio = base.meses.astype(np.int64) % 12
+        conteo_mes = np.bincount(mes_del_anio, weights=por_mes[:, FILAS], minlength=12)
+        self.licitaciones_por_mes = pd.Series(conteo_mes.astype(np.int64), index=MESES)
+
+        # Rankings de aeropuertos
+        por_aeropuerto = sumar_por(base.celda_aeropuerto, medidas, len(base.aeropuertos))
+        hay = por_aeropuerto[:, FILAS] > 0
+        nombres = np.array(base.aeropuertos, dtype=object)[hay]
+        self.aeropuertos_count = _ranking(nombres, por_aeropuerto[hay, FILAS].astype(np.int64))
+        self.aeropuertos_importe = _ranking(nombres, por_aeropuerto[hay, ADJUDICADO])
+
+        # Rankings de empresas (solo adjudicatarios informados)
+        por_empresa = sumar_por(base.celda_empresa, medidas, len(base.empresas))
+        hay = (por_empresa[:, FILAS] > 0) & base.empresa_valida
+        nombres = np.array(base.empresas, dtype=object)[hay]
+        self.empresas_count = _ranking(nombres, por_empresa[hay, FILAS].astype(np.int64))
+        self.empresas_importe = _ranking(nombres, por_empresa[hay, ADJUDICADO])
+        self.total_empresas = len(self.empresas_count)
+        self.filas_con_empresa = int(self.empresas_count.sum())
+
+
+class MotorAgregaciones:
+    """Calcula los agregados de cada estado de filtros y los memoriza en una caché de consultas"""
+
+    def __init__(self, df, indice, capacidad=64, instantaneas=None, cache=None, version=None):
+        self.indice = indice
+        # Almacén opcional de agregados precalculados (ver instantaneas.py)
+        self.instantaneas = instantaneas
+        self.base = BaseAgregacion(df, indice)
+        self.cubo = CuboOLAP(self.base, indice)
+        # Histogramas del %baja por celda para la distribución (ver distribucion.py)
+        self.histogramas = HistogramasCeldas(df, self.base, self.cubo, AHORRO_COL)
+        # Caché compartida (p. ej. en disco) o, si no se indica, una LRU propia sin caducidad
+        self.cache = cache if cache is not None else CacheMemoria(capacidad, ttl=float('inf'))
+        # La versión de los datos forma parte de la clave: una caché puede servir a varias versiones
+        self.version = version
+
+    def agregados(self, filtros, posiciones=None, sesion=None):
+        """Agregados del estado de filtros: de la caché, de una instantánea o del cubo si es posible
+
+        Con ``sesion`` (ver refinamiento.py), el recorrido por filas de un estado
+        más estricto que el último de la sesión parte de las medidas de aquel.
+        """
+        clave = ('agregados', self.version, clave_filtros(filtros))
+        resultado = self.cache.obtener(clave)
+        if resultado is not None:
+            return resultado
+
+        if self.instantaneas is not None:
+            resultado = self.instantaneas.cargar(filtros)
+            registrar_cache('instantaneas', acierto=resultado is not None)
+        if resultado is None:
+            marcar_fallo('agregados')
+            if self.cubo.responde(filtros):
+                medidas = self.cubo.medidas_filtradas(filtros)
+            else:
+                # El filtro de importes excluye filas: recorrido por filas
+                medidas = self.medidas_filas(filtros, posiciones, sesion)
+            resultado = Agregados(self.base, medidas)
+
+        self.cache.guardar(clave, resultado)
+        return resultado
+
+    def medidas_filas(self, filtros, posiciones=None, sesion=None):
+        """Matriz (celdas x medidas) del estado de filtros recorriendo sus filas
+
+        Si el último estado de la sesión contiene al nuevo, sus filas se
+        comprueban de nuevo y a sus medidas se restan las de las filas que salen
+        (o se suman las que quedan, si son menos).
+        """
+        clave = clave_filtros(filtros)
+        anterior = sesion.anterior('medidas', clave) if sesion is not None else None
+        if anterior is None:
+            if posiciones is None:
+                posiciones = self.indice.filtrar(*filtros)
+            medidas = self.base.sumar_filas(posiciones)
+        else:
+            _, posiciones_anteriores, medidas_anteriores = anterior
+            dentro = self.indice.comprobar(posiciones_anteriores, *filtros)
+            posiciones = posiciones_anteriores[dentro]
+            salen = posiciones_anteriores[~dentro]
+            if len(salen) < len(posiciones):
+                medidas = medidas_anteriores - self.base.sumar_filas(salen)
+                # Las celdas que se quedan sin filas vuelven a cero exacto, sin restos de redondeo
+                medidas[medidas[:, FILAS] == 0] = 0
+            else:
+                medidas = self.base.sumar_filas(posiciones)
+        if sesion is not None:
+            sesion.recordar('medidas', clave, posiciones, medidas)
+        return medidas
+
+    def serie_temporal(self, filtros, granularidad='M', posiciones=None, sesion=None):
+        """Serie temporal del estado de filtros por día, semana o mes, memorizada en la caché de consultas"""
+        if granularidad == 'M':
+            return self.agregados(filtros, posiciones, sesion).mensual
+        clave = ('serie', self.version, clave_filtros(filtros), granularidad)
+        serie = self.cache.obtener(clave)
+        if serie is None:
+            # El cubo solo llega al mes: las series más finas se calculan sobre las filas
+            if posiciones is None:
+                posiciones = self.indice.filtrar(*filtros)
+            serie = self.base.serie_por_periodo(posiciones, granularidad)
+            self.cache.guardar(clave, serie)
+        return serie
+
+    def distribucion(self, filtros, posiciones=None):
+        """Distribución del %baja del estado de filtros, memorizada en la caché de consultas"""
+        clave = ('distribucion', self.version, clave_filtros(filtros))
+        resultado = self.cache.obtener(clave)
+        if resultado is None:
+            marcar_fallo('distribucion')
+            resultado = self.histogramas.distribucion(filtros, posiciones)
+            self.cache.guardar(clave, resultado)
+        return resultado
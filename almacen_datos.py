@@ -0,0 +1,299 @@
+"""
+Almacén columnar en disco de los libros Excel de AENA.
+
+Cada hoja de cada libro (``2019_AENA.xlsx``, ``2024_AENA.xlsx``, ...) se
+convierte una sola vez a un fichero Parquet tipado dentro del almacén. La
+sincronización solo ingiere los libros nuevos o modificados y añade sus
+partes al almacén, de modo que el coste depende del tamaño del cambio y no
+del histórico. La lectura concatena las partes mapeadas en memoria.
+
+Las partes de cada versión del almacén viven en su propio directorio
+(``partes/<versión>``); las de los libros que no cambian se enlazan desde la
+versión anterior en lugar de reescribirse. La sincronización nunca borra las
+partes de otra versión: una sesión que aún consulta la versión anterior (p.
+ej. el backend SQL, que lee las partes en cada consulta) sigue encontrándolas
+hasta que el vigilante la retira con ``purgar_version``.
+
+Cada parte guarda además, con el prefijo ``PREFIJO_BUSQUEDA``, los campos
+del buscador ya normalizados: el backend SQL busca sobre ellos sin
+normalizar los textos en cada consulta. La lectura del almacén los omite.
+
+Uso desde línea de comandos (p. ej. en el despliegue):
+
+    python almacen_datos.py precalentar
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from busqueda import CAMPOS_BUSQUEDA, normalizar_serie
+
+DIR_DATOS = os.environ.get('AENA_DIR_DATOS', '.')
+PATRON_LIBROS = os.environ.get('AENA_PATRON_LIBROS', '*_AENA.xlsx')
+DIR_CACHE = os.environ.get('AENA_CACHE_DIR', '.cache_aena')
+FICHERO_MANIFIESTO = 'manifiesto.json'
+VERSION_MANIFIESTO = 5
+FECHA_COL = 'Fecha presentación licitación'
+EMPRESA_COL = 'Adjudicatario licitación/lote'
+# Columnas con los campos del buscador normalizados; el adjudicatario no se guarda
+# porque se busca por su nombre canónico, que depende de todos los libros
+PREFIJO_BUSQUEDA = '_busqueda '
+CAMPOS_NORMALIZADOS = [c for c in CAMPOS_BUSQUEDA if c != EMPRESA_COL]
+
+# Evita que dos sesiones del mismo proceso ingieran el mismo libro a la vez
+_bloqueo_sincronizacion = threading.Lock()
+
+
+def calcular_sha256(ruta, tamano_bloque=1 << 20):
+    """Calcula el hash SHA-256 del contenido de un fichero"""
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def leer_manifiesto(dir_cache=DIR_CACHE):
+    """Lee el manifiesto del almacén (libro de origen -> partes columnares)"""
+    ruta = os.path.join(dir_cache, FICHERO_MANIFIESTO)
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            manifiesto = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifiesto = {}
+    # Un manifiesto de formato antiguo se descarta y el almacén se reconstruye
+    if manifiesto.get('version') != VERSION_MANIFIESTO:
+        manifiesto = {'version': VERSION_MANIFIESTO, 'libros': {}}
+    # Las partes se guardan relativas al almacén y se usan con ruta absoluta
+    for entrada in manifiesto['libros'].values():
+        for parte in entrada['partes']:
+            parte['parquet'] = os.path.abspath(os.path.join(dir_cache, parte['parquet']))
+    return manifiesto
+
+
+def escribir_manifiesto(manifiesto, dir_cache=DIR_CACHE):
+    """Escribe el manifiesto de forma atómica, con las partes relativas al almacén"""
+    ruta = os.path.join(dir_cache, FICHERO_MANIFIESTO)
+    libros = {
+        libro: dict(entrada, partes=[dict(parte, parquet=os.path.relpath(parte['parquet'], dir_cache))
+                                     for parte in entrada['partes']])
+        for libro, entrada in manifiesto['libros'].items()
+    }
+    tmp = ruta + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(dict(manifiesto, libros=libros), f, ensure_ascii=False, indent=2)
+    os.replace(tmp, ruta)
+
+
+def tipar_columnas(df):
+    """Normaliza los tipos de las columnas para guardarlas en formato columnar"""
+    for col in df.columns:
+        if col == FECHA_COL:
+            df[col] = pd.to_datetime(df[col])
+        elif df[col].dtype == object:
+            # Las columnas mixtas (números y textos) se guardan como texto
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def columna_busqueda(campo):
+    """Nombre de la columna con el campo del buscador normalizado"""
+    return PREFIJO_BUSQUEDA + campo
+
+
+def normalizar_campos(df):
+    """Añade los campos del buscador normalizados (ver busqueda.normalizar_serie)"""
+    for campo in CAMPOS_NORMALIZADOS:
+        if campo in df.columns:
+            df[columna_busqueda(campo)] = normalizar_serie(df[campo])
+    return df
+
+
+def descubrir_libros(dir_datos=DIR_DATOS, patron=PATRON_LIBROS):
+    """Devuelve las rutas de los libros de licitaciones disponibles"""
+    return sorted(os.path.abspath(r) for r in glob.glob(os.path.join(dir_datos, patron)))
+
+
+def dir_partes_version(version, dir_cache=DIR_CACHE):
+    """Directorio (absoluto) de las partes de una versión del almacén"""
+    return os.path.abspath(os.path.join(dir_cache, 'partes', version))
+
+
+def ingerir_libro(ruta_excel, sha256, dir_partes):
+    """Convierte cada hoja con licitaciones del libro en una parte Parquet de ``dir_partes``"""
+    os.makedirs(dir_partes, exist_ok=True)
+
+    # El nombre de la parte incluye la ruta: dos libros idénticos no comparten ficheros
+    prefijo = f"{sha256[:16]}_{hashlib.sha256(ruta_excel.encode()).hexdigest()[:8]}"
+    partes = []
+    hojas = pd.read_excel(ruta_excel, sheet_name=None)
+    for i, (nombre_hoja, df) in enumerate(hojas.items()):
+        # Se ignoran hojas vacías o auxiliares (resúmenes, notas...)
+        if df.empty or FECHA_COL not in df.columns:
+            continue
+        df = normalizar_campos(tipar_columnas(df))
+        ruta_parte = os.path.join(dir_partes, f"{prefijo}_{i}.parquet")
+        tmp = ruta_parte + '.tmp'
+        df.to_parquet(tmp, engine='pyarrow', index=False)
+        os.replace(tmp, ruta_parte)
+        partes.append({'hoja': nombre_hoja, 'parquet': ruta_parte, 'filas': len(df)})
+    return partes
+
+
+def _enlazar_partes(partes, dir_partes):
+    """Partes de un libro sin cambios dentro del directorio de otra versión (enlazadas, o copiadas si no se puede)"""
+    os.makedirs(dir_partes, exist_ok=True)
+    enlazadas = []
+    for parte in partes:
+        ruta = os.path.join(dir_partes, os.path.basename(parte['parquet']))
+        if not os.path.exists(ruta):
+            tmp = ruta + '.tmp'
+            try:
+                os.link(parte['parquet'], tmp)
+            except OSError:
+                shutil.copy2(parte['parquet'], tmp)
+            os.replace(tmp, ruta)
+        enlazadas.append(dict(parte, parquet=ruta))
+    return enlazadas
+
+
+def purgar_version(version, dir_cache=DIR_CACHE):
+    """Elimina las partes de una versión del almacén que ya no usa nadie"""
+    shutil.rmtree(dir_partes_version(version, dir_cache), ignore_errors=True)
+
+
+def _partes_presentes(entrada):
+    """Indica si todas las partes de la entrada siguen en disco"""
+    return all(os.path.exists(p['parquet']) for p in entrada['partes'])
+
+
+def _entrada_vigente(entrada, info):
+    """Indica si la entrada del manifiesto corresponde al fichero tal y como está en disco"""
+    return (entrada is not None
+            and entrada['mtime_ns'] == info.st_mtime_ns
+            and entrada['tamano'] == info.st_size
+            and _partes_presentes(entrada))
+
+
+def almacen_al_dia(manifiesto, dir_datos=DIR_DATOS, patron=PATRON_LIBROS):
+    """Indica, sin leer ni calcular el hash de ningún libro, si el manifiesto refleja los libros en disco"""
+    libros = manifiesto['libros']
+    rutas = descubrir_libros(dir_datos, patron)
+    if set(rutas) != set(libros):
+        return False
+    try:
+        return all(_entrada_vigente(libros[ruta], os.stat(ruta)) for ruta in rutas)
+    except FileNotFoundError:
+        return False
+
+
+def sincronizar_almacen(dir_datos=DIR_DATOS, patron=PATRON_LIBROS, dir_cache=DIR_CACHE, forzar=False):
+    """Ingiere los libros nuevos o modificados y devuelve el manifiesto actualizado"""
+    with _bloqueo_sincronizacion:
+        os.makedirs(dir_cache, exist_ok=True)
+        manifiesto = leer_manifiesto(dir_cache)
+        libros = manifiesto['libros']
+        rutas = descubrir_libros(dir_datos, patron)
+        if not rutas:
+            raise FileNotFoundError(f"No hay libros '{patron}' en '{os.path.abspath(dir_datos)}'")
+
+        # Primero se decide qué cambia: el hash de los libros da la versión y con ella el directorio de las partes
+        cambios = set(libros) != set(rutas)
+        nuevas = {}
+        for ruta in rutas:
+            entrada = libros.get(ruta)
+            info = os.stat(ruta)
+            # Si fecha de modificación y tamaño coinciden no hace falta ni recalcular el hash
+            if not forzar and _entrada_vigente(entrada, info):
+                nuevas[ruta] = entrada
+                continue
+            sha256 = calcular_sha256(ruta)
+            # Si falta alguna parte (p. ej. borrada a mano) el libro se vuelve a ingerir
+            reingerir = forzar or entrada is None or entrada['sha256'] != sha256 or not _partes_presentes(entrada)
+            nuevas[ruta] = {
+                'sha256': sha256,
+                'mtime_ns': info.st_mtime_ns,
+                'tamano': info.st_size,
+                'partes': None if reingerir else entrada['partes'],
+            }
+            cambios = True
+        if not cambios:
+            return manifiesto
+
+        # Las partes de la versión anterior no se tocan: las nuevas van a su propio directorio
+        dir_partes = dir_partes_version(version_almacen({'libros': nuevas}), dir_cache)
+        for ruta, entrada in nuevas.items():
+            if entrada['partes'] is None:
+                entrada['partes'] = ingerir_libro(ruta, entrada['sha256'], dir_partes)
+            else:
+                # Mismo contenido: se reutilizan las partes ya generadas
+                entrada['partes'] = _enlazar_partes(entrada['partes'], dir_partes)
+        manifiesto['libros'] = nuevas
+        escribir_manifiesto(manifiesto, dir_cache)
+        return manifiesto
+
+
+def version_almacen(manifiesto):
+    """Identificador del contenido del almacén; cambia cuando cambia cualquier libro"""
+    h = hashlib.sha256()
+    for ruta in sorted(manifiesto['libros']):
+        h.update(manifiesto['libros'][ruta]['sha256'].encode())
+    return h.hexdigest()[:16]
+
+
+def columnas_datos(esquema):
+    """Columnas de una parte sin las del buscador"""
+    return [c for c in esquema.names if not c.startswith(PREFIJO_BUSQUEDA)]
+
+
+def leer_almacen(manifiesto):
+    """Lee todas las partes del almacén como un único DataFrame"""
+    tablas = [
+        pq.read_table(parte['parquet'], memory_map=True, columns=columnas_datos(pq.read_schema(parte['parquet'])))
+        for ruta in sorted(manifiesto['libros'])
+        for parte in manifiesto['libros'][ruta]['partes']
+    ]
+    if not tablas:
+        raise ValueError("El almacén no contiene hojas con licitaciones")
+    # Libros de años distintos pueden diferir en alguna columna o tipo
+    tabla = pa.concat_tables(tablas, promote_options='permissive')
+    return tabla.to_pandas()
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Almacén columnar de los datos de AENA")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    precalentar = subparsers.add_parser('precalentar', help="Ingiere los libros Excel antes de servir el dashboard")
+    precalentar.add_argument('--dir-datos', default=DIR_DATOS, help="Directorio con los libros Excel")
+    precalentar.add_argument('--patron', default=PATRON_LIBROS, help="Patrón de nombre de los libros")
+    precalentar.add_argument('--dir-cache', default=DIR_CACHE, help="Directorio del almacén columnar")
+    precalentar.add_argument('--forzar', action='store_true', help="Regenera todas las partes aunque los libros no hayan cambiado")
+
+    args = parser.parse_args(argv)
+
+    if args.comando == 'precalentar':
+        try:
+            manifiesto = sincronizar_almacen(args.dir_datos, args.patron, args.dir_cache, forzar=args.forzar)
+        except (OSError, ValueError) as e:
+            print(f"Error al precalentar el almacén: {e}", file=sys.stderr)
+            return 1
+        for ruta, entrada in sorted(manifiesto['libros'].items()):
+            filas = sum(p['filas'] for p in entrada['partes'])
+            print(f"{os.path.basename(ruta)}: {len(entrada['partes'])} hojas, {filas} filas")
+        print(f"Almacén listo (versión {version_almacen(manifiesto)})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,537 @@
+"""
+Backend SQL embebido (DuckDB) para históricos que no caben en memoria.
+
+En lugar de cargar el conjunto completo en un DataFrame, consulta las partes
+Parquet del almacén a través de una vista de DuckDB. Los filtros del sidebar
+se traducen a predicados SQL que DuckDB empuja hasta la lectura de los
+ficheros, y cada estado de filtros se resuelve con una única agrupación por
+celda aeropuerto x empresa x mes. De la base de datos solo vuelven esas
+celdas (unos pocos miles de filas como mucho) y los mismos ``Agregados`` del
+motor en memoria derivan de ellas métricas, evoluciones y rankings, así que
+el dashboard muestra lo mismo con cualquiera de los dos backends. La tabla
+de datos se pagina y ordena en SQL y la exportación se escribe con ``COPY``.
+
+DuckDB es una dependencia opcional: sin ella solo está disponible el backend
+en memoria. El backend se elige con la variable ``AENA_BACKEND``
+(``pandas`` o ``sql``). Para comprobar que el buscador de ambos backends
+devuelve las mismas filas (acentos, signos y espacios incluidos):
+
+    python backend_sql.py comprobar-busqueda
+"""
+import argparse
+import functools
+import gzip
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+from agregaciones import AHORRO_COL, EXPEDIENTE_COL, MEDIDAS, PRESUPUESTO_COL, Agregados
+from almacen_datos import (DIR_CACHE, DIR_DATOS, PATRON_LIBROS, columna_busqueda, columnas_datos, sincronizar_almacen,
+                           version_almacen)
+from busqueda import normalizar_consulta, normalizar_serie
+from cache_consultas import CacheMemoria, clave_filtros
+from distribucion import ANCHO_CLASE, BAJA_MIN, NUMERO_CLASES, distribucion_celdas
+from esquema_datos import COLUMNAS_DERIVADAS
+from exportacion import DIR_EXPORTACIONES, exportacion_disponible, purgar_exportaciones, ruta_exportacion
+from indice_filtros import AEROPUERTO_COL, EMPRESA_COL, FECHA_COL, IMPORTE_COL, limites_fecha_ns
+from informes import Contexto
+from instrumentacion import marcar_fallo, registrar_cache
+from normalizacion_empresas import canonizar
+
+BACKENDS = ['pandas', 'sql']
+BACKEND = os.environ.get('AENA_BACKEND', 'pandas')
+# Límite de memoria de DuckDB (p. ej. '2GB'); por encima usa un directorio temporal de la caché
+MEMORIA_SQL = os.environ.get('AENA_MEMORIA_SQL')
+
+# Campos del buscador (ver busqueda.CAMPOS_BUSQUEDA)
+CAMPOS_BUSQUEDA_SQL = [EXPEDIENTE_COL, AEROPUERTO_COL, EMPRESA_COL, 'Objeto del Contrato']
+# Consultas de la comprobación de paridad del buscador: acentos, mayúsculas, signos y espacios
+CONSULTAS_PARIDAD = ['señal no', 'senal no', 'MÁLAGA', 'Barajas', 'ó', 'ñ', 'ç', 'ﬁ', 'º', '¿no', '¿', '€', 'ß',
+                     'n.º', 's.a.', "l'", '-', '/', '(', ',', '  ', ' de ', 'mantenimiento  de', '2023']
+
+# Columnas derivadas de la exportación, calculadas en SQL igual que esquema_datos.columna_derivada
+DERIVADAS_SQL = {
+    'Mes': f'CAST(month("{FECHA_COL}") AS TINYINT)',
+    'Año': f'CAST(year("{FECHA_COL}") AS SMALLINT)',
+    'Trimestre': f'CAST(quarter("{FECHA_COL}") AS TINYINT)',
+    'Día_Semana': f'dayname("{FECHA_COL}")',
+    'Nombre_Mes': f'monthname("{FECHA_COL}")',
+}
+
+
+def sql_disponible():
+    """Indica si DuckDB está instalado"""
+    return duckdb is not None
+
+
+def _id(columna):
+    """Identificador SQL entre comillas"""
+    return '"' + columna.replace('"', '""') + '"'
+
+
+def _literal(texto):
+    """Literal de texto SQL"""
+    return "'" + texto.replace("'", "''") + "'"
+
+
+def _timestamp_ns(ns):
+    """Parámetro de instante con precisión de nanosegundos"""
+    return np.datetime_as_string(np.datetime64(int(ns), 'ns'))
+
+
+def condiciones_sql(filtros):
+    """Cláusula WHERE y parámetros equivalentes a ``IndiceFiltros.filtrar``"""
+    condiciones, parametros = [], []
+    for columna, valores in ((AEROPUERTO_COL, filtros.aeropuertos), (EMPRESA_COL, filtros.empresas)):
+        if valores:
+            condiciones.append(f"{_id(columna)} IN ({', '.join('?' * len(valores))})")
+            parametros += list(valores)
+    if filtros.rango_fechas:
+        desde, hasta = limites_fecha_ns(filtros.rango_fechas)
+        condiciones.append(f'{_id(FECHA_COL)} >= CAST(? AS TIMESTAMP_NS) AND {_id(FECHA_COL)} < CAST(? AS TIMESTAMP_NS)')
+        parametros += [_timestamp_ns(desde), _timestamp_ns(hasta)]
+    # Los importes nulos (o NaN, que DuckDB ordena por encima de infinito) nunca entran en el rango
+    importe_min, importe_max = filtros.rango_importes
+    condiciones.append(f'{_id(IMPORTE_COL)} >= ? AND {_id(IMPORTE_COL)} <= ? AND NOT isnan({_id(IMPORTE_COL)})')
+    parametros += [float(importe_min), float(importe_max)]
+    return ' AND '.join(condiciones), parametros
+
+
+class _CeldasConsulta:
+    """Celdas de una consulta agrupada con la forma de ``BaseAgregacion`` que usa ``Agregados``"""
+
+    def __init__(self, celdas):
+        codigos, valores = pd.factorize(celdas['aeropuerto'], sort=True)
+        self.celda_aeropuerto, self.aeropuertos = codigos, list(valores)
+        codigos, valores = pd.factorize(celdas['empresa'], sort=True)
+        self.celda_empresa, self.empresas = codigos, list(valores)
+        meses = celdas['mes'].to_numpy(dtype='datetime64[ns]').astype('datetime64[M]')
+        con_fecha = ~np.isnat(meses)
+        self.meses, mes_de_celda = np.unique(meses[con_fecha], return_inverse=True)
+        self.celda_mes = np.full(len(celdas), -1, dtype=np.int64)
+        self.celda_mes[con_fecha] = mes_de_celda
+        # Las celdas sin empresa (nula o vacía) no cuentan en el análisis de empresas
+        self.empresa_valida = np.array([bool(e) for e in self.empresas], dtype=bool)
+
+
+class MotorSQL:
+    """Agregados de cada estado de filtros calculados con una agrupación en DuckDB"""
+
+    def __init__(self, contexto, capacidad=64, instantaneas=None, cache=None):
+        self.contexto = contexto
+        self.instantaneas = instantaneas
+        self.cache = cache if cache is not None else CacheMemoria(capacidad, ttl=float('inf'))
+        self.version = contexto.version
+
+    def agregados(self, filtros, posiciones=None, sesion=None):
+        """Agregados del estado de filtros: de la caché, de una instantánea o de DuckDB
+
+        ``posiciones`` y ``sesion`` se aceptan por compatibilidad con MotorAgregaciones;
+        DuckDB no trabaja con posiciones de fila y siempre agrupa la consulta completa.
+        """
+        clave = ('agregados_sql', self.version, clave_filtros(filtros))
+        resultado = self.cache.obtener(clave)
+        if resultado is not None:
+            return resultado
+
+        if self.instantaneas is not None:
+            resultado = self.instantaneas.cargar(filtros)
+            registrar_cache('instantaneas', acierto=resultado is not None)
+        if resultado is None:
+            marcar_fallo('agregados')
+            celdas = self.contexto.celdas(filtros)
+            medidas = celdas[list(MEDIDAS)].to_numpy(dtype=np.float64)
+            resultado = Agregados(_CeldasConsulta(celdas), medidas)
+
+        self.cache.guardar(clave, resultado)
+        return resultado
+
+    def distribucion(self, filtros, posiciones=None):
+        """Distribución del %baja del estado de filtros, con los histogramas agrupados en DuckDB"""
+        clave = ('distribucion_sql', self.version, clave_filtros(filtros))
+        resultado = self.cache.obtener(clave)
+        if resultado is None:
+            marcar_fallo('distribucion')
+            celdas = self.contexto.histogramas_baja(filtros)
+            resultado = distribucion_celdas(
+                _CeldasConsulta(celdas), np.arange(len(celdas)), celdas['clase'].to_numpy(dtype=np.int64),
+                celdas['recuento'].to_numpy(dtype=np.float64), celdas['minimo'].to_numpy(dtype=np.float64),
+                celdas['maximo'].to_numpy(dtype=np.float64),
+                valores_celdas=lambda mascara: self.contexto.valores_baja(filtros, celdas, mascara))
+            self.cache.guardar(clave, resultado)
+        return resultado
+
+    def serie_temporal(self, filtros, granularidad='M', posiciones=None, sesion=None):
+        """Serie temporal del estado de filtros por día, semana o mes, memorizada en la caché de consultas"""
+        if granularidad == 'M':
+            return self.agregados(filtros).mensual
+        clave = ('serie_sql', self.version, clave_filtros(filtros), granularidad)
+        serie = self.cache.obtener(clave)
+        if serie is None:
+            serie = self.contexto.serie_por_periodo(filtros, granularidad)
+            self.cache.guardar(clave, serie)
+        return serie
+
+
+class ContextoSQL(Contexto):
+    """Misma interfaz que ``Contexto`` sin cargar el conjunto: las consultas se resuelven en DuckDB
+
+    ``df``, ``indice`` e ``indice_busqueda`` son None; la tabla de datos usa
+    ``contar`` y ``pagina`` y la descarga ``exportar``. ``filas`` devuelve las
+    posiciones calculadas en SQL sobre el orden del conjunto en memoria.
+    """
+
+    def __init__(self, manifiesto, dir_cache=DIR_CACHE, instantaneas=None, cache=None):
+        if duckdb is None:
+            raise ImportError("El backend SQL necesita DuckDB (pip install duckdb)")
+        self.version = version_almacen(manifiesto)
+        self.df = None
+        self.indice = None
+        self.indice_busqueda = None
+        self.cache = cache
+        self._conexion = duckdb.connect()
+        dir_temporal = os.path.join(dir_cache, 'duckdb_tmp')
+        os.makedirs(dir_temporal, exist_ok=True)
+        self._conexion.execute(f"SET temp_directory = {_literal(dir_temporal)}")
+        if MEMORIA_SQL:
+            self._conexion.execute(f"SET memory_limit = {_literal(MEMORIA_SQL)}")
+        self.columnas = self._crear_vista(manifiesto, dir_cache)
+        self.opciones = OpcionesSQL(self)
+        self.motor = MotorSQL(self, instantaneas=instantaneas, cache=cache)
+
+    def _crear_vista(self, manifiesto, dir_cache=DIR_CACHE):
+        """Crea la vista ``licitaciones`` sobre las partes y devuelve sus columnas en orden"""
+        partes = [parte for ruta in sorted(manifiesto['libros']) for parte in manifiesto['libros'][ruta]['partes']]
+        if not partes:
+            raise ValueError("El almacén no contiene hojas con licitaciones")
+        # Mismo orden de columnas y de filas que la concatenación de leer_almacen
+        columnas = []
+        for parte in partes:
+            columnas += [c for c in columnas_datos(pq.read_schema(parte['parquet'])) if c not in columnas]
+        # _posicion: posición de la fila en el conjunto en memoria (filas de las partes anteriores + fila en la parte)
+        inicios = np.cumsum([0] + [parte['filas'] for parte in partes[:-1]])
+        union = ' UNION ALL BY NAME '.join(
+            f"SELECT *, {i} AS _parte, file_row_number AS _fila, {inicio} + file_row_number AS _posicion "
+            f"FROM read_parquet({_literal(parte['parquet'])}, file_row_number = true)"
+            for i, (parte, inicio) in enumerate(zip(partes, inicios))
+        )
+        self._conexion.execute(f"CREATE VIEW partes_almacen AS {union}")
+        self._conexion.execute(f"CREATE VIEW partes AS {self._empresas_canonicas(columnas, dir_cache)}")
+
+        # Porcentaje de ahorro como en preparar_dataset (en float32, igual que el conjunto en memoria)
+        if '%baja' in columnas:
+            maximo = self._conexion.execute('SELECT max("%baja") FROM partes').fetchone()[0]
+            escala = 100 if maximo is not None and maximo <= 1 else 1
+            ahorro = f'"%baja" * {escala}'
+            baja = 'CAST("%baja" AS FLOAT) AS "%baja"'
+        else:
+            ahorro = f'({_id(PRESUPUESTO_COL)} - {_id(IMPORTE_COL)}) / {_id(PRESUPUESTO_COL)} * 100'
+            baja = None
+        seleccion = [baja if c == '%baja' else _id(c) for c in columnas]
+        # Los campos del buscador ya normalizados: en las partes y, el adjudicatario, en empresas_canonicas
+        seleccion += [_id(columna_busqueda(c)) for c in CAMPOS_BUSQUEDA_SQL if c in columnas]
+        self._conexion.execute(
+            f"CREATE VIEW licitaciones AS SELECT {', '.join(seleccion)}, "
+            f"CAST({ahorro} AS FLOAT) AS {_id(AHORRO_COL)}, _parte, _fila, _posicion FROM partes"
+        )
+        return columnas + [AHORRO_COL]
+
+    def _empresas_canonicas(self, columnas, dir_cache):
+        """Consulta de las partes con los adjudicatarios sustituidos por su nombre canónico, como el conjunto en memoria
+
+        Añade el nombre canónico normalizado para el buscador, calculado una
+        vez por adjudicatario distinto.
+        """
+        if EMPRESA_COL not in columnas:
+            return "SELECT * FROM partes_almacen"
+        empresa = _id(EMPRESA_COL)
+        recuentos = dict(self._conexion.execute(
+            f"SELECT {empresa}, count(*) FROM partes_almacen WHERE {empresa} IS NOT NULL GROUP BY 1"
+        ).fetchall())
+        empresas = pd.DataFrame(list(canonizar(recuentos, dir_cache).items()), columns=['original', 'canonico'],
+                                dtype=object)
+        empresas['normalizado'] = normalizar_serie(empresas['canonico'])
+        self._conexion.register('empresas_normalizadas', empresas)
+        self._conexion.execute("CREATE TABLE empresas_canonicas AS SELECT * FROM empresas_normalizadas")
+        self._conexion.unregister('empresas_normalizadas')
+        return (f"SELECT p.* REPLACE (coalesce(e.canonico, p.{empresa}) AS {empresa}), "
+                f"e.normalizado AS {_id(columna_busqueda(EMPRESA_COL))} "
+                f"FROM partes_almacen p LEFT JOIN empresas_canonicas e ON p.{empresa} = e.original")
+
+    def consultar(self, sql, parametros=()):
+        """Ejecuta una consulta en un cursor propio (seguro entre hilos) y la devuelve como DataFrame"""
+        with self._conexion.cursor() as cursor:
+            return cursor.execute(sql, list(parametros)).df()
+
+    def celdas(self, filtros):
+        """Medidas por celda aeropuerto x empresa x mes del estado de filtros (columnas MEDIDAS)"""
+        condicion, parametros = condiciones_sql(filtros)
+        return self.consultar(f"""
+            SELECT {_id(AEROPUERTO_COL)} AS aeropuerto, {_id(EMPRESA_COL)} AS empresa,
+                   date_trunc('month', {_id(FECHA_COL)}) AS mes,
+                   count(*) AS filas,
+                   count({_id(EXPEDIENTE_COL)}) AS expedientes,
+                   coalesce(sum({_id(PRESUPUESTO_COL)}), 0) AS presupuesto,
+                   coalesce(sum({_id(IMPORTE_COL)}), 0) AS adjudicado,
+                   coalesce(sum(CAST({_id(AHORRO_COL)} AS DOUBLE)), 0) AS ahorro_suma,
+                   count({_id(AHORRO_COL)}) AS ahorro_n
+            FROM licitaciones WHERE {condicion}
+            GROUP BY ALL
+        """, parametros)
+
+    def histogramas_baja(self, filtros):
+        """Histograma del %baja por celda aeropuerto x empresa x mes y clase (ver distribucion.py)"""
+        condicion, parametros = condiciones_sql(filtros)
+        valor = f'CAST({_id(AHORRO_COL)} AS DOUBLE)'
+        clase = f'least(greatest(floor(({valor} - ({BAJA_MIN!r})) / {ANCHO_CLASE!r}) + 1, 0), {NUMERO_CLASES - 1})'
+        return self.consultar(f"""
+            SELECT {_id(AEROPUERTO_COL)} AS aeropuerto, {_id(EMPRESA_COL)} AS empresa,
+                   date_trunc('month', {_id(FECHA_COL)}) AS mes,
+                   CAST({clase} AS BIGINT) AS clase,
+                   count(*) AS recuento, min({valor}) AS minimo, max({valor}) AS maximo
+            FROM licitaciones WHERE {condicion} AND NOT isnan({_id(AHORRO_COL)})
+            GROUP BY ALL
+        """, parametros)
+
+    def valores_baja(self, filtros, celdas, mascara):
+        """Celda y %baja de las filas del estado de filtros en las celdas de la máscara
+
+        ``celdas`` es el resultado de ``histogramas_baja`` (una celda por fila);
+        cada valor se asocia a la primera fila de su aeropuerto x empresa x mes.
+        """
+        elegidas = celdas.loc[mascara, ['aeropuerto', 'empresa', 'mes']].drop_duplicates()
+        if elegidas.empty:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        elegidas['celda'] = elegidas.index.to_numpy(dtype=np.int64)
+        condicion, parametros = condiciones_sql(filtros)
+        with self._conexion.cursor() as cursor:
+            cursor.register('celdas_exactas', elegidas)
+            valores = cursor.execute(f"""
+                SELECT c.celda, l.valor FROM (
+                    SELECT {_id(AEROPUERTO_COL)} AS aeropuerto, {_id(EMPRESA_COL)} AS empresa,
+                           date_trunc('month', {_id(FECHA_COL)}) AS mes, CAST({_id(AHORRO_COL)} AS DOUBLE) AS valor
+                    FROM licitaciones WHERE {condicion} AND NOT isnan({_id(AHORRO_COL)})
+                ) l JOIN celdas_exactas c
+                  ON l.aeropuerto IS NOT DISTINCT FROM c.aeropuerto AND l.empresa IS NOT DISTINCT FROM c.empresa
+                 AND l.mes IS NOT DISTINCT FROM c.mes
+            """, parametros).df()
+        return valores['celda'].to_numpy(dtype=np.int64), valores['valor'].to_numpy(dtype=np.float64)
+
+    def serie_por_periodo(self, filtros, granularidad):
+        """Serie por día ('D') o semana ('W', desde el lunes) del estado de filtros"""
+        unidades = {'D': 'day', 'W': 'week', 'M': 'month'}
+        if granularidad not in unidades:
+            raise ValueError(f"Granularidad desconocida: {granularidad}")
+        condicion, parametros = condiciones_sql(filtros)
+        serie = self.consultar(f"""
+            SELECT date_trunc('{unidades[granularidad]}', {_id(FECHA_COL)}) AS "Fecha",
+                   count({_id(EXPEDIENTE_COL)}) AS {_id(EXPEDIENTE_COL)},
+                   coalesce(sum({_id(PRESUPUESTO_COL)}), 0) AS {_id(PRESUPUESTO_COL)},
+                   coalesce(sum({_id(IMPORTE_COL)}), 0) AS {_id(IMPORTE_COL)}
+            FROM licitaciones WHERE {condicion} AND {_id(FECHA_COL)} IS NOT NULL
+            GROUP BY 1 ORDER BY 1
+        """, parametros)
+        serie['Fecha'] = serie['Fecha'].astype('datetime64[ns]')
+        serie[EXPEDIENTE_COL] = serie[EXPEDIENTE_COL].astype(np.int64)
+        return serie
+
+    def _condicion_busqueda(self, filtros, busqueda):
+        """Condición de los filtros y, si se indica, de la búsqueda literal sin mayúsculas ni acentos
+
+        Los textos se normalizaron al guardar las partes y la consulta se
+        normaliza aquí, ambos como en busqueda.py, así que los dos backends
+        encuentran las mismas filas.
+        """
+        condicion, parametros = condiciones_sql(filtros)
+        if busqueda:
+            campos = [c for c in CAMPOS_BUSQUEDA_SQL if c in self.columnas]
+            condicion += ' AND (' + ' OR '.join(f"contains({_id(columna_busqueda(c))}, ?)" for c in campos) + ')'
+            parametros += [normalizar_consulta(busqueda)] * len(campos)
+        return condicion, parametros
+
+    def filas(self, filtros, busqueda='', por_relevancia=False, sesion=None):
+        """Posiciones de las filas seleccionadas, las mismas que daría el conjunto en memoria
+
+        SQL no puntúa las coincidencias: con ``por_relevancia`` las filas siguen
+        en orden de posición. ``sesion`` se acepta por compatibilidad y no se usa.
+        """
+        clave = ('filas_sql', self.version, clave_filtros(filtros, busqueda))
+        posiciones = None
+        if self.cache is not None:
+            posiciones = self.cache.obtener(clave)
+            registrar_cache('filas', acierto=posiciones is not None)
+        if posiciones is None:
+            condicion, parametros = self._condicion_busqueda(filtros, busqueda)
+            posiciones = self.consultar(
+                f"SELECT _posicion FROM licitaciones WHERE {condicion} ORDER BY _posicion", parametros
+            )['_posicion'].to_numpy(dtype=np.int64)
+            if self.cache is not None:
+                posiciones.setflags(write=False)
+                self.cache.guardar(clave, posiciones)
+        return posiciones
+
+    def contar(self, filtros, busqueda=''):
+        """Número de filas del estado de filtros y de la búsqueda"""
+        clave = ('contar_sql', self.version, clave_filtros(filtros, busqueda))
+        if self.cache is not None:
+            n = self.cache.obtener(clave)
+            registrar_cache('filas', acierto=n is not None)
+            if n is not None:
+                return n
+        condicion, parametros = self._condicion_busqueda(filtros, busqueda)
+        n = int(self.consultar(f"SELECT count(*) AS n FROM licitaciones WHERE {condicion}", parametros)['n'].iloc[0])
+        if self.cache is not None:
+            self.cache.guardar(clave, n)
+        return n
+
+    def pagina(self, filtros, busqueda='', columna_orden=None, ascendente=True, pagina=1, tamano_pagina=50):
+        """Filas de una página, ordenadas en SQL (nulos al final, empates en el orden original)"""
+        condicion, parametros = self._condicion_busqueda(filtros, busqueda)
+        orden = '_parte, _fila'
+        if columna_orden:
+            orden = f"{_id(columna_orden)} {'ASC' if ascendente else 'DESC'} NULLS LAST, {orden}"
+        columnas = ', '.join(_id(c) for c in self.columnas)
+        df = self.consultar(
+            f"SELECT {columnas} FROM licitaciones WHERE {condicion} ORDER BY {orden} LIMIT ? OFFSET ?",
+            parametros + [tamano_pagina, (pagina - 1) * tamano_pagina],
+        )
+        df[FECHA_COL] = pd.to_datetime(df[FECHA_COL])
+        return df
+
+    def exportar(self, filtros, formato, clave, dir_exportaciones=DIR_EXPORTACIONES):
+        """Genera (o reutiliza) la exportación de las filas filtradas con COPY y devuelve su ruta"""
+        ruta = exportacion_disponible(clave, formato, dir_exportaciones)
+        if ruta is not None:
+            os.utime(ruta)
+            return ruta
+
+        os.makedirs(dir_exportaciones, exist_ok=True)
+        ruta = ruta_exportacion(clave, formato, dir_exportaciones)
+        condicion, parametros = condiciones_sql(filtros)
+        derivadas = [f'{sql} AS {_id(nombre)}' for nombre, sql in DERIVADAS_SQL.items() if nombre in COLUMNAS_DERIVADAS]
+        consulta = (f"SELECT {', '.join(_id(c) for c in self.columnas)}, {', '.join(derivadas)} "
+                    f"FROM licitaciones WHERE {condicion} ORDER BY _parte, _fila")
+        tmp, tmp_copia = ruta + '.tmp', ruta + '.copia.tmp'
+        try:
+            if formato == 'Parquet':
+                self._copiar(consulta, parametros, tmp, "FORMAT parquet")
+            elif formato in ('CSV', 'CSV comprimido (gzip)'):
+                comprimido = formato != 'CSV'
+                self._copiar(consulta, parametros, tmp_copia,
+                             "FORMAT csv, HEADER" + (", COMPRESSION gzip" if comprimido else ""))
+                # BOM de UTF-8 delante para que Excel respete los acentos (gzip admite miembros concatenados)
+                with open(tmp, 'wb') as f:
+                    f.write(gzip.compress('\ufeff'.encode('utf-8')) if comprimido else '\ufeff'.encode('utf-8'))
+                    with open(tmp_copia, 'rb') as copia:
+                        shutil.copyfileobj(copia, f)
+            else:
+                raise ValueError(f"Formato de exportación desconocido: {formato}")
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        finally:
+            if os.path.exists(tmp_copia):
+                os.remove(tmp_copia)
+        os.replace(tmp, ruta)
+        purgar_exportaciones(dir_exportaciones)
+        return ruta
+
+    def _copiar(self, consulta, parametros, ruta, opciones):
+        """Escribe el resultado de una consulta en un fichero con COPY"""
+        with self._conexion.cursor() as cursor:
+            cursor.execute(f"COPY ({consulta}) TO {_literal(ruta)} ({opciones})", list(parametros))
+
+
+class OpcionesSQL:
+    """Opciones de los filtros del sidebar (ver ``OpcionesFiltros``) calculadas en DuckDB"""
+
+    def __init__(self, contexto):
+        aeropuerto, empresa = _id(AEROPUERTO_COL), _id(EMPRESA_COL)
+        pares = contexto.consultar(f"""
+            SELECT DISTINCT {aeropuerto} AS aeropuerto, {empresa} AS empresa FROM licitaciones
+        """)
+        # Solo cuentan las empresas adjudicatarias informadas
+        self.aeropuertos = sorted(pares['aeropuerto'].dropna().unique())
+        self.empresas = sorted(pares.loc[pares['empresa'].notna() & (pares['empresa'] != ''), 'empresa'].unique())
+        self._pares = pares[pares['aeropuerto'].notna() & pares['empresa'].notna() & (pares['empresa'] != '')]
+
+        # Opciones dependientes de la selección, memorizadas por selección (tuplas: no se pueden modificar)
+        self.empresas_disponibles = functools.lru_cache(maxsize=256)(self._empresas_disponibles)
+        self.aeropuertos_disponibles = functools.lru_cache(maxsize=256)(self._aeropuertos_disponibles)
+
+        limites = contexto.consultar(f"""
+            SELECT min({_id(FECHA_COL)}) AS fecha_min, max({_id(FECHA_COL)}) AS fecha_max,
+                   min({_id(IMPORTE_COL)}) FILTER (WHERE NOT isnan({_id(IMPORTE_COL)})) AS importe_min,
+                   max({_id(IMPORTE_COL)}) FILTER (WHERE NOT isnan({_id(IMPORTE_COL)})) AS importe_max
+            FROM licitaciones
+        """).iloc[0]
+        self.fecha_min = pd.Timestamp(limites['fecha_min'])
+        self.fecha_max = pd.Timestamp(limites['fecha_max'])
+        self.importe_min = float(limites['importe_min'])
+        self.importe_max = float(limites['importe_max'])
+
+    def _empresas_disponibles(self, aeropuertos):
+        """Tupla de empresas con alguna licitación en los aeropuertos (tupla de la selección; vacía: todas)"""
+        if not aeropuertos:
+            return tuple(self.empresas)
+        return tuple(sorted(self._pares.loc[self._pares['aeropuerto'].isin(aeropuertos), 'empresa'].unique()))
+
+    def _aeropuertos_disponibles(self, empresas):
+        """Tupla de aeropuertos en los que opera alguna de las empresas (tupla de la selección; vacía: todos)"""
+        if not empresas:
+            return tuple(self.aeropuertos)
+        return tuple(sorted(self._pares.loc[self._pares['empresa'].isin(empresas), 'aeropuerto'].unique()))
+
+
+def comprobar_busqueda(contexto, contexto_sql, filtros, consultas=CONSULTAS_PARIDAD):
+    """Consultas cuyas filas difieren entre el backend en memoria y el SQL, con el número de filas de cada uno"""
+    diferencias = []
+    for consulta in consultas:
+        filas, filas_sql = contexto.filas(filtros, consulta), contexto_sql.filas(filtros, consulta)
+        if not np.array_equal(filas, filas_sql):
+            diferencias.append((consulta, len(filas), len(filas_sql)))
+    return diferencias
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Backend SQL (DuckDB) del dashboard de AENA")
+    parser.add_argument('--dir-datos', default=DIR_DATOS, help="Directorio con los libros Excel")
+    parser.add_argument('--patron', default=PATRON_LIBROS, help="Patrón de nombre de los libros")
+    parser.add_argument('--dir-cache', default=DIR_CACHE, help="Directorio del almacén columnar")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    comprobar = subparsers.add_parser('comprobar-busqueda', help="Compara el buscador de los dos backends")
+    comprobar.add_argument('--consulta', action='append', default=[], help="Consulta adicional; se puede repetir")
+
+    args = parser.parse_args(argv)
+
+    if args.comando == 'comprobar-busqueda':
+        try:
+            manifiesto = sincronizar_almacen(args.dir_datos, args.patron, args.dir_cache)
+            contexto = Contexto(manifiesto, args.dir_cache, con_busqueda=True)
+            contexto_sql = ContextoSQL(manifiesto, args.dir_cache)
+        except (ImportError, OSError, ValueError) as e:
+            print(f"Error al preparar los backends: {e}", file=sys.stderr)
+            return 1
+        consultas = CONSULTAS_PARIDAD + args.consulta
+        diferencias = comprobar_busqueda(contexto, contexto_sql, contexto.filtros(), consultas)
+        for consulta, filas, filas_sql in diferencias:
+            print(f"{consulta!r}: {filas} filas en memoria, {filas_sql} en SQL")
+        print(f"{len(consultas) - len(diferencias)} de {len(consultas)} consultas con las mismas filas")
+        return 1 if diferencias else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""
+Banco de pruebas de rendimiento de las rutas de datos del dashboard.
+
+Genera licitaciones sintéticas con las mismas columnas que los libros de
+AENA (10k, 100k, 1M o 10M filas) y mide sin navegador cada etapa: carga
+y preparación del conjunto, normalización de los adjudicatarios,
+construcción de índices, filtrado, agregados
+de métricas y gráficos, distribución del %baja, búsqueda y ordenación de
+la tabla. Informa de percentiles de latencia, rendimiento y pico de
+memoria por etapa.
+
+Con ``--guardar`` los resultados se escriben en JSON; con ``--comparar`` se
+contrastan con unos resultados de referencia y el proceso termina con
+código 1 si alguna etapa empeora más de la tolerancia (p. ej. en CI antes
+de desplegar).
+
+    python benchmark.py --tamanos 10000 100000 --guardar referencia.json
+    python benchmark.py --tamanos 10000 100000 --comparar referencia.json --tolerancia 0.25
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from agregaciones import MotorAgregaciones
+from busqueda import IndiceBusqueda
+from conjunto_datos import abrir_conjunto, escribir_conjunto
+from esquema_datos import preparar_dataset
+from indice_filtros import (AEROPUERTO_COL, EMPRESA_COL, FECHA_COL, IMPORTE_COL, Filtros, IndiceFiltros, OpcionesFiltros,
+                            normalizar_seleccion)
+from normalizacion_empresas import canonizar
+from tabla_paginada import formatear_pagina, ordenar_posiciones, posiciones_pagina
+
+TAMANOS = [10_000, 100_000, 1_000_000, 10_000_000]
+TAMANOS_POR_DEFECTO = [10_000, 100_000, 1_000_000]
+CONSULTAS = 50
+
+PALABRAS_OBJETO = (
+    'mantenimiento reparacion suministro instalacion sustitucion servicio obras limpieza '
+    'pintado señalizacion bolardo aparcamiento terminal pista plataforma edificio sistema '
+    'climatizacion iluminacion balizamiento seguridad pasarelas cintas equipajes ascensores '
+    'escaleras mecanicas puertas acceso control vigilancia jardineria redes electricas '
+    'saneamiento cubiertas fachadas mobiliario señaletica combustible hangar torre radar'
+).split()
+
+
+def generar_datos(n_filas, semilla=0):
+    """DataFrame sintético con las columnas y distribuciones de los libros de AENA"""
+    rng = np.random.default_rng(semilla)
+
+    n_aeropuertos = 55
+    letras = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    aeropuertos = np.unique([''.join(rng.choice(letras, 3)) for _ in range(n_aeropuertos * 2)])[:n_aeropuertos]
+    # El número de empresas crece más despacio que el de filas
+    n_empresas = max(50, int(650 * (n_filas / 2_500) ** 0.5))
+    empresas = np.array([f"EMPRESA {i:06d} SL" for i in range(n_empresas)], dtype=object)
+    n_objetos = min(n_filas, 50_000)
+    objetos = np.array([' '.join(rng.choice(PALABRAS_OBJETO, rng.integers(3, 9))).capitalize()
+                        for _ in range(n_objetos)], dtype=object)
+
+    codigo_aeropuerto = rng.integers(0, n_aeropuertos, n_filas)
+    aeropuerto = pd.Series(aeropuertos[codigo_aeropuerto], dtype=object)
+    inicio = np.datetime64('2017-01-01')
+    dias = (np.datetime64('2025-07-15') - inicio).astype(np.int64)
+    fechas = (inicio + rng.integers(0, dias, n_filas).astype('timedelta64[D]')).astype('datetime64[ns]')
+    anios = pd.Series(fechas.astype('datetime64[Y]').astype(np.int64) + 1970)
+    secuencia = pd.Series(np.arange(n_filas)).astype(str)
+
+    presupuesto = np.round(rng.lognormal(np.log(270_000), 1.5, n_filas), 2)
+    baja = rng.beta(0.9, 5, n_filas)
+    empresa = pd.Series(empresas[rng.zipf(1.3, n_filas) % n_empresas], dtype=object)
+    sin_adjudicar = rng.random(n_filas) < 0.006
+    empresa[sin_adjudicar] = None
+    importe = np.round(presupuesto * (1 - baja), 2)
+    importe[sin_adjudicar] = np.nan
+
+    organos = np.array([f"Aena. Dirección del Aeropuerto {a}" for a in aeropuertos], dtype=object)
+    organo = organos[codigo_aeropuerto]
+    organo[rng.random(n_filas) < 0.12] = 'Aena. Dirección de Contratación'
+
+    return pd.DataFrame({
+        'Link licitación': 'https://contrataciondelestado.es/wps/poc?uri=deeplink:detalle_licitacion&idEvl=' + secuencia,
+        'Estado': np.where(rng.random(n_filas) < 0.98, 'Resuelta', 'Adjudicada').astype(object),
+        AEROPUERTO_COL: aeropuerto,
+        'Número de expediente': aeropuerto + '-' + secuencia + '/' + anios.astype(str),
+        'Objeto del Contrato': objetos[rng.integers(0, n_objetos, n_filas)],
+        'Presupuesto base sin impuestos': presupuesto,
+        'Órgano de Contratación': organo,
+        FECHA_COL: fechas,
+        EMPRESA_COL: empresa,
+        IMPORTE_COL: importe,
+        '%baja': baja,
+    })
+
+
+def filtros_aleatorios(opciones, n, semilla=0):
+    """Estados de filtros variados, como los que produciría el sidebar"""
+    rng = np.random.default_rng(semilla)
+    fecha_min, fecha_max = opciones.fecha_min.date(), opciones.fecha_max.date()
+    dias = (fecha_max - fecha_min).days
+    lista = []
+    for _ in range(n):
+        # Sin restricción, uno o varios valores (selección múltiple)
+        aeropuertos = rng.choice(opciones.aeropuertos, rng.integers(1, 4)) if rng.random() < 0.4 else ()
+        empresas = rng.choice(opciones.empresas, rng.integers(1, 4)) if rng.random() < 0.3 else ()
+        if rng.random() < 0.5:
+            a, b = sorted(rng.integers(0, dias + 1, 2).tolist())
+            rango_fechas = (fecha_min + timedelta(days=a), fecha_min + timedelta(days=b))
+        else:
+            rango_fechas = (fecha_min, fecha_max)
+        if rng.random() < 0.2:
+            rango_importes = (float(rng.uniform(0, 200_000)), opciones.importe_max)
+        else:
+            rango_importes = (opciones.importe_min, opciones.importe_max)
+        lista.append(Filtros(normalizar_seleccion(str(a) for a in aeropuertos),
+                             normalizar_seleccion(str(e) for e in empresas), rango_fechas, rango_importes))
+    return lista
+
+
+def cronometrar(funcion, argumentos):
+    """Tiempos (segundos) de llamar a la función con cada argumento"""
+    tiempos = []
+    for argumento in argumentos:
+        inicio = time.perf_counter()
+        funcion(argumento)
+        tiempos.append(time.perf_counter() - inicio)
+    return np.array(tiempos)
+
+
+def pico_memoria(funcion, argumento):
+    """Pico de memoria (MB) reservada desde Python y NumPy durante una llamada"""
+    tracemalloc.start()
+    try:
+        funcion(argumento)
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def resumen(tiempos, unidades, pico_mb):
+    """Percentiles de latencia (ms), rendimiento (unidades por segundo) y pico de memoria"""
+    ms = tiempos * 1e3
+    return {
+        'repeticiones': len(tiempos),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+        'rendimiento': float(unidades / np.median(tiempos)) if np.median(tiempos) > 0 else float('inf'),
+        'pico_mb': pico_mb,
+    }
+
+
+def medir_tamano(n_filas, consultas=CONSULTAS, semilla=0):
+    """Mide todas las etapas sobre un conjunto sintético de n_filas filas"""
+    crudo = generar_datos(n_filas, semilla)
+    resultados = {}
+
+    def etapa(nombre, funcion, argumentos, unidad):
+        pico = pico_memoria(funcion, argumentos[0])
+        unidades = n_filas if unidad == 'filas/s' else 1
+        resultados[nombre] = dict(resumen(cronometrar(funcion, argumentos), unidades, pico), unidad=unidad)
+
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        ruta = os.path.join(dir_tmp, 'conjunto.arrow')
+
+        def cargar(_):
+            escribir_conjunto(preparar_dataset(crudo.copy()), ruta)
+            return abrir_conjunto(ruta)
+
+        etapa('cargar_datos', cargar, [None], 'filas/s')
+        df = abrir_conjunto(ruta)
+
+        # Sin correspondencia previa: se resuelven todos los nombres distintos
+        recuentos = crudo[EMPRESA_COL].value_counts().to_dict()
+        etapa('normalizar_empresas', lambda _: canonizar(recuentos, tempfile.mkdtemp(dir=dir_tmp)), [None], 'filas/s')
+
+        etapa('indice_filtros', IndiceFiltros, [df], 'filas/s')
+        indice = IndiceFiltros(df)
+        opciones = OpcionesFiltros(df, indice)
+        etapa('motor_agregaciones', lambda d: MotorAgregaciones(d, indice), [df], 'filas/s')
+        # Sin memoria LRU: cada consulta se calcula de verdad
+        motor = MotorAgregaciones(df, indice, capacidad=0)
+        etapa('indice_busqueda', IndiceBusqueda, [df], 'filas/s')
+        buscador = IndiceBusqueda(df)
+
+        lista_filtros = filtros_aleatorios(opciones, consultas, semilla)
+        etapa('aplicar_filtros', lambda f: indice.filtrar(*f), lista_filtros, 'consultas/s')
+        etapa('agregados', motor.agregados, lista_filtros, 'consultas/s')
+        etapa('distribucion', motor.distribucion, lista_filtros, 'consultas/s')
+
+        rng = np.random.default_rng(semilla)
+        terminos = [str(t) for t in rng.choice(PALABRAS_OBJETO, consultas)]
+        etapa('buscar', buscador.buscar, terminos, 'consultas/s')
+
+        posiciones = [indice.filtrar(*f) for f in lista_filtros]
+
+        def pagina_ordenada(pos):
+            ordenadas = ordenar_posiciones(df, pos, IMPORTE_COL, ascendente=False)
+            return formatear_pagina(df.iloc[posiciones_pagina(ordenadas, 1, 50)])
+
+        etapa('tabla_ordenada', pagina_ordenada, posiciones, 'consultas/s')
+    return resultados
+
+
+def imprimir(resultados):
+    """Tabla legible con los resultados de todos los tamaños"""
+    filas = [{'Filas': f"{int(n):,}", 'Etapa': etapa, **valores}
+             for n, etapas in resultados.items() for etapa, valores in etapas.items()]
+    tabla = pd.DataFrame(filas)[['Filas', 'Etapa', 'repeticiones', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms',
+                                 'rendimiento', 'unidad', 'pico_mb']]
+    print(tabla.to_string(index=False, float_format=lambda x: f"{x:,.2f}"))
+
+
+def comparar(resultados, referencia, tolerancia, margen_ms):
+    """Etapas cuyo p50 supera al de referencia más la tolerancia relativa y el margen absoluto"""
+    regresiones = []
+    for n, etapas in resultados.items():
+        for etapa, valores in etapas.items():
+            previo = referencia.get(n, {}).get(etapa)
+            if previo is None:
+                continue
+            limite = previo['p50_ms'] * (1 + tolerancia) + margen_ms
+            if valores['p50_ms'] > limite:
+                regresiones.append((n, etapa, previo['p50_ms'], valores['p50_ms']))
+    return regresiones
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Banco de pruebas de rendimiento con datos sintéticos")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=TAMANOS_POR_DEFECTO,
+                        help=f"Filas de cada conjunto sintético (p. ej. {' '.join(map(str, TAMANOS))})")
+    parser.add_argument('--consultas', type=int, default=CONSULTAS, help="Consultas por etapa de consulta")
+    parser.add_argument('--semilla', type=int, default=0, help="Semilla de los datos y las consultas")
+    parser.add_argument('--guardar', help="Fichero JSON donde guardar los resultados")
+    parser.add_argument('--comparar', help="Fichero JSON de referencia para detectar regresiones")
+    parser.add_argument('--tolerancia', type=float, default=0.25, help="Empeoramiento relativo tolerado del p50")
+    parser.add_argument('--margen-ms', type=float, default=0.5, help="Margen absoluto (ms) frente al ruido en etapas rápidas")
+    args = parser.parse_args(argv)
+
+    resultados = {}
+    for n in args.tamanos:
+        print(f"Midiendo {n:,} filas...", file=sys.stderr)
+        resultados[str(n)] = medir_tamano(n, args.consultas, args.semilla)
+    imprimir(resultados)
+
+    if args.guardar:
+        with open(args.guardar, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            referencia = json.load(f)
+        regresiones = comparar(resultados, referencia, args.tolerancia, args.margen_ms)
+        for n, etapa, previo, actual in regresiones:
+            print(f"REGRESIÓN {etapa} ({int(n):,} filas): p50 {previo:.2f} ms -> {actual:.2f} ms", file=sys.stderr)
+        if regresiones:
+            return 1
+        print("Sin regresiones respecto a la referencia", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
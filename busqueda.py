@@ -0,0 +1,165 @@
+"""
+Índice invertido para el buscador de contratos.
+
+Se construye una vez por versión de los datos sobre el número de expediente,
+el objeto del contrato, el aeropuerto y la empresa adjudicataria. Los textos
+se normalizan (minúsculas y sin acentos) y se trocean en palabras; cada
+palabra apunta a las filas que la contienen y un índice de trigramas sobre
+el vocabulario permite encontrar las palabras que contienen un término en
+cualquier posición. Las búsquedas devuelven posiciones de fila.
+"""
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Campos en los que se busca y su peso al ordenar por relevancia
+CAMPOS_BUSQUEDA = {
+    'Número de expediente': 3.0,
+    'Aeropuerto': 2.0,
+    'Adjudicatario licitación/lote': 2.0,
+    'Objeto del Contrato': 1.0,
+}
+
+PATRON_PALABRA = re.compile(r'\w+')
+
+
+def normalizar_serie(serie):
+    """Pasa una serie de textos a minúsculas y sin acentos (los nulos quedan vacíos)"""
+    return (serie.astype(object).fillna('').astype(str)
+            .str.normalize('NFKD')
+            .str.encode('ascii', 'ignore')
+            .str.decode('ascii')
+            .str.lower())
+
+
+def normalizar_texto(texto):
+    """Normaliza un texto suelto igual que normalizar_serie"""
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii').lower()
+
+
+def normalizar_consulta(consulta):
+    """Normaliza un término de búsqueda como los textos
+
+    Si la normalización lo deja vacío (solo caracteres sin equivalente ASCII,
+    como '¿' o '€') se busca el término original en minúsculas: una consulta
+    no vacía nunca coincide con todas las filas.
+    """
+    return normalizar_texto(consulta) or consulta.lower()
+
+
+class IndiceBusqueda:
+    """Índice invertido palabra -> filas, con trigramas sobre el vocabulario"""
+
+    def __init__(self, df, campos=CAMPOS_BUSQUEDA):
+        self.n_filas = len(df)
+        # Textos normalizados para comprobar las coincidencias literales de las candidatas
+        self._textos = {campo: normalizar_serie(df[campo]).to_numpy(dtype=object) for campo in campos}
+
+        # Pares (palabra, fila) con el peso acumulado de los campos donde aparece
+        partes = []
+        filas = np.arange(len(df))
+        for campo, peso in campos.items():
+            palabras = pd.Series(self._textos[campo], index=filas).str.findall(PATRON_PALABRA.pattern).explode().dropna()
+            partes.append(pd.DataFrame({'palabra': palabras.to_numpy(dtype=str), 'fila': palabras.index.to_numpy(), 'peso': peso}))
+        pares = pd.concat(partes, ignore_index=True).groupby(['palabra', 'fila'], sort=True)['peso'].sum().reset_index()
+
+        # Vocabulario ordenado y listas de filas (ordenadas) por palabra
+        codigos, vocabulario = pd.factorize(pares['palabra'], sort=True)
+        self.vocabulario = np.asarray(vocabulario, dtype=str)
+        self._filas = pares['fila'].to_numpy(dtype=np.int64)
+        self._pesos = pares['peso'].to_numpy(dtype=np.float64)
+        self._inicios = np.concatenate(([0], np.cumsum(np.bincount(codigos, minlength=len(self.vocabulario)))))
+        frecuencia = np.diff(self._inicios)
+        self._idf = np.log1p(max(self.n_filas, 1) / np.maximum(frecuencia, 1))
+
+        # Trigramas del vocabulario para localizar palabras por cualquier fragmento
+        trigramas = {}
+        for codigo, palabra in enumerate(self.vocabulario):
+            for trigrama in {palabra[i:i + 3] for i in range(len(palabra) - 2)}:
+                trigramas.setdefault(trigrama, []).append(codigo)
+        self._trigramas = {t: np.array(c, dtype=np.int64) for t, c in trigramas.items()}
+
+    def palabras_con(self, termino):
+        """Códigos de las palabras del vocabulario que contienen el término"""
+        if len(termino) < 3:
+            # Términos muy cortos: búsqueda vectorizada sobre el vocabulario
+            return np.flatnonzero(np.char.find(self.vocabulario, termino) >= 0)
+        listas = sorted((self._trigramas.get(termino[i:i + 3]) for i in range(len(termino) - 2)),
+                        key=lambda l: -1 if l is None else len(l))
+        if listas[0] is None:
+            return np.empty(0, dtype=np.int64)
+        candidatos = listas[0]
+        for lista in listas[1:]:
+            candidatos = np.intersect1d(candidatos, lista, assume_unique=True)
+        # Los trigramas no garantizan el orden: se comprueba el término completo
+        return candidatos[np.char.find(self.vocabulario[candidatos], termino) >= 0]
+
+    def _filas_de_termino(self, termino):
+        """Filas que contienen alguna palabra con el término y su puntuación"""
+        codigos = self.palabras_con(termino)
+        if len(codigos) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        tramos = [np.arange(self._inicios[c], self._inicios[c + 1]) for c in codigos]
+        indices = np.concatenate(tramos)
+        puntos = self._pesos[indices] * np.repeat(self._idf[codigos], [len(t) for t in tramos])
+        filas, inverso = np.unique(self._filas[indices], return_inverse=True)
+        return filas, np.bincount(inverso, weights=puntos)
+
+    def _contiene(self, posiciones, consulta):
+        """Comprueba sobre las filas candidatas que algún campo contiene la consulta literal"""
+        mascara = np.zeros(len(posiciones), dtype=bool)
+        for textos in self._textos.values():
+            mascara |= np.fromiter((consulta in t for t in textos[posiciones]), dtype=bool, count=len(posiciones))
+        return mascara
+
+    def buscar(self, consulta, posiciones=None, exacta=True, por_relevancia=False):
+        """Posiciones de las filas que coinciden con la consulta, sin distinguir mayúsculas ni acentos
+
+        Con ``exacta`` la consulta debe aparecer literalmente en algún campo (como
+        el buscador original); sin ella basta con que cada palabra de la consulta
+        aparezca en alguna palabra de la fila. ``posiciones`` restringe la búsqueda
+        a esas filas (ordenadas) y ``por_relevancia`` ordena el resultado por
+        puntuación en lugar de por posición.
+        """
+        consulta = normalizar_consulta(consulta)
+        terminos = PATRON_PALABRA.findall(consulta)
+
+        if not terminos:
+            # Sin palabras (p. ej. solo signos) el índice no ayuda: comprobación directa
+            filas = np.arange(self.n_filas) if posiciones is None else np.asarray(posiciones)
+            return filas[self._contiene(filas, consulta)]
+
+        # Todas las palabras de la consulta deben aparecer en la fila
+        filas, puntos = None, None
+        for termino in sorted(set(terminos), key=len, reverse=True):
+            filas_t, puntos_t = self._filas_de_termino(termino)
+            if filas is None:
+                filas, puntos = filas_t, puntos_t
+            else:
+                filas, i, j = np.intersect1d(filas, filas_t, assume_unique=True, return_indices=True)
+                puntos = puntos[i] + puntos_t[j]
+            if len(filas) == 0:
+                break
+
+        if posiciones is not None and len(filas):
+            filas, i, _ = np.intersect1d(filas, posiciones, assume_unique=True, return_indices=True)
+            puntos = puntos[i]
+        if exacta and len(filas):
+            coincide = self._contiene(filas, consulta)
+            filas, puntos = filas[coincide], puntos[coincide]
+        if por_relevancia:
+            orden = np.argsort(-puntos, kind='stable')
+            filas = filas[orden]
+        return filas
+
+    def refinar(self, consulta, posiciones):
+        """Filas de ``posiciones`` que contienen la consulta literal, sin pasar por el índice
+
+        Sirve cuando ``posiciones`` es el resultado de una búsqueda exacta de un
+        fragmento de esta consulta (p. ej. el término con una letra menos): solo
+        pueden coincidir esas filas y basta con comprobarlas.
+        """
+        posiciones = np.asarray(posiciones)
+        return posiciones[self._contiene(posiciones, normalizar_consulta(consulta))]
@@ -0,0 +1,222 @@
+"""
+Caché de resultados de consultas compartida entre sesiones.
+
+Las claves se construyen con el estado de filtros normalizado (aeropuertos,
+empresas, rango de fechas, rango de importes y término de búsqueda) y la
+versión de los datos, de modo que la misma consulta hecha desde sesiones
+distintas, o con fechas e importes expresados de otra forma, reutiliza el
+mismo resultado. Hay dos almacenes intercambiables:
+
+- ``CacheMemoria``: LRU acotada por número de entradas y por bytes y con
+  caducidad (TTL), dentro del proceso.
+- ``CacheDisco``: SQLite local con el mismo desalojo LRU + TTL y una
+  ``CacheMemoria`` delante; los aciertos sobreviven a los reinicios.
+
+El tamaño de cada valor es ``nbytes`` para los arrays y el de su pickle para
+el resto (DataFrames, agregados, figuras). Un valor mayor que el límite de
+bytes no se guarda.
+
+Ambos llevan estadísticas de aciertos, fallos, caducados y desalojos.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from almacen_datos import DIR_CACHE
+from busqueda import normalizar_consulta
+from indice_filtros import limites_fecha_ns, normalizar_seleccion
+
+TIPO_CACHE = os.environ.get('AENA_CACHE_CONSULTAS', 'memoria')
+CAPACIDAD_CACHE = int(os.environ.get('AENA_CAPACIDAD_CONSULTAS', '256'))
+BYTES_CACHE = int(float(os.environ.get('AENA_MEMORIA_CONSULTAS_MB', '512')) * 2**20)
+BYTES_CACHE_DISCO = int(float(os.environ.get('AENA_DISCO_CONSULTAS_MB', '2048')) * 2**20)
+TTL_CACHE = float(os.environ.get('AENA_TTL_CONSULTAS', '3600'))
+RUTA_CACHE_DISCO = os.path.join(DIR_CACHE, 'consultas.sqlite')
+# Cambia cuando cambia la estructura de los resultados guardados en disco
+FORMATO_CACHE = 4
+
+
+def clave_filtros(filtros, busqueda=''):
+    """Tupla normalizada (aeropuertos, empresas, fechas, importes, búsqueda) de un estado de filtros"""
+    # Las fechas se reducen a sus límites en nanosegundos: date, datetime o Timestamp del mismo rango coinciden
+    rango_fechas = limites_fecha_ns(filtros.rango_fechas) if filtros.rango_fechas else ()
+    rango_importes = tuple(float(v) for v in filtros.rango_importes)
+    # El buscador no distingue mayúsculas ni acentos, pero la coincidencia literal sí cuenta los espacios
+    busqueda = normalizar_consulta(busqueda or '')
+    return (normalizar_seleccion(filtros.aeropuertos), normalizar_seleccion(filtros.empresas),
+            rango_fechas, rango_importes, busqueda)
+
+
+def tamano_valor(valor):
+    """Bytes que ocupa un valor de la caché (aproximado salvo para los arrays)"""
+    if isinstance(valor, np.ndarray):
+        return valor.nbytes
+    return len(pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class Estadisticas:
+    """Contadores de una caché"""
+
+    def __init__(self):
+        self.aciertos = 0
+        self.fallos = 0
+        self.caducados = 0
+        self.desalojos = 0
+
+    def proporcion_aciertos(self):
+        """Aciertos sobre el total de consultas (0 si no hay ninguna)"""
+        total = self.aciertos + self.fallos
+        return self.aciertos / total if total else 0.0
+
+    def como_dict(self):
+        """Contadores y proporción de aciertos"""
+        return {'aciertos': self.aciertos, 'fallos': self.fallos, 'caducados': self.caducados,
+                'desalojos': self.desalojos, 'proporcion_aciertos': self.proporcion_aciertos()}
+
+
+class CacheMemoria:
+    """LRU acotada por entradas y por bytes con caducidad, dentro del proceso"""
+
+    def __init__(self, capacidad=CAPACIDAD_CACHE, ttl=TTL_CACHE, max_bytes=BYTES_CACHE):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.estadisticas = Estadisticas()
+        self._entradas = OrderedDict()
+        self._bloqueo = threading.Lock()
+
+    def obtener(self, clave):
+        """Valor guardado para la clave, o None si no está o ha caducado"""
+        with self._bloqueo:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and time.monotonic() - entrada[0] > self.ttl:
+                del self._entradas[clave]
+                self.bytes -= entrada[2]
+                self.estadisticas.caducados += 1
+                entrada = None
+            if entrada is None:
+                self.estadisticas.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.estadisticas.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, clave, valor, tamano=None):
+        """Guarda el valor y desaloja las entradas menos usadas por encima de la capacidad o de los bytes"""
+        if tamano is None:
+            tamano = tamano_valor(valor)
+        with self._bloqueo:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= anterior[2]
+            if tamano > self.max_bytes:
+                return
+            self._entradas[clave] = (time.monotonic(), valor, tamano)
+            self.bytes += tamano
+            while len(self._entradas) > self.capacidad or self.bytes > self.max_bytes:
+                self.bytes -= self._entradas.popitem(last=False)[1][2]
+                self.estadisticas.desalojos += 1
+
+    def vaciar(self):
+        """Elimina todas las entradas"""
+        with self._bloqueo:
+            self._entradas.clear()
+            self.bytes = 0
+
+
+class CacheDisco:
+    """Caché en SQLite local con una LRU en memoria delante; sobrevive a los reinicios"""
+
+    def __init__(self, ruta=RUTA_CACHE_DISCO, capacidad=CAPACIDAD_CACHE, ttl=TTL_CACHE, capacidad_memoria=64,
+                 max_bytes=BYTES_CACHE_DISCO, max_bytes_memoria=BYTES_CACHE):
+        self.ruta = ruta
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # La memoria evita deserializar en cada acierto los valores más usados
+        self.memoria = CacheMemoria(capacidad_memoria, ttl, max_bytes_memoria)
+        self.estadisticas = Estadisticas()
+        self._bloqueo = threading.Lock()
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute('PRAGMA journal_mode=WAL')
+        self._tabla = f'consultas_f{FORMATO_CACHE}'
+        self._conexion.execute(
+            f'CREATE TABLE IF NOT EXISTS {self._tabla} ('
+            'clave BLOB PRIMARY KEY, valor BLOB NOT NULL, creado REAL NOT NULL, usado REAL NOT NULL, tamano INTEGER NOT NULL)'
+        )
+
+    def obtener(self, clave):
+        """Valor guardado para la clave (de memoria o de disco), o None si no está o ha caducado"""
+        clave_bin = pickle.dumps(clave, protocol=pickle.HIGHEST_PROTOCOL)
+        ahora = time.time()
+        valor = self.memoria.obtener(clave)
+        if valor is not None:
+            # El uso cuenta también para el desalojo LRU en disco
+            with self._bloqueo:
+                self._conexion.execute(f'UPDATE {self._tabla} SET usado = ? WHERE clave = ?', (ahora, clave_bin))
+                self.estadisticas.aciertos += 1
+            return valor
+
+        with self._bloqueo:
+            fila = self._conexion.execute(f'SELECT valor, creado FROM {self._tabla} WHERE clave = ?', (clave_bin,)).fetchone()
+            if fila is not None and ahora - fila[1] > self.ttl:
+                self._conexion.execute(f'DELETE FROM {self._tabla} WHERE clave = ?', (clave_bin,))
+                self.estadisticas.caducados += 1
+                fila = None
+            if fila is None:
+                self.estadisticas.fallos += 1
+                return None
+            self._conexion.execute(f'UPDATE {self._tabla} SET usado = ? WHERE clave = ?', (ahora, clave_bin))
+            self.estadisticas.aciertos += 1
+        valor = pickle.loads(fila[0])
+        self.memoria.guardar(clave, valor, len(fila[0]))
+        return valor
+
+    def guardar(self, clave, valor):
+        """Guarda el valor en memoria y en disco, desalojando en disco las entradas menos usadas"""
+        clave_bin = pickle.dumps(clave, protocol=pickle.HIGHEST_PROTOCOL)
+        valor_bin = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        tamano = valor.nbytes if isinstance(valor, np.ndarray) else len(valor_bin)
+        self.memoria.guardar(clave, valor, tamano)
+        ahora = time.time()
+        with self._bloqueo:
+            if len(valor_bin) > self.max_bytes:
+                self._conexion.execute(f'DELETE FROM {self._tabla} WHERE clave = ?', (clave_bin,))
+                return
+            self._conexion.execute(f'INSERT OR REPLACE INTO {self._tabla} VALUES (?, ?, ?, ?, ?)',
+                                   (clave_bin, valor_bin, ahora, ahora, len(valor_bin)))
+            # Las menos usadas salen mientras se pase del número de entradas o de los bytes
+            usadas = self._conexion.execute(
+                f'SELECT clave, tamano FROM {self._tabla} ORDER BY usado DESC').fetchall()
+            total, sobrantes = 0, []
+            for i, (clave_usada, tamano_usado) in enumerate(usadas):
+                total += tamano_usado
+                if i >= self.capacidad or total > self.max_bytes:
+                    sobrantes.append((clave_usada,))
+            if sobrantes:
+                self._conexion.executemany(f'DELETE FROM {self._tabla} WHERE clave = ?', sobrantes)
+                self.estadisticas.desalojos += len(sobrantes)
+
+    def vaciar(self):
+        """Elimina todas las entradas"""
+        self.memoria.vaciar()
+        with self._bloqueo:
+            self._conexion.execute(f'DELETE FROM {self._tabla}')
+
+
+def crear_cache(tipo=TIPO_CACHE, capacidad=CAPACIDAD_CACHE, ttl=TTL_CACHE, ruta=RUTA_CACHE_DISCO):
+    """Crea la caché del tipo indicado: 'memoria' o 'disco'"""
+    if tipo == 'memoria':
+        return CacheMemoria(capacidad, ttl)
+    if tipo == 'disco':
+        return CacheDisco(ruta, capacidad, ttl)
+    raise ValueError(f"Tipo de caché desconocido: {tipo}")
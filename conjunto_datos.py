@@ -0,0 +1,81 @@
+"""
+Conjunto de datos compartido y de solo lectura.
+
+El conjunto ya preparado (esquema compacto de ``esquema_datos``) se escribe
+una vez por versión del almacén en un fichero Arrow IPC de la caché. Cada
+proceso lo abre mapeado en memoria: los textos y las columnas numéricas sin
+nulos apuntan directamente a las páginas del fichero, así que todas las
+sesiones y procesos que sirven la misma versión comparten la misma memoria
+física. El DataFrame resultante no se modifica nunca; los filtros trabajan
+con posiciones de fila sobre él. Al generarlo, los adjudicatarios se
+sustituyen por su nombre canónico (ver ``normalizacion_empresas``).
+"""
+import glob
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+from almacen_datos import DIR_CACHE, leer_almacen, version_almacen
+from esquema_datos import preparar_dataset
+from normalizacion_empresas import VERSION_EMPRESAS, normalizar_empresas
+
+DIR_CONJUNTOS = os.path.join(DIR_CACHE, 'conjuntos')
+# Cambia cuando cambia la preparación, para no reutilizar ficheros generados de otra forma
+FORMATO_CONJUNTO = 2
+
+# Los textos se abren como columnas Arrow (sin copiarlos a objetos de Python)
+_TIPOS_ARROW = {
+    pa.string(): pd.StringDtype('pyarrow'),
+    pa.large_string(): pd.StringDtype('pyarrow'),
+}
+
+
+def ruta_conjunto(version, dir_conjuntos=DIR_CONJUNTOS):
+    """Ruta del fichero Arrow del conjunto de una versión"""
+    # El conjunto lleva los adjudicatarios canónicos: un cambio en su resolución lo invalida
+    return os.path.join(dir_conjuntos, f"{version}.v{FORMATO_CONJUNTO}.e{VERSION_EMPRESAS}.arrow")
+
+
+def escribir_conjunto(df, ruta):
+    """Escribe el conjunto preparado como fichero Arrow IPC de forma atómica"""
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    # Temporal por proceso: varios trabajadores pueden generar la misma versión a la vez
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        with pa.OSFile(tmp, 'wb') as f, pa.ipc.new_file(f, tabla.schema) as escritor:
+            escritor.write_table(tabla)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, ruta)
+
+
+def abrir_conjunto(ruta):
+    """Abre el conjunto mapeado en memoria, sin copiar los buffers que no lo necesitan"""
+    tabla = pa.ipc.open_file(pa.memory_map(ruta)).read_all()
+    return tabla.to_pandas(split_blocks=True, types_mapper=_TIPOS_ARROW.get)
+
+
+def purgar_conjuntos(version, dir_conjuntos=DIR_CONJUNTOS):
+    """Elimina los ficheros de versiones anteriores"""
+    for ruta in glob.glob(os.path.join(dir_conjuntos, '*.arrow')):
+        if ruta != ruta_conjunto(version, dir_conjuntos):
+            try:
+                os.remove(ruta)
+            except OSError:
+                # Otro proceso puede tenerlo abierto (p. ej. en Windows)
+                pass
+
+
+def cargar_conjunto(manifiesto, dir_conjuntos=DIR_CONJUNTOS, dir_cache=DIR_CACHE):
+    """Conjunto preparado de la versión del manifiesto, generando su fichero si no existe"""
+    version = version_almacen(manifiesto)
+    ruta = ruta_conjunto(version, dir_conjuntos)
+    if not os.path.exists(ruta):
+        os.makedirs(dir_conjuntos, exist_ok=True)
+        df = normalizar_empresas(preparar_dataset(leer_almacen(manifiesto)), dir_cache)
+        escribir_conjunto(df, ruta)
+        purgar_conjuntos(version, dir_conjuntos)
+    return abrir_conjunto(ruta)
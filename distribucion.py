@@ -0,0 +1,330 @@
+"""
+Distribución del %baja (Porcentaje_Ahorro) por aeropuerto, empresa y mes.
+
+Los cuantiles exactos obligarían a ordenar las filas de cada estado de
+filtros. En su lugar cada celda del cubo (aeropuerto x empresa x mes) guarda
+al cargar un histograma de clases fijas de ANCHO_CLASE puntos entre BAJA_MIN
+y BAJA_MAX, más una clase por debajo y otra por encima. Solo se guardan las
+clases ocupadas, con su recuento y el mínimo y el máximo exactos de sus
+valores. Los histogramas se pueden sumar: una consulta reúne los de las
+celdas seleccionadas (y las filas de los meses incompletos) por grupo con
+un bincount, y de ahí salen mediana, cuantiles, histograma y atípicos.
+
+Los cuantiles se interpolan dentro de su clase, así que el error es como
+mucho la anchura de la clase. Los extremos son exactos. Son atípicos los
+valores fuera de las vallas de Tukey (P25 - 1,5·RIC, P75 + 1,5·RIC) del
+estado de filtros; su recuento también se interpola dentro de la clase.
+
+Con pocos valores las clases ocupadas quedan dispersas y la interpolación
+se aleja de los cuantiles reales (con 0 y 33,5 la mediana saldría 0,5). Los
+grupos de hasta UMBRAL_EXACTO valores se calculan con sus valores: solo se
+leen las filas de esos grupos, así que el coste sigue acotado.
+"""
+import numpy as np
+import pandas as pd
+
+BAJA_MIN = -20.0
+BAJA_MAX = 100.0
+ANCHO_CLASE = 0.5
+# Clases regulares más una por debajo de BAJA_MIN y otra desde BAJA_MAX
+CLASES_REGULARES = int(round((BAJA_MAX - BAJA_MIN) / ANCHO_CLASE))
+NUMERO_CLASES = CLASES_REGULARES + 2
+BORDES_CLASES = BAJA_MIN + ANCHO_CLASE * np.arange(CLASES_REGULARES + 1)
+
+CUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+NOMBRES_CUANTILES = ('P10', 'P25', 'Mediana', 'P75', 'P90')
+FACTOR_TUKEY = 1.5
+# Grupos con hasta estos valores: cuantiles y atípicos exactos a partir de sus filas
+UMBRAL_EXACTO = 200
+
+
+def clase_baja(valores):
+    """Clase del histograma de cada valor de %baja (0: por debajo de BAJA_MIN; la última: desde BAJA_MAX)"""
+    # Misma aritmética que la expresión SQL de backend_sql.py, para que ambos backends coincidan
+    clases = np.floor((np.asarray(valores, dtype=np.float64) - BAJA_MIN) / ANCHO_CLASE) + 1
+    return np.clip(clases, 0, NUMERO_CLASES - 1).astype(np.int64)
+
+
+def agrupar_entradas(celdas, valores):
+    """Histograma disperso de unos valores por celda: (celdas, clases, recuentos, mínimos, máximos) por clase ocupada"""
+    claves = celdas.astype(np.int64) * NUMERO_CLASES + clase_baja(valores)
+    claves, inverso, recuentos = np.unique(claves, return_inverse=True, return_counts=True)
+    minimos = np.full(len(claves), np.inf)
+    maximos = np.full(len(claves), -np.inf)
+    np.minimum.at(minimos, inverso, valores)
+    np.maximum.at(maximos, inverso, valores)
+    celdas, clases = np.divmod(claves, NUMERO_CLASES)
+    return celdas, clases, recuentos.astype(np.float64), minimos, maximos
+
+
+def cuantiles_exactos(grupos, valores, n_grupos, cuantiles=CUANTILES):
+    """Cuantiles de cada grupo (grupos x cuantiles) a partir de sus valores, con interpolación lineal como numpy"""
+    valores = valores[np.lexsort((valores, grupos))]
+    n = np.bincount(grupos, minlength=n_grupos)
+    con_valores = n > 0
+    inicio, n = (np.cumsum(n) - n)[con_valores], n[con_valores]
+    resultado = np.full((n_grupos, len(cuantiles)), np.nan)
+    for j, cuantil in enumerate(cuantiles):
+        posicion = inicio + (n - 1) * cuantil
+        abajo = np.floor(posicion).astype(np.int64)
+        arriba = np.minimum(abajo + 1, inicio + n - 1)
+        resultado[con_valores, j] = valores[abajo] + (posicion - abajo) * (valores[arriba] - valores[abajo])
+    return resultado
+
+
+# Borde izquierdo y derecho de cada clase; los de las clases extremas son el mínimo y el máximo de cada grupo
+_IZQUIERDA = np.concatenate(([np.nan], BORDES_CLASES))
+_DERECHA = np.concatenate((BORDES_CLASES, [np.nan]))
+
+
+class HistogramasAgrupados:
+    """Histogramas de varios grupos, como entradas (grupo, clase, recuento) ordenadas por grupo y clase
+
+    ``grupos`` guarda el código original de cada grupo presente; el resto de
+    arrays por grupo siguen ese orden.
+    """
+
+    def __init__(self, grupos, clases, recuentos, minimos, maximos, n_grupos):
+        validas = grupos >= 0
+        grupos, clases = grupos[validas], clases[validas]
+        # Solo los grupos presentes, renumerados en orden sin ordenar las entradas
+        presentes = np.zeros(n_grupos, dtype=bool)
+        presentes[grupos] = True
+        self.grupos = np.flatnonzero(presentes)
+        renumerado = np.cumsum(presentes) - 1
+        grupos = renumerado[grupos]
+        n_grupos = len(self.grupos)
+
+        # Suma por grupo y clase: bincount denso y solo las clases ocupadas
+        denso = np.bincount(grupos * NUMERO_CLASES + clases, weights=recuentos[validas], minlength=n_grupos * NUMERO_CLASES)
+        claves = np.flatnonzero(denso)
+        self.recuentos = denso[claves]
+        self.grupo, self.clase = np.divmod(claves, NUMERO_CLASES)
+        self.n = np.bincount(self.grupo, weights=self.recuentos, minlength=n_grupos)
+        self.minimo = np.full(n_grupos, np.inf)
+        self.maximo = np.full(n_grupos, -np.inf)
+        np.minimum.at(self.minimo, grupos, minimos[validas])
+        np.maximum.at(self.maximo, grupos, maximos[validas])
+
+        # Acumulado global: las entradas de un grupo ocupan el tramo (antes, antes + n] del acumulado
+        self.acumulado = np.cumsum(self.recuentos)
+        self.antes = np.cumsum(self.n) - self.n
+        extremo_inferior, extremo_superior = self.clase == 0, self.clase == NUMERO_CLASES - 1
+        self.izquierda = np.where(extremo_inferior, self.minimo[self.grupo], _IZQUIERDA[self.clase])
+        self.derecha = np.where(extremo_superior, self.maximo[self.grupo], _DERECHA[self.clase])
+
+    def cuantiles(self, cuantiles=CUANTILES):
+        """Cuantiles de cada grupo (grupos x cuantiles), interpolando dentro de la clase"""
+        resultado = np.empty((len(self.n), len(cuantiles)))
+        for j, cuantil in enumerate(cuantiles):
+            objetivo = self.antes + cuantil * self.n
+            # Primera entrada en la que el acumulado alcanza el objetivo
+            entrada = np.minimum(np.searchsorted(self.acumulado, objetivo, side='left'), len(self.acumulado) - 1)
+            fraccion = (objetivo - (self.acumulado[entrada] - self.recuentos[entrada])) / self.recuentos[entrada]
+            valor = self.izquierda[entrada] + np.clip(fraccion, 0, 1) * (self.derecha[entrada] - self.izquierda[entrada])
+            resultado[:, j] = np.clip(valor, self.minimo, self.maximo)
+        return resultado
+
+    def por_debajo(self, limite):
+        """Número (interpolado) de valores de cada grupo por debajo de un límite"""
+        ancho = self.derecha - self.izquierda
+        # Parte de cada clase por debajo del límite; una clase sin anchura cuenta entera si queda por debajo
+        parte = np.divide(limite - self.izquierda, ancho, out=(limite > self.izquierda).astype(np.float64), where=ancho > 0)
+        return np.bincount(self.grupo, weights=self.recuentos * np.clip(parte, 0, 1), minlength=len(self.n))
+
+    def densos(self, grupo=0):
+        """Recuentos de todas las clases de un grupo"""
+        entradas = self.grupo == grupo
+        return np.bincount(self.clase[entradas], weights=self.recuentos[entradas], minlength=NUMERO_CLASES)
+
+
+def _exactos(valores_grupos, nombre, histogramas):
+    """Grupos de hasta UMBRAL_EXACTO valores y sus valores: (máscara de grupos, grupo de cada valor, valores)
+
+    Los grupos de cada valor siguen el orden de ``histogramas.grupos``; sin
+    ``valores_grupos`` o sin grupos pequeños devuelve None.
+    """
+    pequenos = (histogramas.n > 0) & (histogramas.n <= UMBRAL_EXACTO)
+    if valores_grupos is None or not pequenos.any():
+        return None
+    grupos, valores = valores_grupos(nombre, histogramas.grupos[pequenos])
+    return pequenos, np.searchsorted(histogramas.grupos, grupos), valores
+
+
+class DistribucionBaja:
+    """Distribución del %baja de un estado de filtros: resumen, histograma y estadísticas por grupo"""
+
+    def __init__(self, clases, recuentos, minimos, maximos, dimensiones, valores_grupos=None):
+        """Reúne entradas de histograma (una por clase ocupada de cada celda o fila)
+
+        ``dimensiones`` asocia a cada nombre de grupo ('Aeropuerto', 'Empresa',
+        'Mes') los códigos de grupo de cada entrada (negativos: sin grupo) y los
+        nombres de los grupos. ``valores_grupos(nombre, grupos)``, si se indica,
+        devuelve el código de grupo y el valor de las filas de esos grupos de la
+        dimensión (con ``nombre`` None, todas las filas y código 0); con él los
+        grupos pequeños se calculan con exactitud.
+        """
+        total = HistogramasAgrupados(np.zeros(len(clases), dtype=np.int64), clases, recuentos, minimos, maximos, 1)
+        self.total = int(total.n.sum())
+        exactos = _exactos(valores_grupos, None, total)
+        indice_resumen = ['Mínimo', *NOMBRES_CUANTILES, 'Máximo']
+        if self.total:
+            self.resumen = pd.Series([total.minimo[0], *self._cuantiles(total, exactos)[0], total.maximo[0]],
+                                     index=indice_resumen)
+        else:
+            self.resumen = pd.Series(np.nan, index=indice_resumen)
+
+        # Vallas de Tukey del estado de filtros completo, aplicadas también a cada grupo
+        p25, p75 = self.resumen['P25'], self.resumen['P75']
+        self.limites_atipicos = (p25 - FACTOR_TUKEY * (p75 - p25), p75 + FACTOR_TUKEY * (p75 - p25))
+        bajos, altos = self._atipicos(total, exactos)
+        self.atipicos_bajos, self.atipicos_altos = int(bajos.sum()), int(altos.sum())
+
+        # Histograma entre la primera y la última clase ocupadas
+        if self.total:
+            recuentos_clase = total.densos()
+            ocupadas = np.flatnonzero(recuentos_clase)
+            rango = np.arange(ocupadas[0], ocupadas[-1] + 1)
+            izquierda = _IZQUIERDA[rango].copy()
+            derecha = _DERECHA[rango].copy()
+            izquierda[rango == 0] = total.minimo[0]
+            derecha[rango == NUMERO_CLASES - 1] = total.maximo[0]
+            self.histograma = pd.DataFrame({'Desde': izquierda, 'Hasta': derecha,
+                                            'Licitaciones': recuentos_clase[rango].astype(np.int64)})
+        else:
+            self.histograma = pd.DataFrame(columns=['Desde', 'Hasta', 'Licitaciones'])
+
+        self.por_grupo = {nombre: self._por_grupo(nombre, nombres, HistogramasAgrupados(
+                              codigos, clases, recuentos, minimos, maximos, len(nombres)), valores_grupos)
+                          for nombre, (codigos, nombres) in dimensiones.items()}
+
+    def _cuantiles(self, histogramas, exactos):
+        """Cuantiles de cada grupo: exactos en los grupos pequeños, interpolados en las clases en el resto"""
+        cuantiles = histogramas.cuantiles()
+        if exactos is not None:
+            pequenos, grupos, valores = exactos
+            cuantiles[pequenos] = cuantiles_exactos(grupos, valores, len(histogramas.n))[pequenos]
+        return cuantiles
+
+    def _atipicos(self, histogramas, exactos=None):
+        """Número de valores por debajo y por encima de las vallas de Tukey en cada grupo"""
+        if not self.total:
+            return np.zeros(len(histogramas.n)), np.zeros(len(histogramas.n))
+        inferior, superior = self.limites_atipicos
+        bajos = histogramas.por_debajo(inferior)
+        altos = histogramas.n - histogramas.por_debajo(superior)
+        if exactos is not None:
+            pequenos, grupos, valores = exactos
+            bajos[pequenos] = np.bincount(grupos, weights=valores < inferior, minlength=len(bajos))[pequenos]
+            altos[pequenos] = np.bincount(grupos, weights=valores > superior, minlength=len(altos))[pequenos]
+        return np.rint(bajos), np.rint(altos)
+
+    def _por_grupo(self, nombre, nombres, histogramas, valores_grupos):
+        """Recuento, cuantiles y atípicos de cada grupo presente, de más a menos licitaciones"""
+        exactos = _exactos(valores_grupos, nombre, histogramas)
+        bajos, altos = self._atipicos(histogramas, exactos)
+        tabla = pd.DataFrame(self._cuantiles(histogramas, exactos), columns=list(NOMBRES_CUANTILES))
+        tabla.insert(0, nombre, [nombres[g] for g in histogramas.grupos])
+        tabla.insert(1, 'Licitaciones', histogramas.n.astype(np.int64))
+        tabla['Atípicos'] = (bajos + altos).astype(np.int64)
+        if nombre == 'Mes':
+            return tabla
+        return tabla.sort_values(['Licitaciones', nombre], ascending=[False, True], kind='stable').reset_index(drop=True)
+
+
+class HistogramasCeldas:
+    """Histogramas dispersos del %baja de cada celda del cubo, calculados una vez por versión"""
+
+    def __init__(self, df, base, cubo, columna):
+        self.base = base
+        self.cubo = cubo
+        self.indice = cubo.indice
+        self.valores = df[columna].to_numpy(dtype=np.float64)
+        # Como en el cubo, solo cuentan las filas con importe (las demás no pasan el filtro de importes)
+        filas = np.flatnonzero(~np.isnan(self.valores) & ~np.isnan(self.indice.importes.valores))
+        (self._celdas, self._clases, self._recuentos,
+         self._minimos, self._maximos) = agrupar_entradas(base.celda_de_fila[filas], self.valores[filas])
+        # Filas de cada celda (las de la celda c ocupan [inicios[c], inicios[c + 1])) para los grupos pequeños
+        celdas = base.celda_de_fila[filas]
+        self._filas_celda = filas[np.argsort(celdas, kind='stable')]
+        self._inicios_celda = np.concatenate(([0], np.cumsum(np.bincount(celdas, minlength=base.n_celdas))))
+
+    def _entradas_filas(self, posiciones):
+        """Entradas de histograma de unas filas sueltas (una por fila)"""
+        valores = self.valores[posiciones]
+        return self.base.celda_de_fila[posiciones], clase_baja(valores), np.ones(len(posiciones)), valores, valores
+
+    def _descomponer(self, filtros, posiciones=None):
+        """Celdas completas (máscara o None) y filas sueltas con %baja del estado de filtros"""
+        if not self.cubo.responde(filtros):
+            # El filtro de importes excluye filas: los histogramas se hacen con las filas
+            seleccion, filas = None, self.indice.filtrar(*filtros) if posiciones is None else posiciones
+        else:
+            seleccion, filas = self.cubo.descomponer(filtros)
+        return seleccion, filas[~np.isnan(self.valores[filas])]
+
+    def entradas(self, filtros, posiciones=None):
+        """Entradas (celdas, clases, recuentos, mínimos, máximos) del estado de filtros"""
+        return self._entradas(*self._descomponer(filtros, posiciones))
+
+    def _entradas(self, seleccion, filas):
+        """Entradas de las celdas completas de la máscara y de las filas sueltas"""
+        if seleccion is None:
+            return self._entradas_filas(filas)
+        elegidas = seleccion[self._celdas]
+        partes = [(self._celdas[elegidas], self._clases[elegidas], self._recuentos[elegidas],
+                   self._minimos[elegidas], self._maximos[elegidas])]
+        if len(filas):
+            partes.append(self._entradas_filas(filas))
+        return tuple(np.concatenate(columna) for columna in zip(*partes))
+
+    def _valores_celdas(self, seleccion, filas, mascara):
+        """Celda y valor de las filas del estado de filtros que caen en las celdas de la máscara"""
+        filas = filas[mascara[self.base.celda_de_fila[filas]]]
+        if seleccion is not None:
+            celdas = np.flatnonzero(seleccion & mascara)
+            inicios = self._inicios_celda[celdas]
+            longitudes = self._inicios_celda[celdas + 1] - inicios
+            # Posiciones de los tramos [inicio, inicio + longitud) de cada celda, seguidas
+            tramos = np.repeat(inicios - (np.cumsum(longitudes) - longitudes), longitudes) + np.arange(longitudes.sum())
+            filas = np.concatenate((self._filas_celda[tramos], filas))
+        return self.base.celda_de_fila[filas], self.valores[filas]
+
+    def distribucion(self, filtros, posiciones=None):
+        """Distribución del %baja del estado de filtros por aeropuerto, empresa y mes"""
+        seleccion, filas = self._descomponer(filtros, posiciones)
+        return distribucion_celdas(self.base, *self._entradas(seleccion, filas),
+                                   valores_celdas=lambda mascara: self._valores_celdas(seleccion, filas, mascara))
+
+
+def distribucion_celdas(base, celdas, clases, recuentos, minimos, maximos, valores_celdas=None):
+    """Distribución a partir de entradas de histograma por celda
+
+    ``base`` da el aeropuerto, la empresa y el mes de cada celda, como
+    ``BaseAgregacion`` (o las celdas de una consulta SQL agrupada).
+    ``valores_celdas(mascara)``, si se indica, devuelve la celda y el valor de
+    las filas del estado de filtros en las celdas de la máscara (sobre las
+    celdas de ``base``) y da cuantiles exactos a los grupos pequeños.
+    """
+    # Las celdas sin empresa informada no cuentan en el análisis de empresas
+    empresa = base.celda_empresa
+    empresa = np.where((empresa >= 0) & base.empresa_valida[np.maximum(empresa, 0)], empresa, -1)
+    grupos_celda = {
+        'Aeropuerto': (base.celda_aeropuerto, base.aeropuertos),
+        'Empresa': (empresa, base.empresas),
+        'Mes': (base.celda_mes, base.meses.astype('datetime64[ns]')),
+    }
+    dimensiones = {nombre: (codigos[celdas], nombres) for nombre, (codigos, nombres) in grupos_celda.items()}
+
+    valores_grupos = None
+    if valores_celdas is not None:
+        def valores_grupos(nombre, grupos):
+            if nombre is None:
+                mascara = np.zeros(len(empresa), dtype=bool)
+                mascara[celdas] = True
+                _, valores = valores_celdas(mascara)
+                return np.zeros(len(valores), dtype=np.int64), valores
+            codigos = grupos_celda[nombre][0]
+            celdas_valor, valores = valores_celdas(np.isin(codigos, grupos))
+            return codigos[celdas_valor], valores
+    return DistribucionBaja(clases, recuentos, minimos, maximos, dimensiones, valores_grupos)
@@ -3,11 +3,37 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
 import warnings
 import base64
+import functools
+import os
+from almacen_datos import version_almacen
+from indice_filtros import Filtros, normalizar_seleccion
+from graficos import MAX_PUNTOS, UMBRAL_PUNTOS, traza_linea
+from exportacion import FORMATOS, clave_exportacion, exportacion_disponible
+from cache_consultas import clave_filtros, crear_cache
+from distribucion import ANCHO_CLASE, NOMBRES_CUANTILES, UMBRAL_EXACTO
+from esquema_datos import PRESUPUESTO_MEMORIA_MB_ANIO, informe_memoria
+from informes import Contexto
+from instantaneas import AlmacenInstantaneas
+from instrumentacion import configurar_log, ejecucion_actual, ejecucion_en_curso, finalizar_ejecucion, iniciar_ejecucion, marcar_fallo, medido, medir, metricas, registrar_cache
+from backend_sql import BACKEND, ContextoSQL, sql_disponible
+from refinamiento import SesionConsultas
+from refresco import VigilanteDatos
+from tabla_paginada import COLUMNAS_TABLA, TAMANOS_PAGINA, formatear_pagina, numero_paginas, ordenar_posiciones, posiciones_pagina
 warnings.filterwarnings('ignore')
+# El conjunto de datos es compartido: cualquier derivado se copia al modificarse, nunca el original
+pd.options.mode.copy_on_write = True
+
+# Destino opcional del log de rendimiento ('-' para la salida de errores) y del fichero de métricas Prometheus
+LOG_RENDIMIENTO = os.environ.get('AENA_LOG_RENDIMIENTO')
+RUTA_METRICAS_PROM = os.environ.get('AENA_METRICAS_PROM')
+
+# Granularidades de la evolución temporal
+NOMBRES_GRANULARIDAD = {'D': 'Día', 'W': 'Semana', 'M': 'Mes'}
+if LOG_RENDIMIENTO:
+    configurar_log(LOG_RENDIMIENTO)
 
 def get_image_as_base64(file_path):
     """Convierte una imagen a base64 para incrustarla en HTML"""
@@ -19,7 +45,7 @@ def get_image_as_base64(file_path):
 
 # Configuración de la página
 st.set_page_config(
-    page_title="Dashboard Licitaciones AENA 2024",
+    page_title="Dashboard Licitaciones AENA",
     page_icon="✈️",
     layout="wide",
     initial_sidebar_state="expanded"
@@ -29,48 +55,72 @@ st.set_page_config(
 st.title("Dashboard de licitaciones - AENA")
 st.markdown("---")
 
-@st.cache_data
-def cargar_datos():
-    """Carga y procesa los datos de AENA"""
-    try:
-        df = pd.read_excel('2024_AENA.xlsx')
-        
-        # Limpiar y procesar datos
-        # Usar el nombre exacto de la columna
-        fecha_col = 'Fecha presentación licitación'
-        
-        if fecha_col not in df.columns:
-            st.error(f"No se encontró la columna '{fecha_col}'")
-            return None
-        
-        df[fecha_col] = pd.to_datetime(df[fecha_col])
-        df['Mes'] = df[fecha_col].dt.month
-        df['Año'] = df[fecha_col].dt.year
-        df['Trimestre'] = df[fecha_col].dt.quarter
-        df['Día_Semana'] = df[fecha_col].dt.day_name()
-        df['Nombre_Mes'] = df[fecha_col].dt.month_name()
-        
-        # Usar la columna %baja existente si está disponible, sino calcularla
-        if '%baja' in df.columns:
-            # Convertir de decimal a porcentaje si es necesario
-            if df['%baja'].max() <= 1:
-                df['Porcentaje_Ahorro'] = df['%baja'] * 100
-            else:
-                df['Porcentaje_Ahorro'] = df['%baja']
-        else:
-            # Calcular diferencia entre presupuesto y adjudicación
-            df['Diferencia_Importe'] = df['Presupuesto base sin impuestos'] - df['Importe adjudicación sin impuestos licitación/lote']
-            df['Porcentaje_Ahorro'] = (df['Diferencia_Importe'] / df['Presupuesto base sin impuestos']) * 100
+def texto_periodo(anios):
+    """Devuelve el año o rango de años de una serie de años (p. ej. '2019-2026')"""
+    if len(anios) == 0 or anios.isna().all():
+        return ""
+    anio_min, anio_max = int(anios.min()), int(anios.max())
+    return str(anio_min) if anio_min == anio_max else f"{anio_min}-{anio_max}"
+
+def construir_datos(manifiesto, cache=None):
+    """Carga una versión de los datos de AENA y construye sus índices (fuera de las sesiones)"""
+    version = version_almacen(manifiesto)
+    if BACKEND == 'sql' and sql_disponible():
+        # Sin conjunto en memoria: filtros y agrupaciones se resuelven en DuckDB sobre las partes
+        datos = ContextoSQL(manifiesto, instantaneas=AlmacenInstantaneas(version), cache=cache)
+        datos.memoria_excedida = pd.DataFrame(columns=['Año', 'MB'])
+    else:
+        # Conjunto compartido y de solo lectura, índices y motor de agregación; las
+        # vistas de un aeropuerto o una empresa se sirven de las instantáneas precalculadas
+        # y las consultas ya resueltas por cualquier sesión, de la caché de consultas
+        datos = Contexto(manifiesto, instantaneas=AlmacenInstantaneas(version), con_busqueda=True, cache=cache)
         
         # Guardar el nombre de la columna de fecha para uso posterior
-        df.attrs['fecha_col'] = fecha_col
+        datos.df.attrs['fecha_col'] = 'Fecha presentación licitación'
         
-        return df
+        # Años por encima del presupuesto de memoria
+        informe = informe_memoria(datos.df)
+        datos.memoria_excedida = informe[~informe['Dentro del presupuesto']].dropna(subset=['Año'])
+    
+    datos.periodo = texto_periodo(pd.Series([datos.opciones.fecha_min, datos.opciones.fecha_max]).dt.year)
+    return datos
+
+@st.cache_resource
+def obtener_cache_consultas():
+    """Caché de consultas compartida por todas las sesiones (en memoria o en disco según AENA_CACHE_CONSULTAS)"""
+    return crear_cache()
+
+@st.cache_resource
+def obtener_vigilante():
+    """Vigilante de los libros compartido por todas las sesiones; renueva los datos en segundo plano"""
+    return VigilanteDatos(functools.partial(construir_datos, cache=obtener_cache_consultas())).iniciar()
+
+def cargar_datos():
+    """Paquete de datos vigente; una recarga en curso nunca bloquea la sesión"""
+    vigilante = obtener_vigilante()
+    try:
+        datos = vigilante.vigente()
     except Exception as e:
         st.error(f"Error al cargar los datos: {e}")
         return None
+    
+    if BACKEND == 'sql' and not sql_disponible():
+        st.warning("⚠️ El backend SQL necesita DuckDB (pip install duckdb); se usan los datos en memoria.")
+    
+    # Si falló la última actualización se sigue mostrando la versión anterior
+    if vigilante.error is not None:
+        st.warning(f"⚠️ No se pudieron actualizar los datos ({vigilante.error}); se muestra la versión anterior.")
+    
+    # Aviso si algún año supera el presupuesto de memoria
+    if len(datos.memoria_excedida):
+        st.warning(
+            f"⚠️ Memoria por encima del presupuesto ({PRESUPUESTO_MEMORIA_MB_ANIO:.0f} MB/año) en: "
+            + ", ".join(f"{int(r['Año'])} ({r['MB']:.0f} MB)" for _, r in datos.memoria_excedida.iterrows())
+        )
+    return datos
 
-def crear_filtros_sidebar(df):
+@medido
+def crear_filtros_sidebar(opciones):
     """Crea los filtros en el sidebar con dependencias"""
     # Logo de Acciona en el sidebar
     st.sidebar.markdown("""
@@ -94,72 +144,43 @@ def crear_filtros_sidebar(df):
     
     st.sidebar.header("🔍 Filtros")
     
-    fecha_col = 'Fecha presentación licitación'
-    
     # Inicializar session_state si no existe
-    if 'aeropuerto_seleccionado' not in st.session_state:
-        st.session_state.aeropuerto_seleccionado = 'Todos'
-    if 'empresa_seleccionada' not in st.session_state:
-        st.session_state.empresa_seleccionada = 'Todas'
-    
-    # Obtener datos base para filtros
-    df_empresas_validas = df[df['Adjudicatario licitación/lote'].notna() & 
-                             (df['Adjudicatario licitación/lote'] != '')]
-    
-    # Obtener todas las opciones disponibles
-    todos_aeropuertos = ['Todos'] + sorted(df['Aeropuerto'].unique().tolist())
-    todas_empresas = ['Todas'] + sorted(df_empresas_validas['Adjudicatario licitación/lote'].unique().tolist())
-    
-    # Filtro por aeropuerto
-    aeropuerto_seleccionado = st.sidebar.selectbox(
-        "Aeropuerto:", 
-        todos_aeropuertos,
-        key="aeropuerto_filter"
+    if 'aeropuertos_filter' not in st.session_state:
+        st.session_state.aeropuertos_filter = []
+    if 'empresas_filter' not in st.session_state:
+        st.session_state.empresas_filter = []
+    
+    # Empresas que operan en los aeropuertos elegidos (mapas de bits del índice); las
+    # empresas elegidas que ya no están disponibles se quitan de la selección
+    empresas_disponibles = opciones.empresas_disponibles(normalizar_seleccion(st.session_state.aeropuertos_filter))
+    disponibles = set(empresas_disponibles)
+    st.session_state.empresas_filter = [e for e in st.session_state.empresas_filter if e in disponibles]
+    
+    # Aeropuertos donde operan las empresas elegidas; los ya elegidos se mantienen
+    elegidos = set(st.session_state.aeropuertos_filter)
+    disponibles = set(opciones.aeropuertos_disponibles(normalizar_seleccion(st.session_state.empresas_filter)))
+    aeropuertos_disponibles = [a for a in opciones.aeropuertos if a in disponibles or a in elegidos]
+    
+    # Filtro por aeropuertos (sin selección: todos)
+    aeropuertos_seleccionados = st.sidebar.multiselect(
+        "Aeropuertos:",
+        aeropuertos_disponibles,
+        key="aeropuertos_filter",
+        placeholder="Todos"
     )
     
-    # Filtrar empresas según el aeropuerto seleccionado
-    if aeropuerto_seleccionado != 'Todos':
-        empresas_del_aeropuerto = df_empresas_validas[df_empresas_validas['Aeropuerto'] == aeropuerto_seleccionado]['Adjudicatario licitación/lote'].unique()
-        empresas_disponibles = ['Todas'] + sorted(empresas_del_aeropuerto.tolist())
-        
-        # Si la empresa actual no está en las disponibles, resetear a 'Todas'
-        if st.session_state.empresa_seleccionada not in empresas_disponibles:
-            st.session_state.empresa_seleccionada = 'Todas'
-        
-        empresa_seleccionada = st.sidebar.selectbox(
-            f"Empresa Adjudicataria (en {aeropuerto_seleccionado}):", 
-            empresas_disponibles,
-            key="empresa_filter_aeropuerto"
-        )
-    else:
-        empresa_seleccionada = st.sidebar.selectbox(
-            "Empresa Adjudicataria:", 
-            todas_empresas,
-            key="empresa_filter_all"
-        )
-    
-    # Filtrar aeropuertos según la empresa seleccionada
-    if empresa_seleccionada != 'Todas':
-        aeropuertos_de_la_empresa = df_empresas_validas[df_empresas_validas['Adjudicatario licitación/lote'] == empresa_seleccionada]['Aeropuerto'].unique()
-        aeropuertos_disponibles = ['Todos'] + sorted(aeropuertos_de_la_empresa.tolist())
-        
-        # Si el aeropuerto actual no está en los disponibles, resetear a 'Todos'
-        if st.session_state.aeropuerto_seleccionado not in aeropuertos_disponibles:
-            st.session_state.aeropuerto_seleccionado = 'Todos'
-        
-        aeropuerto_seleccionado = st.sidebar.selectbox(
-            f"Aeropuerto (donde opera {empresa_seleccionada}):", 
-            aeropuertos_disponibles,
-            key="aeropuerto_filter_empresa"
-        )
-    
-    # Actualizar session_state
-    st.session_state.aeropuerto_seleccionado = aeropuerto_seleccionado
-    st.session_state.empresa_seleccionada = empresa_seleccionada
+    # Filtro por empresas, limitado a las que operan en los aeropuertos elegidos
+    empresas_seleccionadas = st.sidebar.multiselect(
+        "Empresas Adjudicatarias:" if not aeropuertos_seleccionados else
+        f"Empresas Adjudicatarias (en {len(aeropuertos_seleccionados)} aeropuerto{'s' if len(aeropuertos_seleccionados) > 1 else ''}):",
+        empresas_disponibles,
+        key="empresas_filter",
+        placeholder="Todas"
+    )
     
     # Filtro por rango de fechas
-    fecha_min = df[fecha_col].min()
-    fecha_max = df[fecha_col].max()
+    fecha_min = opciones.fecha_min
+    fecha_max = opciones.fecha_max
     rango_fechas = st.sidebar.date_input(
         "Rango de fechas:",
         value=(fecha_min.date(), fecha_max.date()),
@@ -171,8 +192,8 @@ def crear_filtros_sidebar(df):
     st.sidebar.markdown("**Rango de importes (€):**")
     col1, col2 = st.sidebar.columns(2)
     
-    importe_min = float(df['Importe adjudicación sin impuestos licitación/lote'].min())
-    importe_max = float(df['Importe adjudicación sin impuestos licitación/lote'].max())
+    importe_min = opciones.importe_min
+    importe_max = opciones.importe_max
     
     with col1:
         importe_min_input = st.number_input(
@@ -196,41 +217,34 @@ def crear_filtros_sidebar(df):
     
     rango_importes = (importe_min_input, importe_max_input)
     
-    return aeropuerto_seleccionado, empresa_seleccionada, rango_fechas, rango_importes
+    return normalizar_seleccion(aeropuertos_seleccionados), normalizar_seleccion(empresas_seleccionadas), rango_fechas, rango_importes
 
-def aplicar_filtros(df, aeropuerto_seleccionado, empresa_seleccionada, rango_fechas, rango_importes):
-    """Aplica los filtros al dataframe"""
-    df_filtrado = df.copy()
-    fecha_col = 'Fecha presentación licitación'
-    
-    if aeropuerto_seleccionado != 'Todos':
-        df_filtrado = df_filtrado[df_filtrado['Aeropuerto'] == aeropuerto_seleccionado]
-    
-    if empresa_seleccionada != 'Todas':
-        df_filtrado = df_filtrado[df_filtrado['Adjudicatario licitación/lote'] == empresa_seleccionada]
-    
-    df_filtrado = df_filtrado[
-        (df_filtrado[fecha_col].dt.date >= rango_fechas[0]) &
-        (df_filtrado[fecha_col].dt.date <= rango_fechas[1]) &
-        (df_filtrado['Importe adjudicación sin impuestos licitación/lote'] >= rango_importes[0]) &
-        (df_filtrado['Importe adjudicación sin impuestos licitación/lote'] <= rango_importes[1])
-    ]
-    
-    return df_filtrado
+def obtener_sesion(version):
+    """Últimos resultados de la sesión para refinar los filtros sobre ellos (se renuevan con cada versión)"""
+    sesion = st.session_state.get('sesion_consultas')
+    if sesion is None or sesion.version != version:
+        sesion = st.session_state.sesion_consultas = SesionConsultas(version)
+    return sesion
 
-def crear_metricas_principales(df_filtrado):
+@medido
+def aplicar_filtros(datos, filtros):
+    """Aplica los filtros y devuelve las posiciones de las filas seleccionadas (sin copiar datos)"""
+    return datos.filas(filtros, sesion=obtener_sesion(datos.version))
+
+@medido
+def crear_metricas_principales(agregados):
     """Crea las métricas principales del dashboard"""
     col1, col2, col3, col4, col5 = st.columns(5)
     
     with col1:
         st.metric(
             label="📊 Total Licitaciones",
-            value=f"{len(df_filtrado):,}",
+            value=f"{agregados.total_licitaciones:,}",
             delta=None
         )
     
     with col2:
-        total_presupuesto = df_filtrado['Presupuesto base sin impuestos'].sum() / 1e6
+        total_presupuesto = agregados.presupuesto_total / 1e6
         st.metric(
             label="💰 Presupuesto Total (M€)",
             value=f"{total_presupuesto:,.1f}",
@@ -238,7 +252,7 @@ def crear_metricas_principales(df_filtrado):
         )
     
     with col3:
-        total_adjudicado = df_filtrado['Importe adjudicación sin impuestos licitación/lote'].sum() / 1e6
+        total_adjudicado = agregados.adjudicado_total / 1e6
         st.metric(
             label="🏆 Importe Adjudicado (M€)",
             value=f"{total_adjudicado:,.1f}",
@@ -246,7 +260,7 @@ def crear_metricas_principales(df_filtrado):
         )
     
     with col4:
-        ahorro_total = (df_filtrado['Presupuesto base sin impuestos'].sum() - df_filtrado['Importe adjudicación sin impuestos licitación/lote'].sum()) / 1e6
+        ahorro_total = (agregados.presupuesto_total - agregados.adjudicado_total) / 1e6
         porcentaje_ahorro = (ahorro_total / total_presupuesto) * 100 if total_presupuesto > 0 else 0
         st.metric(
             label="💡 Ahorro Total (M€)",
@@ -256,45 +270,63 @@ def crear_metricas_principales(df_filtrado):
     
     with col5:
         # Calcular %baja medio usando la columna existente o calculada
-        porcentaje_baja_medio = df_filtrado['Porcentaje_Ahorro'].mean()
+        porcentaje_baja_medio = agregados.porcentaje_baja_medio
         st.metric(
             label="📉 %Baja Medio",
             value=f"{porcentaje_baja_medio:.1f}%",
             delta=None
         )
 
-def crear_grafico_evolucion_temporal(df_filtrado):
-    """Crea gráfico de evolución temporal de licitaciones"""
-    st.subheader("📅 Evolución Temporal de Licitaciones")
-    
-    if len(df_filtrado) == 0:
-        st.warning("No hay datos para mostrar con los filtros seleccionados.")
-        return
-    
-    fecha_col = 'Fecha presentación licitación'
-    
-    # Agrupar por mes
-    df_mensual = df_filtrado.groupby(df_filtrado[fecha_col].dt.to_period('M')).agg({
-        'Número de expediente': 'count',
-        'Presupuesto base sin impuestos': 'sum',
-        'Importe adjudicación sin impuestos licitación/lote': 'sum'
-    }).reset_index()
-    
-    df_mensual['Fecha'] = df_mensual[fecha_col].dt.to_timestamp()
+def fragmento(funcion):
+    """Dibuja una parte de la página como fragmento de Streamlit
+
+    Sus widgets solo vuelven a ejecutar esa parte: el resto de gráficos no se
+    reconstruye ni se vuelve a serializar y enviar. Cuando el fragmento se
+    ejecuta por su cuenta (sin pasar por main) registra su propia ejecución.
+    """
+    @st.fragment
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        propia = ejecucion_en_curso() is None
+        if propia:
+            iniciar_ejecucion()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            if propia:
+                finalizar_ejecucion(RUTA_METRICAS_PROM)
+    return envoltura
+
+def obtener_figuras(motor, filtros, datos, construir, *args):
+    """Devuelve las figuras de una sección, construyéndolas una sola vez por estado de filtros"""
+    # Las figuras se guardan ya construidas en la caché de consultas del motor
+    clave = ('figuras', type(motor).__name__, motor.version, clave_filtros(filtros), construir.__name__, *args)
+    with medir(construir.__name__, cache='figuras'):
+        figuras = motor.cache.obtener(clave)
+        if figuras is None:
+            marcar_fallo('figuras')
+            figuras = construir(datos, *args)
+            motor.cache.guardar(clave, figuras)
+    return figuras
+
+def figuras_evolucion_temporal(df_mensual, granularidad='M'):
+    """Construye el gráfico de evolución temporal de licitaciones"""
+    # Serie por periodo calculada por el motor de agregación; por encima del
+    # umbral de puntos las trazas pasan a WebGL y se reducen en el servidor
+    periodo = NOMBRES_GRANULARIDAD[granularidad]
     
     # Crear gráfico
     fig = make_subplots(
         rows=2, cols=1,
-        subplot_titles=('Número de Licitaciones por Mes', 'Importes por Mes (M€)'),
+        subplot_titles=(f'Número de Licitaciones por {periodo}', f'Importes por {periodo} (M€)'),
         vertical_spacing=0.1
     )
     
     # Gráfico de número de licitaciones
     fig.add_trace(
-        go.Scatter(
-            x=df_mensual['Fecha'],
-            y=df_mensual['Número de expediente'],
-            mode='lines+markers',
+        traza_linea(
+            df_mensual['Fecha'],
+            df_mensual['Número de expediente'],
             name='Número de Licitaciones',
             line=dict(color='#1f77b4', width=3),
             marker=dict(size=8)
@@ -304,10 +336,9 @@ def crear_grafico_evolucion_temporal(df_filtrado):
     
     # Gráfico de importes
     fig.add_trace(
-        go.Scatter(
-            x=df_mensual['Fecha'],
-            y=df_mensual['Presupuesto base sin impuestos'] / 1e6,
-            mode='lines+markers',
+        traza_linea(
+            df_mensual['Fecha'],
+            df_mensual['Presupuesto base sin impuestos'] / 1e6,
             name='Presupuesto Base',
             line=dict(color='#ff7f0e', width=3)
         ),
@@ -315,10 +346,9 @@ def crear_grafico_evolucion_temporal(df_filtrado):
     )
     
     fig.add_trace(
-        go.Scatter(
-            x=df_mensual['Fecha'],
-            y=df_mensual['Importe adjudicación sin impuestos licitación/lote'] / 1e6,
-            mode='lines+markers',
+        traza_linea(
+            df_mensual['Fecha'],
+            df_mensual['Importe adjudicación sin impuestos licitación/lote'] / 1e6,
             name='Importe Adjudicado',
             line=dict(color='#2ca02c', width=3)
         ),
@@ -328,113 +358,160 @@ def crear_grafico_evolucion_temporal(df_filtrado):
     fig.update_layout(
         height=600,
         showlegend=True,
-        title_text="Evolución Temporal de Licitaciones AENA 2024"
+        title_text=f"Evolución Temporal de Licitaciones AENA {texto_periodo(df_mensual['Fecha'].dt.year)}"
     )
     
     fig.update_yaxes(title_text="Número de Licitaciones", row=1, col=1)
     fig.update_yaxes(title_text="Importe (M€)", row=2, col=1)
     
+    return fig
+
+@fragmento
+@medido
+def crear_grafico_evolucion_temporal(agregados, motor, filtros):
+    """Crea gráfico de evolución temporal de licitaciones"""
+    st.subheader("📅 Evolución Temporal de Licitaciones")
+    
+    if agregados.total_licitaciones == 0:
+        st.warning("No hay datos para mostrar con los filtros seleccionados.")
+        return
+    
+    granularidad = st.radio(
+        "Granularidad:",
+        list(NOMBRES_GRANULARIDAD),
+        index=list(NOMBRES_GRANULARIDAD).index('M'),
+        format_func=NOMBRES_GRANULARIDAD.get,
+        horizontal=True,
+        key="granularidad"
+    )
+    
+    # Las series por día o semana se calculan una vez y quedan en la caché de consultas
+    with medir('serie_temporal'):
+        serie = motor.serie_temporal(filtros, granularidad)
+    fig = obtener_figuras(motor, filtros, serie, figuras_evolucion_temporal, granularidad)
     st.plotly_chart(fig, use_container_width=True)
+    
+    if len(serie) > MAX_PUNTOS:
+        st.caption(f"⚡ {len(serie):,} periodos: gráfico WebGL reducido a {MAX_PUNTOS:,} puntos por serie")
+    elif len(serie) > UMBRAL_PUNTOS:
+        st.caption(f"⚡ {len(serie):,} periodos: gráfico WebGL")
 
-def crear_analisis_aeropuertos(df_filtrado):
+def figuras_aeropuertos(agregados):
+    """Construye los rankings de aeropuertos por número de licitaciones y por importe"""
+    # Top aeropuertos por número de licitaciones
+    aeropuertos_count = agregados.aeropuertos_count.head(10)
+    
+    fig_count = px.bar(
+        x=aeropuertos_count.values,
+        y=aeropuertos_count.index,
+        orientation='h',
+        title="Top 10 Aeropuertos por Número de Licitaciones",
+        labels={'x': 'Número de Licitaciones', 'y': 'Aeropuerto'},
+        color=aeropuertos_count.values,
+        color_continuous_scale='Blues'
+    )
+    fig_count.update_layout(height=400)
+    
+    # Top aeropuertos por importe
+    aeropuertos_importe = agregados.aeropuertos_importe.head(10)
+    
+    fig_importe = px.bar(
+        x=aeropuertos_importe.values / 1e6,
+        y=aeropuertos_importe.index,
+        orientation='h',
+        title="Top 10 Aeropuertos por Importe Adjudicado",
+        labels={'x': 'Importe Adjudicado (M€)', 'y': 'Aeropuerto'},
+        color=aeropuertos_importe.values,
+        color_continuous_scale='Greens'
+    )
+    fig_importe.update_layout(height=400)
+    
+    return fig_count, fig_importe
+
+@medido
+def crear_analisis_aeropuertos(agregados, motor, filtros):
     """Crea análisis de aeropuertos"""
     st.subheader("🏢 Análisis por Aeropuerto")
     
-    if len(df_filtrado) == 0:
+    if agregados.total_licitaciones == 0:
         st.warning("No hay datos para mostrar con los filtros seleccionados.")
         return
     
+    fig_count, fig_importe = obtener_figuras(motor, filtros, agregados, figuras_aeropuertos)
+    
     col1, col2 = st.columns(2)
     
     with col1:
-        # Top aeropuertos por número de licitaciones
-        aeropuertos_count = df_filtrado['Aeropuerto'].value_counts().head(10)
-        
-        fig = px.bar(
-            x=aeropuertos_count.values,
-            y=aeropuertos_count.index,
-            orientation='h',
-            title="Top 10 Aeropuertos por Número de Licitaciones",
-            labels={'x': 'Número de Licitaciones', 'y': 'Aeropuerto'},
-            color=aeropuertos_count.values,
-            color_continuous_scale='Blues'
-        )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig_count, use_container_width=True)
     
     with col2:
-        # Top aeropuertos por importe
-        aeropuertos_importe = df_filtrado.groupby('Aeropuerto')['Importe adjudicación sin impuestos licitación/lote'].sum().sort_values(ascending=False).head(10)
-        
-        fig = px.bar(
-            x=aeropuertos_importe.values / 1e6,
-            y=aeropuertos_importe.index,
-            orientation='h',
-            title="Top 10 Aeropuertos por Importe Adjudicado",
-            labels={'x': 'Importe Adjudicado (M€)', 'y': 'Aeropuerto'},
-            color=aeropuertos_importe.values,
-            color_continuous_scale='Greens'
-        )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig_importe, use_container_width=True)
 
-def crear_analisis_empresas(df_filtrado):
+def figuras_empresas(agregados):
+    """Construye los rankings de empresas por número de licitaciones y por importe"""
+    # Top empresas por número de licitaciones
+    empresas_count = agregados.empresas_count.head(15)
+    
+    fig_count = px.bar(
+        x=empresas_count.values,
+        y=empresas_count.index,
+        orientation='h',
+        title="Top 15 Empresas por Número de Licitaciones",
+        labels={'x': 'Número de Licitaciones', 'y': 'Empresa'},
+        color=empresas_count.values,
+        color_continuous_scale='Purples'
+    )
+    fig_count.update_layout(height=500)
+    
+    # Top empresas por importe adjudicado
+    empresas_importe = agregados.empresas_importe.head(15)
+    
+    fig_importe = px.bar(
+        x=empresas_importe.values / 1e6,
+        y=empresas_importe.index,
+        orientation='h',
+        title="Top 15 Empresas por Importe Adjudicado",
+        labels={'x': 'Importe Adjudicado (M€)', 'y': 'Empresa'},
+        color=empresas_importe.values,
+        color_continuous_scale='Reds'
+    )
+    fig_importe.update_layout(height=500)
+    
+    return fig_count, fig_importe
+
+@medido
+def crear_analisis_empresas(agregados, motor, filtros):
     """Crea análisis de empresas adjudicatarias"""
     st.subheader("🏢 Análisis de Empresas Adjudicatarias")
     
-    if len(df_filtrado) == 0:
+    if agregados.total_licitaciones == 0:
         st.warning("No hay datos para mostrar con los filtros seleccionados.")
         return
     
-    # Limpiar nombres de empresas (eliminar valores nulos o vacíos)
-    df_empresas = df_filtrado[df_filtrado['Adjudicatario licitación/lote'].notna() & 
-                              (df_filtrado['Adjudicatario licitación/lote'] != '')].copy()
-    
-    if len(df_empresas) == 0:
+    # El motor solo cuenta empresas informadas (sin nulos ni vacíos)
+    if agregados.filas_con_empresa == 0:
         st.warning("No hay datos de empresas adjudicatarias disponibles.")
         return
     
+    fig_count, fig_importe = obtener_figuras(motor, filtros, agregados, figuras_empresas)
+    
     col1, col2 = st.columns(2)
     
     with col1:
-        # Top empresas por número de licitaciones
-        empresas_count = df_empresas['Adjudicatario licitación/lote'].value_counts().head(15)
-        
-        fig = px.bar(
-            x=empresas_count.values,
-            y=empresas_count.index,
-            orientation='h',
-            title="Top 15 Empresas por Número de Licitaciones",
-            labels={'x': 'Número de Licitaciones', 'y': 'Empresa'},
-            color=empresas_count.values,
-            color_continuous_scale='Purples'
-        )
-        fig.update_layout(height=500)
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig_count, use_container_width=True)
     
     with col2:
-        # Top empresas por importe adjudicado
-        empresas_importe = df_empresas.groupby('Adjudicatario licitación/lote')['Importe adjudicación sin impuestos licitación/lote'].sum().sort_values(ascending=False).head(15)
-        
-        fig = px.bar(
-            x=empresas_importe.values / 1e6,
-            y=empresas_importe.index,
-            orientation='h',
-            title="Top 15 Empresas por Importe Adjudicado",
-            labels={'x': 'Importe Adjudicado (M€)', 'y': 'Empresa'},
-            color=empresas_importe.values,
-            color_continuous_scale='Reds'
-        )
-        fig.update_layout(height=500)
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig_importe, use_container_width=True)
     
     # Estadísticas adicionales
     st.subheader("📊 Estadísticas de Empresas")
     
+    empresas_count = agregados.empresas_count
+    
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        total_empresas = df_empresas['Adjudicatario licitación/lote'].nunique()
+        total_empresas = agregados.total_empresas
         st.metric(
             label="🏢 Total Empresas",
             value=f"{total_empresas}",
@@ -450,57 +527,61 @@ def crear_analisis_empresas(df_filtrado):
         )
     
     with col3:
-        promedio_por_empresa = len(df_empresas) / total_empresas
+        promedio_por_empresa = agregados.filas_con_empresa / total_empresas
         st.metric(
             label="📊 Promedio por empresa",
             value=f"{promedio_por_empresa:.1f}",
             delta="licitaciones"
         )
 
-def crear_analisis_mensual(df_filtrado):
+def figuras_mensual(agregados):
+    """Construye los gráficos de licitaciones por mes"""
+    licitaciones_por_mes_ordenado = agregados.licitaciones_por_mes
+    
+    # Gráfico de barras de licitaciones por mes
+    fig_barras = px.bar(
+        x=licitaciones_por_mes_ordenado.index,
+        y=licitaciones_por_mes_ordenado.values,
+        title="Licitaciones por Mes",
+        labels={'x': 'Mes', 'y': 'Número de Licitaciones'},
+        color=licitaciones_por_mes_ordenado.values,
+        color_continuous_scale='Viridis'
+    )
+    fig_barras.update_layout(height=400)
+    fig_barras.update_xaxes(tickangle=45)
+    
+    # Gráfico circular de distribución mensual
+    fig_circular = px.pie(
+        values=licitaciones_por_mes_ordenado.values,
+        names=licitaciones_por_mes_ordenado.index,
+        title="Distribución de Licitaciones por Mes",
+        hole=0.4
+    )
+    fig_circular.update_layout(height=400)
+    
+    return fig_barras, fig_circular
+
+@medido
+def crear_analisis_mensual(agregados, motor, filtros):
     """Crea análisis de licitaciones por mes"""
     st.subheader("📅 Análisis de Licitaciones por Mes")
     
-    if len(df_filtrado) == 0:
+    if agregados.total_licitaciones == 0:
         st.warning("No hay datos para mostrar con los filtros seleccionados.")
         return
     
-    # Ordenar meses correctamente
-    orden_meses = ['January', 'February', 'March', 'April', 'May', 'June', 
-                   'July', 'August', 'September', 'October', 'November', 'December']
+    # Licitaciones por mes, ya en el orden natural de los meses
+    licitaciones_por_mes_ordenado = agregados.licitaciones_por_mes
     
-    # Contar licitaciones por mes
-    licitaciones_por_mes = df_filtrado['Nombre_Mes'].value_counts()
-    
-    # Reordenar según el orden correcto de meses
-    licitaciones_por_mes_ordenado = licitaciones_por_mes.reindex(orden_meses, fill_value=0)
+    fig_barras, fig_circular = obtener_figuras(motor, filtros, agregados, figuras_mensual)
     
     col1, col2 = st.columns(2)
     
     with col1:
-        # Gráfico de barras de licitaciones por mes
-        fig = px.bar(
-            x=licitaciones_por_mes_ordenado.index,
-            y=licitaciones_por_mes_ordenado.values,
-            title="Licitaciones por Mes",
-            labels={'x': 'Mes', 'y': 'Número de Licitaciones'},
-            color=licitaciones_por_mes_ordenado.values,
-            color_continuous_scale='Viridis'
-        )
-        fig.update_layout(height=400)
-        fig.update_xaxes(tickangle=45)
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig_barras, use_container_width=True)
     
     with col2:
-        # Gráfico circular de distribución mensual
-        fig = px.pie(
-            values=licitaciones_por_mes_ordenado.values,
-            names=licitaciones_por_mes_ordenado.index,
-            title="Distribución de Licitaciones por Mes",
-            hole=0.4
-        )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig_circular, use_container_width=True)
     
     # Estadísticas adicionales
     st.subheader("📊 Estadísticas Mensuales")
@@ -531,51 +612,250 @@ def crear_analisis_mensual(df_filtrado):
             delta="licitaciones"
         )
 
-def crear_tabla_datos(df_filtrado):
-    """Crea tabla de datos interactiva"""
-    st.subheader("📋 Datos Detallados")
+def figuras_distribucion(distribucion):
+    """Construye el histograma del %baja y sus cuantiles por aeropuerto y por mes"""
+    histograma = distribucion.histograma
+    inferior, superior = distribucion.limites_atipicos
+    
+    # Histograma de clases fijas con la mediana y las vallas de atípicos
+    fig_histograma = go.Figure(go.Bar(
+        x=(histograma['Desde'] + histograma['Hasta']) / 2,
+        y=histograma['Licitaciones'],
+        width=(histograma['Hasta'] - histograma['Desde']).clip(lower=ANCHO_CLASE / 4),
+        marker_color='#1f77b4',
+        customdata=histograma[['Desde', 'Hasta']],
+        hovertemplate="%{customdata[0]:.1f}% – %{customdata[1]:.1f}%<br>%{y} licitaciones<extra></extra>"
+    ))
+    fig_histograma.add_vline(x=distribucion.resumen['Mediana'], line_dash='dash', line_color='green',
+                             annotation_text="Mediana")
+    for limite in (inferior, superior):
+        if histograma['Desde'].min() <= limite <= histograma['Hasta'].max():
+            fig_histograma.add_vline(x=limite, line_dash='dot', line_color='red')
+    fig_histograma.update_layout(title="Histograma del %Baja", xaxis_title="% Baja",
+                                 yaxis_title="Número de Licitaciones", height=400, bargap=0)
+    
+    # Mediana y rango intercuartílico de los aeropuertos con más licitaciones
+    aeropuertos = distribucion.por_grupo['Aeropuerto'].head(15).iloc[::-1]
+    fig_aeropuertos = go.Figure(go.Scatter(
+        x=aeropuertos['Mediana'],
+        y=aeropuertos['Aeropuerto'],
+        mode='markers',
+        marker=dict(size=9, color='#2ca02c'),
+        error_x=dict(type='data', symmetric=False,
+                     array=aeropuertos['P75'] - aeropuertos['Mediana'],
+                     arrayminus=aeropuertos['Mediana'] - aeropuertos['P25']),
+        hovertemplate="%{y}: mediana %{x:.1f}%<extra></extra>"
+    ))
+    fig_aeropuertos.update_layout(title="Mediana y P25–P75 del %Baja (Top 15 Aeropuertos)",
+                                  xaxis_title="% Baja", height=400)
+    
+    # Evolución mensual de la mediana con la banda P25–P75
+    meses = distribucion.por_grupo['Mes']
+    fig_meses = go.Figure([
+        go.Scatter(x=meses['Mes'], y=meses['P75'], mode='lines', line=dict(width=0),
+                   showlegend=False, hoverinfo='skip'),
+        go.Scatter(x=meses['Mes'], y=meses['P25'], mode='lines', line=dict(width=0), fill='tonexty',
+                   fillcolor='rgba(255, 127, 14, 0.2)', name='P25–P75'),
+        go.Scatter(x=meses['Mes'], y=meses['Mediana'], mode='lines+markers', name='Mediana',
+                   line=dict(color='#ff7f0e')),
+    ])
+    fig_meses.update_layout(title="Mediana Mensual del %Baja", xaxis_title="Fecha", yaxis_title="% Baja", height=400)
     
-    if len(df_filtrado) == 0:
-        st.warning("No hay datos para mostrar con los filtros seleccionados.")
+    return fig_histograma, fig_aeropuertos, fig_meses
+
+@medido
+def crear_analisis_distribucion(motor, filtros):
+    """Crea el análisis de la distribución del %baja: cuantiles, histograma y atípicos"""
+    st.subheader("📉 Distribución del %Baja")
+    
+    # Se combinan los histogramas precalculados de las celdas del estado de filtros
+    with medir('distribucion', cache='distribucion'):
+        distribucion = motor.distribucion(filtros)
+    
+    if distribucion.total == 0:
+        st.warning("No hay datos de %baja para los filtros seleccionados.")
         return
     
-    # Mostrar estadísticas de filtros
-    st.info(f"📊 Mostrando {len(df_filtrado)} licitaciones")
+    resumen = distribucion.resumen
+    inferior, superior = distribucion.limites_atipicos
+    col1, col2, col3, col4 = st.columns(4)
     
-    # Buscador de contratos
+    with col1:
+        st.metric(
+            label="📍 Mediana",
+            value=f"{resumen['Mediana']:.1f}%",
+            delta=None
+        )
+    
+    with col2:
+        st.metric(
+            label="↔️ P25 – P75",
+            value=f"{resumen['P25']:.1f}% – {resumen['P75']:.1f}%",
+            delta=None
+        )
+    
+    with col3:
+        st.metric(
+            label="📈 P90",
+            value=f"{resumen['P90']:.1f}%",
+            delta=None
+        )
+    
+    with col4:
+        atipicos = distribucion.atipicos_bajos + distribucion.atipicos_altos
+        st.metric(
+            label="⚠️ Atípicos",
+            value=f"{atipicos:,}",
+            delta=f"{distribucion.atipicos_altos:,} por encima de {superior:.1f}%",
+            delta_color="off"
+        )
+    
+    fig_histograma, fig_aeropuertos, fig_meses = obtener_figuras(motor, filtros, distribucion, figuras_distribucion)
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.plotly_chart(fig_histograma, use_container_width=True)
+    
+    with col2:
+        st.plotly_chart(fig_aeropuertos, use_container_width=True)
+    
+    st.plotly_chart(fig_meses, use_container_width=True)
+    
+    crear_tabla_distribucion(distribucion)
+
+@fragmento
+def crear_tabla_distribucion(distribucion):
+    """Tabla de cuantiles y atípicos por grupo; cambiar de grupo no vuelve a enviar los gráficos"""
+    resumen = distribucion.resumen
+    inferior, superior = distribucion.limites_atipicos
+    dimension = st.radio(
+        "Agrupar por:",
+        list(distribucion.por_grupo),
+        horizontal=True,
+        key="distribucion_dimension"
+    )
+    tabla = distribucion.por_grupo[dimension]
+    if dimension == 'Mes':
+        tabla = tabla.assign(Mes=tabla['Mes'].dt.strftime('%Y-%m'))
+    st.dataframe(
+        tabla.style.format({nombre: '{:.1f}%' for nombre in NOMBRES_CUANTILES}),
+        use_container_width=True,
+        hide_index=True,
+        height=350
+    )
+    st.caption(
+        f"Cuantiles exactos hasta {UMBRAL_EXACTO} licitaciones; por encima, aproximados con histogramas de clases de "
+        f"{ANCHO_CLASE:g} puntos (mínimo y máximo exactos: "
+        f"{resumen['Mínimo']:.1f}% – {resumen['Máximo']:.1f}%). Atípicos: fuera de "
+        f"[{inferior:.1f}%, {superior:.1f}%] (P25 − 1,5·RIC, P75 + 1,5·RIC) de los filtros actuales."
+    )
+
+@medido
+def crear_descarga_datos(datos, filtros, clave):
+    """Genera la exportación de los datos filtrados solo cuando se pide"""
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        formato = st.selectbox("Formato de descarga:", list(FORMATOS), key="formato_descarga")
+    
+    extension, mime = FORMATOS[formato]
+    
+    # Si este estado de filtros ya se exportó se reutiliza el fichero generado. El botón de
+    # descarga lee el fichero entero, así que solo se crea en la ejecución en que se pide
+    ruta = exportacion_disponible(clave, formato)
+    with col2:
+        st.write("")
+        st.write("")
+        if ruta is None:
+            pedida = st.button("⚙️ Preparar descarga", key="preparar_descarga")
+            if pedida:
+                with st.spinner("Generando fichero..."), medir('exportar'):
+                    ruta = datos.exportar(filtros, formato, clave)
+        else:
+            pedida = st.button("📥 Preparar enlace de descarga", key="enlace_descarga")
+    
+    if pedida:
+        with open(ruta, 'rb') as f:
+            st.download_button(
+                label=f"📥 Descargar datos filtrados ({formato})",
+                data=f,
+                file_name=f"licitaciones_aena_filtradas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+                mime=mime
+            )
+
+def crear_buscador(con_relevancia=True):
+    """Buscador de contratos; devuelve el término y si se ordena por relevancia"""
     st.markdown("### 🔍 Buscar Contrato")
     search_term = st.text_input(
         "Buscar por número de expediente, objeto del contrato, aeropuerto o empresa adjudicataria:",
         placeholder="Ej: mantenimiento, Madrid, ACCIONA..."
     )
+    por_relevancia = con_relevancia and st.checkbox("Ordenar resultados por relevancia", value=False)
+    return search_term, por_relevancia
+
+def crear_controles_tabla(n_filas):
+    """Controles de ordenación y paginación; devuelve columna, sentido, tamaño y página"""
+    col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+    
+    with col1:
+        columna_orden = st.selectbox("Ordenar por:", ['(sin ordenar)'] + COLUMNAS_TABLA, key="tabla_orden")
+    
+    with col2:
+        ascendente = st.selectbox("Sentido:", ["Ascendente", "Descendente"], key="tabla_sentido") == "Ascendente"
+    
+    with col3:
+        tamano_pagina = st.selectbox("Filas por página:", TAMANOS_PAGINA, index=1, key="tabla_tamano")
+    
+    n_paginas = numero_paginas(n_filas, tamano_pagina)
+    with col4:
+        pagina = st.number_input(f"Página (de {n_paginas}):", min_value=1, max_value=n_paginas, value=1, step=1, key="tabla_pagina")
+    
+    return columna_orden, ascendente, tamano_pagina, min(pagina, n_paginas)
+
+@fragmento
+@medido
+def crear_tabla_datos(datos, filtros, clave_descarga):
+    """Crea tabla de datos interactiva, paginada y ordenada en el servidor"""
+    st.subheader("📋 Datos Detallados")
+    
+    df = datos.df
+    posiciones = aplicar_filtros(datos, filtros)
     
-    # Filtrar datos según la búsqueda
+    if len(posiciones) == 0:
+        st.warning("No hay datos para mostrar con los filtros seleccionados.")
+        return
+    
+    # Mostrar estadísticas de filtros
+    st.info(f"📊 Mostrando {len(posiciones)} licitaciones")
+    
+    # Buscador de contratos
+    search_term, por_relevancia = crear_buscador()
+    
+    # Filtrar datos según la búsqueda (índice invertido, sin distinguir acentos)
     if search_term:
-        search_term_lower = search_term.lower()
-        mask = (
-            df_filtrado['Número de expediente'].astype(str).str.lower().str.contains(search_term_lower, na=False) |
-            df_filtrado['Objeto del Contrato'].astype(str).str.lower().str.contains(search_term_lower, na=False) |
-            df_filtrado['Aeropuerto'].astype(str).str.lower().str.contains(search_term_lower, na=False) |
-            df_filtrado['Adjudicatario licitación/lote'].astype(str).str.lower().str.contains(search_term_lower, na=False)
-        )
-        df_busqueda = df_filtrado[mask]
-        st.success(f"🔍 Encontrados {len(df_busqueda)} contratos que coinciden con '{search_term}'")
+        with medir('buscar'):
+            filas = datos.filas(filtros, search_term, por_relevancia, sesion=obtener_sesion(datos.version))
+        st.success(f"🔍 Encontrados {len(filas)} contratos que coinciden con '{search_term}'")
     else:
-        df_busqueda = df_filtrado
-    
-    # Tabla de datos
-    fecha_col = 'Fecha presentación licitación'
-    columnas_mostrar = [
-        'Aeropuerto', 'Número de expediente', 'Objeto del Contrato',
-        'Presupuesto base sin impuestos', 'Importe adjudicación sin impuestos licitación/lote',
-        fecha_col, 'Adjudicatario licitación/lote', 'Porcentaje_Ahorro'
-    ]
-    
-    df_mostrar = df_busqueda[columnas_mostrar].copy()
-    df_mostrar['Presupuesto base sin impuestos'] = df_mostrar['Presupuesto base sin impuestos'].apply(lambda x: f"{x:,.0f} €")
-    df_mostrar['Importe adjudicación sin impuestos licitación/lote'] = df_mostrar['Importe adjudicación sin impuestos licitación/lote'].apply(lambda x: f"{x:,.0f} €")
-    df_mostrar[fecha_col] = df_mostrar[fecha_col].dt.strftime('%d/%m/%Y')
-    df_mostrar['Porcentaje_Ahorro'] = df_mostrar['Porcentaje_Ahorro'].apply(lambda x: f"{x:.1f}%")
+        filas = posiciones
+    
+    # Controles de ordenación y paginación
+    columna_orden, ascendente, tamano_pagina, pagina = crear_controles_tabla(len(filas))
+    
+    # La ordenación se memoriza en la sesión para que pasar de página no reordene
+    if columna_orden != '(sin ordenar)':
+        clave_orden = (clave_descarga, search_term, por_relevancia, columna_orden, ascendente)
+        memoria = st.session_state.get('tabla_ordenada')
+        registrar_cache('tabla_ordenada', acierto=memoria is not None and memoria[0] == clave_orden)
+        if memoria is None or memoria[0] != clave_orden:
+            with medir('ordenar_tabla'):
+                memoria = (clave_orden, ordenar_posiciones(df, filas, columna_orden, ascendente))
+            st.session_state.tabla_ordenada = memoria
+        filas = memoria[1]
+    
+    # Solo se extraen y formatean las filas de la página visible
+    df_mostrar = formatear_pagina(df.iloc[posiciones_pagina(filas, pagina, tamano_pagina)])
     
     st.dataframe(
         df_mostrar,
@@ -583,74 +863,157 @@ def crear_tabla_datos(df_filtrado):
         height=400
     )
     
-    # Botón de descarga
-    csv = df_filtrado.to_csv(index=False, encoding='utf-8-sig')
-    st.download_button(
-        label="📥 Descargar datos filtrados (CSV)",
-        data=csv,
-        file_name=f"licitaciones_aena_filtradas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-        mime="text/csv"
-    )
-
-
+    # Descarga bajo demanda (el fichero no se genera en cada interacción)
+    crear_descarga_datos(datos, filtros, clave_descarga)
 
+@fragmento
+@medido
+def crear_tabla_datos_sql(datos, filtros, clave_descarga):
+    """Crea la tabla de datos con el backend SQL: recuento, búsqueda, orden y página se resuelven en DuckDB"""
+    st.subheader("📋 Datos Detallados")
+    
+    n_filas = datos.contar(filtros)
+    
+    if n_filas == 0:
+        st.warning("No hay datos para mostrar con los filtros seleccionados.")
+        return
+    
+    # Mostrar estadísticas de filtros
+    st.info(f"📊 Mostrando {n_filas} licitaciones")
+    
+    # Buscador de contratos (coincidencia literal sin distinguir acentos; sin orden por relevancia)
+    search_term, _ = crear_buscador(con_relevancia=False)
+    if search_term:
+        with medir('buscar'):
+            n_filas = datos.contar(filtros, search_term)
+        st.success(f"🔍 Encontrados {n_filas} contratos que coinciden con '{search_term}'")
+    
+    # Controles de ordenación y paginación
+    columna_orden, ascendente, tamano_pagina, pagina = crear_controles_tabla(n_filas)
+    
+    # Solo se leen y formatean las filas de la página visible
+    with medir('pagina_sql'):
+        df_pagina = datos.pagina(filtros, search_term, None if columna_orden == '(sin ordenar)' else columna_orden,
+                                 ascendente, pagina, tamano_pagina)
+    
+    st.dataframe(
+        formatear_pagina(df_pagina),
+        use_container_width=True,
+        height=400
+    )
+    
+    # Descarga bajo demanda (el fichero no se genera en cada interacción)
+    crear_descarga_datos(datos, filtros, clave_descarga)
 
+def crear_panel_rendimiento(ejecucion, cache):
+    """Panel opcional del sidebar con los tiempos y cachés de la ejecución actual"""
+    if not st.sidebar.toggle("⏱️ Panel de rendimiento", value=False, key="panel_rendimiento"):
+        return
+    
+    resumen = ejecucion.como_dict()
+    with st.sidebar.expander("⏱️ Rendimiento de esta ejecución", expanded=True):
+        st.metric("Tiempo total (ms)", f"{resumen['duracion_ms']:,.1f}")
+        # Las secciones anidadas (p. ej. figuras dentro de su pestaña) se incluyen en la de fuera
+        tiempos = pd.DataFrame.from_dict(resumen['secciones'], orient='index').sort_values('ms', ascending=False)
+        st.dataframe(tiempos.rename(columns={'llamadas': 'Llamadas'}), use_container_width=True)
+        if resumen['caches']:
+            caches = pd.DataFrame.from_dict(resumen['caches'], orient='index')
+            st.dataframe(caches.rename(columns={'aciertos': 'Aciertos', 'fallos': 'Fallos'}), use_container_width=True)
+        # Acumulado de la caché de consultas compartida desde que arrancó el proceso
+        estadisticas = cache.estadisticas.como_dict()
+        st.metric("Aciertos caché de consultas", f"{estadisticas['proporcion_aciertos']:.1%}")
+        st.caption(
+            f"{estadisticas['aciertos']:,} aciertos · {estadisticas['fallos']:,} fallos · "
+            f"{estadisticas['caducados']:,} caducados · {estadisticas['desalojos']:,} desalojos"
+        )
+        st.download_button(
+            label="📥 Métricas del proceso (Prometheus)",
+            data=metricas.texto_prometheus(),
+            file_name="metricas_aena.prom",
+            mime="text/plain"
+        )
 
-def main():
-    """Función principal del dashboard"""
+def dibujar_dashboard():
+    """Dibuja el dashboard completo"""
     
-    # Cargar datos
-    df = cargar_datos()
+    # Cargar datos: la versión vigente se usa durante toda la ejecución
+    with medir('cargar_datos'):
+        datos = cargar_datos()
     
-    if df is None:
+    if datos is None:
         st.error("❌ No se pudieron cargar los datos. Verifica que el archivo existe.")
         return
     
+    version, opciones, motor = datos.version, datos.opciones, datos.motor
+    
     # Crear filtros en sidebar
-    aeropuerto_seleccionado, empresa_seleccionada, rango_fechas, rango_importes = crear_filtros_sidebar(df)
+    aeropuertos_seleccionados, empresas_seleccionadas, rango_fechas, rango_importes = crear_filtros_sidebar(opciones)
     
-    # Aplicar filtros
-    df_filtrado = aplicar_filtros(df, aeropuerto_seleccionado, empresa_seleccionada, rango_fechas, rango_importes)
+    # Estado de filtros; las filas solo se seleccionan cuando una sección las necesita
+    filtros = Filtros(aeropuertos_seleccionados, empresas_seleccionadas, tuple(rango_fechas), tuple(rango_importes))
+    
+    # Agregados compartidos por todas las pestañas (memorizados por estado de filtros)
+    with medir('agregados', cache='agregados'):
+        agregados = motor.agregados(filtros, sesion=obtener_sesion(version))
     
     # Métricas principales (ahora con datos filtrados)
-    crear_metricas_principales(df_filtrado)
+    crear_metricas_principales(agregados)
     
     st.markdown("---")
     
-    # Pestañas para organizar el contenido
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
-        "📅 Evolución Temporal", 
-        "🏢 Análisis Aeropuertos", 
-        "🏢 Análisis Empresas",
-        "📅 Análisis Mensual",
-        "📋 Datos"
-    ])
-    
-    with tab1:
-        crear_grafico_evolucion_temporal(df_filtrado)
-    
-    with tab2:
-        crear_analisis_aeropuertos(df_filtrado)
-    
-    with tab3:
-        crear_analisis_empresas(df_filtrado)
-    
-    with tab4:
-        crear_analisis_mensual(df_filtrado)
+    # Secciones del dashboard y la función que dibuja cada una
+    secciones = {
+        "📅 Evolución Temporal": lambda: crear_grafico_evolucion_temporal(agregados, motor, filtros),
+        "🏢 Análisis Aeropuertos": lambda: crear_analisis_aeropuertos(agregados, motor, filtros),
+        "🏢 Análisis Empresas": lambda: crear_analisis_empresas(agregados, motor, filtros),
+        "📅 Análisis Mensual": lambda: crear_analisis_mensual(agregados, motor, filtros),
+        "📉 Distribución %Baja": lambda: crear_analisis_distribucion(motor, filtros),
+        "📋 Datos": lambda: (crear_tabla_datos if datos.df is not None else crear_tabla_datos_sql)(
+            datos, filtros, clave_exportacion(version, filtros)),
+    }
+    
+    modo_perezoso = st.sidebar.toggle(
+        "⚡ Calcular solo la pestaña visible",
+        value=True,
+        key="modo_perezoso",
+        help="st.tabs calcula todas las pestañas en cada interacción; este modo solo calcula la seleccionada"
+    )
     
-    with tab5:
-        crear_tabla_datos(df_filtrado)
+    if modo_perezoso:
+        # Selector con aspecto de pestañas: solo se ejecuta la sección elegida
+        seccion = st.radio(
+            "Sección:",
+            list(secciones),
+            horizontal=True,
+            key="seccion_activa",
+            label_visibility="collapsed"
+        )
+        secciones[seccion]()
+    else:
+        # Pestañas para organizar el contenido
+        for tab, dibujar in zip(st.tabs(list(secciones)), secciones.values()):
+            with tab:
+                dibujar()
     
     # Footer
     st.markdown("---")
     st.markdown(
-        """
+        f"""
         <div style='text-align: center; color: #666;'>
-        <p>📊 Dashboard creado con Streamlit | Datos: AENA 2024 | ✈️ Análisis de Licitaciones</p>
+        <p>📊 Dashboard creado con Streamlit | Datos: AENA {datos.periodo} | ✈️ Análisis de Licitaciones</p>
         </div>
         """,
         unsafe_allow_html=True
     )
 
+def main():
+    """Función principal del dashboard: dibuja el dashboard y registra el rendimiento de la ejecución"""
+    iniciar_ejecucion()
+    try:
+        dibujar_dashboard()
+        crear_panel_rendimiento(ejecucion_actual(), obtener_cache_consultas())
+    finally:
+        finalizar_ejecucion(RUTA_METRICAS_PROM)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,98 @@
+"""
+Esquema compacto en memoria del conjunto de licitaciones.
+
+Las columnas con pocos valores distintos se guardan como categorías, los
+textos libres en buffers de Arrow y los porcentajes en float32; los importes
+se mantienen en float64 porque se suman. Las columnas derivadas de la fecha
+(mes, año, trimestre, nombres de mes y de día) no se guardan: se calculan
+bajo demanda con ``columna_derivada``.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from indice_filtros import FECHA_COL, AEROPUERTO_COL, EMPRESA_COL, IMPORTE_COL
+
+PRESUPUESTO_COL = 'Presupuesto base sin impuestos'
+
+COLUMNAS_CATEGORICAS = [AEROPUERTO_COL, EMPRESA_COL, 'Estado', 'Órgano de Contratación']
+COLUMNAS_TEXTO = ['Link licitación', 'Número de expediente', 'Objeto del Contrato']
+COLUMNAS_FLOAT32 = ['%baja', 'Porcentaje_Ahorro']
+
+COLUMNAS_DERIVADAS = ['Mes', 'Año', 'Trimestre', 'Día_Semana', 'Nombre_Mes', 'Diferencia_Importe']
+
+MESES = ['January', 'February', 'March', 'April', 'May', 'June',
+         'July', 'August', 'September', 'October', 'November', 'December']
+DIAS_SEMANA = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Presupuesto de memoria por año de datos cargado (MB)
+PRESUPUESTO_MEMORIA_MB_ANIO = float(os.environ.get('AENA_MEMORIA_MB_ANIO', '64'))
+
+
+def preparar_dataset(df):
+    """Tipa y compacta los datos leídos del almacén y añade el porcentaje de ahorro"""
+    df[FECHA_COL] = pd.to_datetime(df[FECHA_COL])
+
+    # Usar la columna %baja existente si está disponible, sino calcularla
+    if '%baja' in df.columns:
+        # Convertir de decimal a porcentaje si es necesario
+        if df['%baja'].max() <= 1:
+            df['Porcentaje_Ahorro'] = df['%baja'] * 100
+        else:
+            df['Porcentaje_Ahorro'] = df['%baja']
+    else:
+        df['Porcentaje_Ahorro'] = (columna_derivada(df, 'Diferencia_Importe') / df[PRESUPUESTO_COL]) * 100
+
+    for col in COLUMNAS_CATEGORICAS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    for col in COLUMNAS_TEXTO:
+        if col in df.columns:
+            df[col] = df[col].astype('string[pyarrow]')
+    for col in COLUMNAS_FLOAT32:
+        if col in df.columns:
+            df[col] = df[col].astype(np.float32)
+    return df
+
+
+def columna_derivada(df, nombre):
+    """Calcula bajo demanda una de las columnas derivadas (COLUMNAS_DERIVADAS)"""
+    fechas = df[FECHA_COL]
+    if nombre == 'Mes':
+        return fechas.dt.month.astype('Int8')
+    if nombre == 'Año':
+        return fechas.dt.year.astype('Int16')
+    if nombre == 'Trimestre':
+        return fechas.dt.quarter.astype('Int8')
+    if nombre == 'Nombre_Mes':
+        codigos = fechas.dt.month.fillna(0).astype(np.int8) - 1
+        return pd.Series(pd.Categorical.from_codes(codigos, categories=MESES, ordered=True), index=df.index, name=nombre)
+    if nombre == 'Día_Semana':
+        codigos = fechas.dt.dayofweek.fillna(-1).astype(np.int8)
+        return pd.Series(pd.Categorical.from_codes(codigos, categories=DIAS_SEMANA, ordered=True), index=df.index, name=nombre)
+    if nombre == 'Diferencia_Importe':
+        return df[PRESUPUESTO_COL] - df[IMPORTE_COL]
+    raise KeyError(f"Columna derivada desconocida: {nombre}")
+
+
+def con_columnas_derivadas(df, nombres=COLUMNAS_DERIVADAS[:-1]):
+    """Copia del DataFrame con las columnas derivadas añadidas (p. ej. para exportar)"""
+    return df.assign(**{nombre: columna_derivada(df, nombre) for nombre in nombres})
+
+
+def informe_memoria(df, presupuesto_mb=PRESUPUESTO_MEMORIA_MB_ANIO):
+    """Memoria ocupada por año de datos y si respeta el presupuesto por año
+
+    La memoria de las categorías y de los buffers se reparte entre los años en
+    proporción a sus filas.
+    """
+    total = df.memory_usage(deep=True).sum()
+    filas_por_anio = columna_derivada(df, 'Año').value_counts(dropna=False).sort_index()
+    informe = pd.DataFrame({
+        'Año': filas_por_anio.index,
+        'Filas': filas_por_anio.to_numpy(),
+        'MB': filas_por_anio.to_numpy() * total / max(len(df), 1) / 1e6,
+    })
+    informe['Dentro del presupuesto'] = informe['MB'] <= presupuesto_mb
+    return informe
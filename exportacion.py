@@ -0,0 +1,124 @@
+"""
+Exportación de los datos filtrados bajo demanda.
+
+El fichero solo se genera cuando el usuario lo pide y se escribe a disco por
+bloques de filas, sin construir nunca el CSV completo en memoria. Cada
+artefacto se guarda con una clave derivada de la versión de los datos y del
+estado de filtros, de modo que volver a exportar lo mismo reutiliza el
+fichero ya generado.
+"""
+import gzip
+import hashlib
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from almacen_datos import DIR_CACHE
+from cache_consultas import clave_filtros
+from esquema_datos import con_columnas_derivadas
+
+DIR_EXPORTACIONES = os.path.join(DIR_CACHE, 'exportaciones')
+MAX_EXPORTACIONES = 20
+TAMANO_BLOQUE = 50_000
+
+# Formato -> (extensión, tipo MIME)
+FORMATOS = {
+    'CSV': ('csv', 'text/csv'),
+    'CSV comprimido (gzip)': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def clave_exportacion(version, filtros):
+    """Clave estable de un estado de filtros para nombrar su artefacto (la misma para estados equivalentes)"""
+    return hashlib.sha256(repr((version, clave_filtros(filtros))).encode()).hexdigest()[:20]
+
+
+def iterar_bloques(df, posiciones, tamano_bloque=TAMANO_BLOQUE):
+    """Extrae las filas seleccionadas en bloques, con sus columnas derivadas, sin materializarlas todas a la vez"""
+    for inicio in range(0, len(posiciones), tamano_bloque):
+        yield con_columnas_derivadas(df.iloc[posiciones[inicio:inicio + tamano_bloque]])
+
+
+def iterar_csv(df, posiciones, tamano_bloque=TAMANO_BLOQUE):
+    """Genera el CSV en trozos de bytes (UTF-8 con BOM para que Excel respete los acentos)"""
+    yield '\ufeff'.encode('utf-8')
+    for i, bloque in enumerate(iterar_bloques(df, posiciones, tamano_bloque)):
+        yield bloque.to_csv(index=False, header=(i == 0)).encode('utf-8')
+    if len(posiciones) == 0:
+        yield con_columnas_derivadas(df.iloc[:0]).to_csv(index=False).encode('utf-8')
+
+
+def _esquema_parquet(df):
+    """Esquema de la exportación: columnas del conjunto completo más las derivadas"""
+    # Se infiere del conjunto completo porque un bloque podría tener columnas vacías
+    esquema = pa.Schema.from_pandas(df, preserve_index=False).remove_metadata()
+    vacias = con_columnas_derivadas(df.iloc[:0])
+    for nombre in vacias.columns.difference(df.columns, sort=False):
+        esquema = esquema.append(pa.Schema.from_pandas(vacias[[nombre]], preserve_index=False).field(nombre))
+    return esquema
+
+
+def escribir_exportacion(df, posiciones, formato, ruta, tamano_bloque=TAMANO_BLOQUE):
+    """Escribe las filas seleccionadas en el formato pedido, bloque a bloque"""
+    if formato == 'CSV':
+        with open(ruta, 'wb') as f:
+            for trozo in iterar_csv(df, posiciones, tamano_bloque):
+                f.write(trozo)
+    elif formato == 'CSV comprimido (gzip)':
+        with gzip.open(ruta, 'wb') as f:
+            for trozo in iterar_csv(df, posiciones, tamano_bloque):
+                f.write(trozo)
+    elif formato == 'Parquet':
+        esquema = _esquema_parquet(df)
+        with pq.ParquetWriter(ruta, esquema) as escritor:
+            for bloque in iterar_bloques(df, posiciones, tamano_bloque):
+                escritor.write_table(pa.Table.from_pandas(bloque, schema=esquema, preserve_index=False))
+    else:
+        raise ValueError(f"Formato de exportación desconocido: {formato}")
+
+
+def ruta_exportacion(clave, formato, dir_exportaciones=DIR_EXPORTACIONES):
+    """Ruta del artefacto de una clave y formato"""
+    extension = FORMATOS[formato][0]
+    return os.path.join(dir_exportaciones, f"{clave}.{extension}")
+
+
+def exportacion_disponible(clave, formato, dir_exportaciones=DIR_EXPORTACIONES):
+    """Ruta del artefacto si ya se generó, o None"""
+    ruta = ruta_exportacion(clave, formato, dir_exportaciones)
+    return ruta if os.path.exists(ruta) else None
+
+
+def exportar(df, posiciones, formato, clave, dir_exportaciones=DIR_EXPORTACIONES):
+    """Genera (o reutiliza) el artefacto de exportación y devuelve su ruta"""
+    ruta = exportacion_disponible(clave, formato, dir_exportaciones)
+    if ruta is not None:
+        # Se marca como usado para que la purga conserve los más recientes
+        os.utime(ruta)
+        return ruta
+
+    os.makedirs(dir_exportaciones, exist_ok=True)
+    ruta = ruta_exportacion(clave, formato, dir_exportaciones)
+    tmp = ruta + '.tmp'
+    try:
+        escribir_exportacion(df, posiciones, formato, tmp)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, ruta)
+    purgar_exportaciones(dir_exportaciones)
+    return ruta
+
+
+def purgar_exportaciones(dir_exportaciones=DIR_EXPORTACIONES, maximo=MAX_EXPORTACIONES):
+    """Elimina los artefactos menos usados por encima del máximo"""
+    rutas = [os.path.join(dir_exportaciones, f) for f in os.listdir(dir_exportaciones) if not f.endswith('.tmp')]
+    rutas.sort(key=os.path.getmtime, reverse=True)
+    for ruta in rutas[maximo:]:
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,55 @@
+"""
+Trazas de líneas para series largas.
+
+Por debajo del umbral de puntos las series se dibujan como siempre (SVG con
+marcadores). Por encima se usan trazas WebGL (``Scattergl``) y la serie se
+reduce en el servidor con el algoritmo Largest-Triangle-Three-Buckets, que
+conserva la forma visual (picos y valles) enviando al navegador un número
+acotado de puntos.
+"""
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+
+UMBRAL_PUNTOS = int(os.environ.get('AENA_UMBRAL_PUNTOS', '1000'))
+MAX_PUNTOS = int(os.environ.get('AENA_MAX_PUNTOS', '1500'))
+
+
+def lttb(x, y, n_puntos):
+    """Índices de los n_puntos elegidos por Largest-Triangle-Three-Buckets (x creciente)"""
+    n = len(x)
+    if n_puntos >= n or n_puntos < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # El primer y el último punto se conservan; el resto se reparte en n_puntos - 2 tramos
+    limites = np.linspace(1, n - 1, n_puntos - 1).astype(np.int64)
+    indices = np.empty(n_puntos, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    elegido = 0
+    for i in range(n_puntos - 2):
+        inicio, fin = limites[i], limites[i + 1]
+        # Vértice del triángulo en el tramo siguiente: su punto medio (o el último punto)
+        if i + 2 < len(limites):
+            x_sig = x[fin:limites[i + 2]].mean()
+            y_sig = y[fin:limites[i + 2]].mean()
+        else:
+            x_sig, y_sig = x[-1], y[-1]
+        areas = np.abs((x[elegido] - x_sig) * (y[inicio:fin] - y[elegido])
+                       - (x[elegido] - x[inicio:fin]) * (y_sig - y[elegido]))
+        elegido = inicio + int(np.argmax(areas))
+        indices[i + 1] = elegido
+    return indices
+
+
+def traza_linea(x, y, umbral=UMBRAL_PUNTOS, max_puntos=MAX_PUNTOS, **propiedades):
+    """Traza de línea: SVG con marcadores hasta el umbral, WebGL reducida con LTTB por encima"""
+    if len(x) <= umbral:
+        return go.Scatter(x=x, y=y, mode='lines+markers', **propiedades)
+    x = np.asarray(x)
+    y = np.asarray(y)
+    seleccion = lttb(x.astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x, y, max_puntos)
+    propiedades.pop('marker', None)
+    return go.Scattergl(x=x[seleccion], y=y[seleccion], mode='lines', **propiedades)
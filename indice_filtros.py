@@ -0,0 +1,246 @@
+"""
+Índice de filtrado de licitaciones.
+
+Se construye una vez por versión de los datos y resuelve los filtros del
+dashboard sin copiar el DataFrame: mapas de bits de las filas de cada
+aeropuerto y de cada empresa (códigos categóricos), y fechas e importes
+ordenados para resolver los rangos por búsqueda binaria. Las selecciones
+múltiples de aeropuertos o empresas se combinan con operaciones OR/AND sobre
+los mapas (ver mapas_bits.py). El resultado son posiciones de fila.
+
+Las fechas se comparan siempre como enteros int64 en nanosegundos: los
+límites del rango se convierten una vez por consulta y ninguna fase del
+filtrado crea objetos de Python por fila.
+"""
+import functools
+from collections import namedtuple
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from mapas_bits import MapaBits
+
+FECHA_COL = 'Fecha presentación licitación'
+AEROPUERTO_COL = 'Aeropuerto'
+EMPRESA_COL = 'Adjudicatario licitación/lote'
+IMPORTE_COL = 'Importe adjudicación sin impuestos licitación/lote'
+
+NS_POR_DIA = 86_400 * 10**9
+
+# Estado de los filtros del sidebar; es hashable para usarlo como clave de caché.
+# ``aeropuertos`` y ``empresas`` son tuplas ordenadas de valores (vacía: todos)
+Filtros = namedtuple('Filtros', ['aeropuertos', 'empresas', 'rango_fechas', 'rango_importes'])
+
+
+def normalizar_seleccion(valores):
+    """Tupla ordenada y sin repetidos de los valores elegidos; acepta un valor suelto o None (todos)"""
+    if valores is None:
+        return ()
+    if isinstance(valores, str):
+        valores = (valores,)
+    return tuple(sorted(set(valores)))
+
+
+class ListasPorValor:
+    """Filas de cada valor distinto de una columna, agrupadas por código categórico"""
+
+    def __init__(self, serie):
+        codigos, valores = pd.factorize(serie, sort=True)
+        self.codigos = codigos.astype(np.int32)
+        self.valores = valores.tolist()
+        self._codigo_de = {valor: i for i, valor in enumerate(self.valores)}
+        # Orden estable: dentro de cada valor las posiciones quedan ordenadas
+        self._orden = np.argsort(self.codigos, kind='stable')
+        conteos = np.bincount(self.codigos[self.codigos >= 0], minlength=len(self.valores))
+        n_nulos = int((self.codigos < 0).sum())
+        self._inicios = n_nulos + np.concatenate(([0], np.cumsum(conteos)))
+        # Los valores frecuentes se guardan además como bitset; el resto usa su lista de filas
+        self.n_filas = len(self.codigos)
+        self._mapas = {}
+        for codigo in np.flatnonzero(conteos):
+            mapa = MapaBits.desde_posiciones(self.filas(codigo), self.n_filas)
+            if mapa.es_denso():
+                self._mapas[int(codigo)] = mapa
+
+    def codigo(self, valor):
+        """Código del valor, o -1 si no aparece en los datos"""
+        return self._codigo_de.get(valor, -1)
+
+    def filas(self, codigo):
+        """Posiciones ordenadas de las filas con ese código"""
+        if codigo < 0:
+            return np.empty(0, dtype=np.intp)
+        return self._orden[self._inicios[codigo]:self._inicios[codigo + 1]]
+
+    def mapa(self, codigo):
+        """Mapa de bits de las filas con ese código"""
+        if codigo in self._mapas:
+            return self._mapas[codigo]
+        return MapaBits(self.n_filas, posiciones=self.filas(codigo))
+
+    def seleccion(self, valores):
+        """Mapa de bits de las filas con cualquiera de los valores (unión)"""
+        return MapaBits.union([self.mapa(self.codigo(v)) for v in valores], self.n_filas)
+
+    def contiene(self, posiciones, valores):
+        """Máscara de las posiciones cuyo valor es alguno de los indicados"""
+        codigos = [c for c in map(self.codigo, valores) if c >= 0]
+        return np.isin(self.codigos[posiciones], codigos)
+
+
+class RangoOrdenado:
+    """Columna numérica ordenada para resolver rangos por búsqueda binaria"""
+
+    def __init__(self, valores):
+        self.valores = valores
+        self._orden = np.argsort(valores, kind='stable')
+        self._ordenados = valores[self._orden]
+
+    def limites(self, desde, hasta, hasta_incluido=True):
+        """Índices [inicio, fin) del rango dentro de los valores ordenados"""
+        inicio = np.searchsorted(self._ordenados, desde, side='left')
+        fin = np.searchsorted(self._ordenados, hasta, side='right' if hasta_incluido else 'left')
+        return inicio, max(inicio, fin)
+
+    def filas(self, inicio, fin):
+        """Posiciones ordenadas de las filas entre dos índices de los valores ordenados"""
+        return np.sort(self._orden[inicio:fin])
+
+
+def _limite_ns(valor, final):
+    """Límite de un extremo del rango en nanosegundos int64
+
+    Una fecha sin hora (``date``, ``datetime64[D]`` o texto 'AAAA-MM-DD') abarca
+    el día completo; un instante (``datetime``, ``Timestamp`` o ``datetime64``
+    con hora) se toma tal cual. El extremo final es inclusivo en ambos casos.
+    """
+    if isinstance(valor, datetime):
+        instante = pd.Timestamp(valor).to_datetime64()
+    elif isinstance(valor, date):
+        instante = np.datetime64(valor, 'D')
+    else:
+        instante = np.datetime64(valor)
+    if np.datetime_data(instante.dtype)[0] in ('Y', 'M', 'W', 'D'):
+        inicio = int(instante.astype('datetime64[D]').astype('datetime64[ns]').astype(np.int64))
+        return inicio + NS_POR_DIA if final else inicio
+    ns = int(instante.astype('datetime64[ns]').astype(np.int64))
+    return ns + 1 if final else ns
+
+
+def limites_fecha_ns(rango_fechas):
+    """Convierte un rango de fechas o instantes inclusivo en límites int64 [desde, hasta) en nanosegundos"""
+    return _limite_ns(rango_fechas[0], final=False), _limite_ns(rango_fechas[-1], final=True)
+
+
+class IndiceFiltros:
+    """Índice construido una vez por versión de los datos para resolver los filtros"""
+
+    def __init__(self, df):
+        self.n_filas = len(df)
+        self.aeropuertos = ListasPorValor(df[AEROPUERTO_COL])
+        self.empresas = ListasPorValor(df[EMPRESA_COL])
+        # NaT se representa como el mínimo int64 y queda fuera de cualquier rango
+        self.fechas = RangoOrdenado(df[FECHA_COL].to_numpy(dtype='datetime64[ns]').view(np.int64))
+        # Los NaN quedan al final del orden y nunca caen dentro de un rango
+        self.importes = RangoOrdenado(df[IMPORTE_COL].to_numpy(dtype=np.float64))
+
+    def seleccion(self, aeropuertos, empresas):
+        """Mapa de bits de las filas de los aeropuertos y empresas elegidos, o None si no se restringe ninguno"""
+        mapa = None
+        if aeropuertos:
+            mapa = self.aeropuertos.seleccion(aeropuertos)
+        if empresas:
+            mapa_empresas = self.empresas.seleccion(empresas)
+            mapa = mapa_empresas if mapa is None else mapa & mapa_empresas
+        return mapa
+
+    def filtrar(self, aeropuertos, empresas, rango_fechas, rango_importes):
+        """Devuelve las posiciones ordenadas de las filas que cumplen los filtros"""
+        restricciones = []
+
+        mapa = self.seleccion(aeropuertos, empresas)
+        if mapa is not None:
+            restricciones.append((mapa.cuenta(), mapa.posiciones, mapa.contiene))
+
+        if rango_fechas:
+            desde, hasta = limites_fecha_ns(rango_fechas)
+            inicio, fin = self.fechas.limites(desde, hasta, hasta_incluido=False)
+            restricciones.append((fin - inicio, lambda i=inicio, j=fin: self.fechas.filas(i, j),
+                                  lambda pos, a=desde, b=hasta: (self.fechas.valores[pos] >= a) & (self.fechas.valores[pos] < b)))
+
+        importe_min, importe_max = rango_importes
+        inicio, fin = self.importes.limites(importe_min, importe_max)
+        restricciones.append((fin - inicio, lambda i=inicio, j=fin: self.importes.filas(i, j),
+                              lambda pos, a=importe_min, b=importe_max: (self.importes.valores[pos] >= a) & (self.importes.valores[pos] <= b)))
+
+        # Se parte de la restricción más selectiva y el resto se comprueba solo sobre sus filas
+        restricciones.sort(key=lambda r: r[0])
+        posiciones = restricciones[0][1]()
+        for _, _, comprobar in restricciones[1:]:
+            if len(posiciones) == 0:
+                break
+            posiciones = posiciones[comprobar(posiciones)]
+        return posiciones
+
+    def comprobar(self, posiciones, aeropuertos, empresas, rango_fechas, rango_importes):
+        """Máscara de las posiciones que cumplen los filtros; sirve para refinar un resultado anterior"""
+        mascara = np.ones(len(posiciones), dtype=bool)
+        if aeropuertos:
+            mascara &= self.aeropuertos.contiene(posiciones, aeropuertos)
+        if empresas:
+            mascara &= self.empresas.contiene(posiciones, empresas)
+        if rango_fechas:
+            desde, hasta = limites_fecha_ns(rango_fechas)
+            fechas = self.fechas.valores[posiciones]
+            mascara &= (fechas >= desde) & (fechas < hasta)
+        importes = self.importes.valores[posiciones]
+        mascara &= (importes >= rango_importes[0]) & (importes <= rango_importes[1])
+        return mascara
+
+
+class OpcionesFiltros:
+    """Opciones ordenadas de los filtros del sidebar y sus dependencias aeropuerto-empresa"""
+
+    def __init__(self, df, indice):
+        self.indice = indice
+        aeropuertos = indice.aeropuertos
+        empresas = indice.empresas
+
+        # Solo cuentan las empresas adjudicatarias informadas
+        self._empresa_valida = np.array([bool(e) for e in empresas.valores], dtype=bool)
+
+        self.aeropuertos = list(aeropuertos.valores)
+        self.empresas = [e for e, valida in zip(empresas.valores, self._empresa_valida) if valida]
+
+        # Opciones dependientes de la selección, memorizadas por selección (tuplas: no se pueden modificar)
+        self.empresas_disponibles = functools.lru_cache(maxsize=256)(self._empresas_disponibles)
+        self.aeropuertos_disponibles = functools.lru_cache(maxsize=256)(self._aeropuertos_disponibles)
+
+        self.fecha_min = df[FECHA_COL].min()
+        self.fecha_max = df[FECHA_COL].max()
+        self.importe_min = float(df[IMPORTE_COL].min())
+        self.importe_max = float(df[IMPORTE_COL].max())
+
+    @staticmethod
+    def _presentes(listas, posiciones):
+        """Máscara de los códigos de una columna que aparecen en las posiciones"""
+        codigos = listas.codigos[posiciones]
+        return np.bincount(codigos[codigos >= 0], minlength=len(listas.valores)) > 0
+
+    def _empresas_disponibles(self, aeropuertos):
+        """Tupla de empresas con alguna licitación en los aeropuertos (tupla de la selección; vacía: todas)"""
+        if not aeropuertos:
+            return tuple(self.empresas)
+        filas = self.indice.aeropuertos.seleccion(aeropuertos).posiciones()
+        presentes = self._presentes(self.indice.empresas, filas) & self._empresa_valida
+        return tuple(self.indice.empresas.valores[c] for c in np.flatnonzero(presentes))
+
+    def _aeropuertos_disponibles(self, empresas):
+        """Tupla de aeropuertos en los que opera alguna de las empresas (tupla de la selección; vacía: todos)"""
+        if not empresas:
+            return tuple(self.aeropuertos)
+        filas = self.indice.empresas.seleccion(empresas).posiciones()
+        presentes = self._presentes(self.indice.aeropuertos, filas)
+        return tuple(self.indice.aeropuertos.valores[c] for c in np.flatnonzero(presentes))
+
@@ -0,0 +1,301 @@
+"""
+Informes sin interfaz gráfica a partir de los mismos cálculos del dashboard.
+
+Reutiliza el conjunto compartido, el índice de filtros y el motor de
+agregación para devolver las métricas, la evolución mensual y los rankings
+de un estado de filtros como datos planos (JSON o Parquet). Los lotes de
+muchos estados de filtros se reparten entre un grupo de procesos; cada
+proceso abre el conjunto mapeado en memoria y construye sus índices una vez.
+
+Uso desde línea de comandos:
+
+    python informes.py consultar --aeropuerto "MADRID-BARAJAS" --desde 2023-01-01
+    python informes.py lote --por aeropuerto --dir-salida informes --procesos 4
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from almacen_datos import DIR_CACHE, DIR_DATOS, PATRON_LIBROS, leer_manifiesto, sincronizar_almacen, version_almacen
+from agregaciones import MotorAgregaciones
+from busqueda import IndiceBusqueda, normalizar_texto
+from cache_consultas import clave_filtros
+from conjunto_datos import cargar_conjunto
+from exportacion import exportar
+from indice_filtros import Filtros, IndiceFiltros, OpcionesFiltros, normalizar_seleccion
+from instrumentacion import registrar_cache
+
+TOP_AEROPUERTOS = 10
+TOP_EMPRESAS = 15
+FORMATOS_INFORME = ['json', 'parquet']
+
+
+class Contexto:
+    """Datos, índices y motor de agregación de una versión del almacén"""
+
+    def __init__(self, manifiesto, dir_cache=DIR_CACHE, instantaneas=None, con_busqueda=False, cache=None):
+        self.version = version_almacen(manifiesto)
+        self.df = cargar_conjunto(manifiesto, os.path.join(dir_cache, 'conjuntos'), dir_cache)
+        self.indice = IndiceFiltros(self.df)
+        self.opciones = OpcionesFiltros(self.df, self.indice)
+        # Caché de consultas opcional (ver cache_consultas.py), compartida por el motor y las filas
+        self.cache = cache
+        self.motor = MotorAgregaciones(self.df, self.indice, instantaneas=instantaneas, cache=cache, version=self.version)
+        # El índice del buscador solo lo necesita la tabla del dashboard
+        self.indice_busqueda = IndiceBusqueda(self.df) if con_busqueda else None
+
+    def filtros(self, aeropuertos=(), empresas=(), desde=None, hasta=None,
+                importe_min=None, importe_max=None):
+        """Estado de filtros; lo que no se indica toma el valor inicial del sidebar
+
+        ``aeropuertos`` y ``empresas`` admiten un valor o varios (vacío: todos).
+        """
+        rango_fechas = (desde or self.opciones.fecha_min.date(), hasta or self.opciones.fecha_max.date())
+        rango_importes = (self.opciones.importe_min if importe_min is None else float(importe_min),
+                          self.opciones.importe_max if importe_max is None else float(importe_max))
+        return Filtros(normalizar_seleccion(aeropuertos), normalizar_seleccion(empresas), rango_fechas, rango_importes)
+
+    def aplicar_filtros(self, filtros):
+        """Posiciones de las filas seleccionadas por los filtros"""
+        return self.filas(filtros)
+
+    def filas(self, filtros, busqueda='', por_relevancia=False, sesion=None):
+        """Posiciones de las filas seleccionadas por los filtros y, si se indica, por la búsqueda
+
+        Con caché de consultas el resultado se memoriza por estado de filtros
+        normalizado y término de búsqueda; las posiciones devueltas son de solo lectura.
+        Con ``sesion`` (ver refinamiento.py), un estado más estricto que el último
+        de la sesión se evalúa solo sobre las filas de aquel.
+        """
+        clave_busqueda = clave_filtros(filtros, busqueda)
+        clave = ('filas', self.version, clave_busqueda, bool(busqueda) and por_relevancia)
+        posiciones = None
+        if self.cache is not None:
+            posiciones = self.cache.obtener(clave)
+            registrar_cache('filas', acierto=posiciones is not None)
+        if posiciones is None:
+            posiciones = self._evaluar_filas(filtros, busqueda, por_relevancia, clave_busqueda, sesion)
+            if self.cache is not None:
+                posiciones.setflags(write=False)
+                self.cache.guardar(clave, posiciones)
+        if sesion is not None:
+            ordenadas = np.sort(posiciones) if busqueda and por_relevancia else posiciones
+            sesion.recordar('busqueda' if busqueda else 'filas', clave_busqueda, ordenadas)
+        return posiciones
+
+    def _evaluar_filas(self, filtros, busqueda, por_relevancia, clave_busqueda, sesion):
+        """Posiciones de los filtros y la búsqueda, sobre el último resultado de la sesión si lo contiene"""
+        anterior = None
+        if sesion is not None:
+            # Con búsqueda se prefiere la última búsqueda de la sesión; si no, sus últimos filtros
+            anterior = (busqueda and sesion.anterior('busqueda', clave_busqueda)) or sesion.anterior('filas', clave_busqueda)
+        if anterior is None:
+            posiciones = self.indice.filtrar(*filtros)
+        else:
+            posiciones = anterior[1][self.indice.comprobar(anterior[1], *filtros)]
+        if not busqueda:
+            return posiciones
+        if anterior is not None and anterior[0][-1] and not por_relevancia:
+            # Las filas anteriores ya coinciden con un fragmento del término: basta la comprobación literal
+            return self.indice_busqueda.refinar(busqueda, posiciones)
+        return self.indice_busqueda.buscar(busqueda, posiciones, por_relevancia=por_relevancia)
+
+    def exportar(self, filtros, formato, clave):
+        """Genera (o reutiliza) la exportación de las filas filtradas y devuelve su ruta"""
+        return exportar(self.df, self.filas(filtros), formato, clave)
+
+    def informe(self, filtros):
+        """Informe del estado de filtros (ver ``tablas_informe``)"""
+        return {'version': self.version, 'filtros': filtros, 'tablas': tablas_informe(self.motor.agregados(filtros))}
+
+
+def _tabla_ranking(serie, nombre, valor):
+    """Ranking como tabla de dos columnas"""
+    return pd.DataFrame({nombre: serie.index, valor: serie.to_numpy()})
+
+
+def tablas_informe(agregados, top_aeropuertos=TOP_AEROPUERTOS, top_empresas=TOP_EMPRESAS):
+    """Métricas, evolución y rankings de unos agregados como DataFrames"""
+    metricas = pd.DataFrame([{
+        'Total licitaciones': agregados.total_licitaciones,
+        'Presupuesto total': agregados.presupuesto_total,
+        'Adjudicado total': agregados.adjudicado_total,
+        'Ahorro total': agregados.presupuesto_total - agregados.adjudicado_total,
+        '% baja medio': agregados.porcentaje_baja_medio,
+        'Empresas adjudicatarias': agregados.total_empresas,
+    }])
+    return {
+        'metricas': metricas,
+        'mensual': agregados.mensual,
+        'licitaciones_por_mes': agregados.licitaciones_por_mes.rename_axis('Mes').reset_index(name='Licitaciones'),
+        'aeropuertos_licitaciones': _tabla_ranking(agregados.aeropuertos_count.head(top_aeropuertos), 'Aeropuerto', 'Licitaciones'),
+        'aeropuertos_importe': _tabla_ranking(agregados.aeropuertos_importe.head(top_aeropuertos), 'Aeropuerto', 'Importe adjudicado'),
+        'empresas_licitaciones': _tabla_ranking(agregados.empresas_count.head(top_empresas), 'Empresa', 'Licitaciones'),
+        'empresas_importe': _tabla_ranking(agregados.empresas_importe.head(top_empresas), 'Empresa', 'Importe adjudicado'),
+    }
+
+
+def filtros_a_dict(filtros):
+    """Estado de filtros como diccionario serializable"""
+    return {
+        'aeropuertos': list(filtros.aeropuertos),
+        'empresas': list(filtros.empresas),
+        'desde': filtros.rango_fechas[0].isoformat(),
+        'hasta': filtros.rango_fechas[-1].isoformat(),
+        'importe_min': filtros.rango_importes[0],
+        'importe_max': filtros.rango_importes[1],
+    }
+
+
+def informe_a_json(informe):
+    """Informe como estructura JSON (las métricas como objeto, el resto como listas de registros)"""
+    tablas = {nombre: json.loads(tabla.to_json(orient='records', date_format='iso', force_ascii=False))
+              for nombre, tabla in informe['tablas'].items()}
+    tablas['metricas'] = tablas['metricas'][0]
+    return {'version': informe['version'], 'filtros': filtros_a_dict(informe['filtros']), **tablas}
+
+
+def escribir_informe(informe, ruta, formato='json'):
+    """Escribe el informe: un fichero JSON, o un directorio con un Parquet por tabla"""
+    if formato == 'json':
+        tmp = ruta + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(informe_a_json(informe), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, ruta)
+    elif formato == 'parquet':
+        os.makedirs(ruta, exist_ok=True)
+        # Los filtros y la versión acompañan a las métricas para que cada directorio sea autosuficiente
+        contexto = pd.DataFrame([{'version': informe['version'], **filtros_a_dict(informe['filtros'])}])
+        for nombre, tabla in informe['tablas'].items():
+            if nombre == 'metricas':
+                tabla = pd.concat([contexto, tabla], axis=1)
+            tabla.to_parquet(os.path.join(ruta, f"{nombre}.parquet"), engine='pyarrow', index=False)
+    else:
+        raise ValueError(f"Formato de informe desconocido: {formato}")
+
+
+def nombre_informe(filtros, formato='json'):
+    """Nombre de fichero legible y único para un estado de filtros"""
+    partes = [*filtros.aeropuertos, *filtros.empresas]
+    legible = re.sub(r'\W+', '_', normalizar_texto(' '.join(partes))).strip('_')[:60] or 'todos'
+    # Dos nombres pueden normalizarse igual: el hash de los filtros los distingue
+    sufijo = hashlib.sha256(repr(tuple(filtros)).encode()).hexdigest()[:8]
+    return f"{legible}_{sufijo}" + ('.json' if formato == 'json' else '')
+
+
+def filtros_por_dimension(contexto, dimension, **kwargs):
+    """Un estado de filtros por cada aeropuerto o empresa, con el resto de filtros comunes"""
+    if dimension == 'aeropuerto':
+        return [contexto.filtros(aeropuertos=a, **kwargs) for a in contexto.opciones.aeropuertos]
+    if dimension == 'empresa':
+        return [contexto.filtros(empresas=e, **kwargs) for e in contexto.opciones.empresas]
+    raise ValueError(f"Dimensión desconocida: {dimension}")
+
+
+# Contexto de cada proceso del grupo; se construye una vez en su arranque
+_contexto_trabajador = None
+
+
+def _iniciar_trabajador(dir_cache):
+    """Abre el conjunto y construye los índices en un proceso del grupo"""
+    global _contexto_trabajador
+    _contexto_trabajador = Contexto(leer_manifiesto(dir_cache), dir_cache)
+
+
+def _escribir_trabajo(trabajo):
+    """Calcula y escribe un informe del lote en el proceso actual"""
+    filtros, ruta, formato = trabajo
+    escribir_informe(_contexto_trabajador.informe(filtros), ruta, formato)
+    return ruta
+
+
+def ejecutar_lote(lista_filtros, dir_salida, formato='json', procesos=None, dir_cache=DIR_CACHE):
+    """Escribe los informes de muchos estados de filtros repartidos entre procesos y devuelve sus rutas
+
+    El almacén debe estar sincronizado (los trabajadores solo leen el manifiesto).
+    Con ``procesos=1`` todo se calcula en el proceso actual.
+    """
+    os.makedirs(dir_salida, exist_ok=True)
+    trabajos = [(f, os.path.join(dir_salida, nombre_informe(f, formato)), formato) for f in lista_filtros]
+    if procesos == 1:
+        _iniciar_trabajador(dir_cache)
+        return [_escribir_trabajo(t) for t in trabajos]
+
+    procesos = procesos or os.cpu_count() or 1
+    # Bloques de trabajos para amortizar la comunicación entre procesos
+    tamano_bloque = max(1, len(trabajos) // (4 * procesos))
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_trabajador, initargs=(dir_cache,)) as grupo:
+        return list(grupo.map(_escribir_trabajo, trabajos, chunksize=tamano_bloque))
+
+
+def leer_fecha(texto):
+    """Fecha (día completo) o instante en formato ISO"""
+    return date.fromisoformat(texto) if len(texto) == 10 else datetime.fromisoformat(texto)
+
+
+def _anadir_argumentos_filtros(parser):
+    """Argumentos comunes de filtrado"""
+    parser.add_argument('--desde', type=leer_fecha, help="Fecha inicial (AAAA-MM-DD) o instante (AAAA-MM-DDTHH:MM)")
+    parser.add_argument('--hasta', type=leer_fecha, help="Fecha final o instante, incluidos")
+    parser.add_argument('--importe-min', type=float, help="Importe adjudicado mínimo (€)")
+    parser.add_argument('--importe-max', type=float, help="Importe adjudicado máximo (€)")
+    parser.add_argument('--formato', choices=FORMATOS_INFORME, default='json', help="Formato de salida")
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Informes de licitaciones de AENA sin interfaz gráfica")
+    parser.add_argument('--dir-datos', default=DIR_DATOS, help="Directorio con los libros Excel")
+    parser.add_argument('--patron', default=PATRON_LIBROS, help="Patrón de nombre de los libros")
+    parser.add_argument('--dir-cache', default=DIR_CACHE, help="Directorio del almacén columnar")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    consultar = subparsers.add_parser('consultar', help="Informe de un estado de filtros")
+    consultar.add_argument('--aeropuerto', action='append', default=[], help="Aeropuerto; se puede repetir (por defecto, todos)")
+    consultar.add_argument('--empresa', action='append', default=[], help="Empresa adjudicataria; se puede repetir (por defecto, todas)")
+    _anadir_argumentos_filtros(consultar)
+    consultar.add_argument('--salida', help="Fichero JSON o directorio Parquet (JSON por la salida estándar si se omite)")
+
+    lote = subparsers.add_parser('lote', help="Un informe por cada aeropuerto o empresa")
+    lote.add_argument('--por', choices=['aeropuerto', 'empresa'], required=True, help="Dimensión del lote")
+    _anadir_argumentos_filtros(lote)
+    lote.add_argument('--dir-salida', required=True, help="Directorio de los informes")
+    lote.add_argument('--procesos', type=int, help="Procesos en paralelo (por defecto, uno por CPU)")
+
+    args = parser.parse_args(argv)
+    rangos = dict(desde=args.desde, hasta=args.hasta, importe_min=args.importe_min, importe_max=args.importe_max)
+
+    try:
+        manifiesto = sincronizar_almacen(args.dir_datos, args.patron, args.dir_cache)
+        if args.comando == 'consultar':
+            contexto = Contexto(manifiesto, args.dir_cache)
+            informe = contexto.informe(contexto.filtros(args.aeropuerto, args.empresa, **rangos))
+            if args.salida:
+                escribir_informe(informe, args.salida, args.formato)
+            elif args.formato == 'json':
+                json.dump(informe_a_json(informe), sys.stdout, ensure_ascii=False, indent=2)
+                print()
+            else:
+                print("El formato Parquet necesita --salida", file=sys.stderr)
+                return 1
+        elif args.comando == 'lote':
+            contexto = Contexto(manifiesto, args.dir_cache)
+            lista_filtros = filtros_por_dimension(contexto, args.por, **rangos)
+            rutas = ejecutar_lote(lista_filtros, args.dir_salida, args.formato, args.procesos, args.dir_cache)
+            print(f"{len(rutas)} informes en {args.dir_salida} (versión {contexto.version})")
+    except (OSError, ValueError) as e:
+        print(f"Error al generar los informes: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
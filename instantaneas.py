@@ -0,0 +1,158 @@
+"""
+Instantáneas precalculadas de los agregados por aeropuerto y por empresa.
+
+Las vistas más habituales son un aeropuerto o una empresa con el resto de
+filtros en su valor inicial. Un trabajo en segundo plano recorre todos los
+aeropuertos y todas las empresas repartidos entre un grupo de procesos,
+calcula sus agregados (métricas, evolución mensual y rankings) y los guarda
+en ``<caché>/instantaneas/<versión>_f<formato>/``. El dashboard los sirve
+directamente; al cambiar cualquier libro cambia la versión y las
+instantáneas anteriores dejan de usarse y se purgan en la siguiente
+ejecución.
+
+Uso desde línea de comandos (p. ej. tras ``almacen_datos.py precalentar``):
+
+    python instantaneas.py precalcular --procesos 4
+"""
+import argparse
+import hashlib
+import os
+import pickle
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from almacen_datos import DIR_CACHE, DIR_DATOS, PATRON_LIBROS, leer_manifiesto, sincronizar_almacen
+from cache_consultas import clave_filtros
+from informes import Contexto
+
+DIR_INSTANTANEAS = os.path.join(DIR_CACHE, 'instantaneas')
+# Cambia cuando cambia la estructura de los agregados o de los filtros guardados
+FORMATO_INSTANTANEAS = 6
+
+
+def clave_instantanea(filtros):
+    """Nombre de fichero estable de un estado de filtros (el mismo para sus escrituras equivalentes)"""
+    return hashlib.sha256(repr(clave_filtros(filtros)).encode()).hexdigest()[:20]
+
+
+class AlmacenInstantaneas:
+    """Instantáneas de agregados de una versión de los datos"""
+
+    def __init__(self, version, dir_instantaneas=DIR_INSTANTANEAS):
+        self.version = version
+        self.directorio = os.path.join(dir_instantaneas, directorio_version(version))
+
+    def ruta(self, filtros):
+        """Ruta de la instantánea de un estado de filtros"""
+        return os.path.join(self.directorio, f"{clave_instantanea(filtros)}.pkl")
+
+    def cargar(self, filtros):
+        """Agregados guardados para el estado de filtros, o None si no hay instantánea"""
+        try:
+            with open(self.ruta(filtros), 'rb') as f:
+                clave_guardada, agregados = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        # Protección frente a colisiones de la clave
+        return agregados if clave_guardada == clave_filtros(filtros) else None
+
+    def guardar(self, filtros, agregados):
+        """Guarda los agregados de un estado de filtros de forma atómica"""
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = self.ruta(filtros)
+        tmp = f"{ruta}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump((clave_filtros(filtros), agregados), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, ruta)
+
+
+def directorio_version(version):
+    """Nombre del directorio de instantáneas de una versión de los datos"""
+    return f"{version}_f{FORMATO_INSTANTANEAS}"
+
+
+def purgar_instantaneas(version, dir_instantaneas=DIR_INSTANTANEAS):
+    """Elimina las instantáneas de otras versiones de los datos o de otro formato"""
+    if not os.path.isdir(dir_instantaneas):
+        return
+    for nombre in os.listdir(dir_instantaneas):
+        if nombre != directorio_version(version):
+            shutil.rmtree(os.path.join(dir_instantaneas, nombre), ignore_errors=True)
+
+
+def filtros_precalculados(contexto):
+    """Estados de filtros que se precalculan: cada aeropuerto y cada empresa por separado"""
+    return ([contexto.filtros(aeropuertos=a) for a in contexto.opciones.aeropuertos]
+            + [contexto.filtros(empresas=e) for e in contexto.opciones.empresas])
+
+
+# Contexto y almacén de cada proceso del grupo; se construyen una vez en su arranque
+_trabajador = None
+
+
+def _iniciar_trabajador(dir_cache, dir_instantaneas):
+    """Abre el conjunto, construye los índices y prepara el almacén en un proceso del grupo"""
+    global _trabajador
+    contexto = Contexto(leer_manifiesto(dir_cache), dir_cache)
+    _trabajador = (contexto, AlmacenInstantaneas(contexto.version, dir_instantaneas))
+
+
+def _precalcular_bloque(lista_filtros):
+    """Calcula y guarda las instantáneas de un bloque de estados de filtros"""
+    contexto, almacen = _trabajador
+    for filtros in lista_filtros:
+        almacen.guardar(filtros, contexto.motor.agregados(filtros))
+    return len(lista_filtros)
+
+
+def precalcular_instantaneas(procesos=None, dir_cache=DIR_CACHE, dir_instantaneas=DIR_INSTANTANEAS):
+    """Precalcula en paralelo las instantáneas de la versión actual y devuelve (versión, número)
+
+    El almacén debe estar sincronizado (los trabajadores solo leen el manifiesto).
+    """
+    global _trabajador
+    contexto = Contexto(leer_manifiesto(dir_cache), dir_cache)
+    purgar_instantaneas(contexto.version, dir_instantaneas)
+    lista_filtros = filtros_precalculados(contexto)
+
+    procesos = procesos or os.cpu_count() or 1
+    if procesos == 1:
+        _trabajador = (contexto, AlmacenInstantaneas(contexto.version, dir_instantaneas))
+        return contexto.version, _precalcular_bloque(lista_filtros)
+
+    # Bloques de estados de filtros para amortizar la comunicación entre procesos
+    tamano_bloque = max(1, len(lista_filtros) // (4 * procesos))
+    bloques = [lista_filtros[i:i + tamano_bloque] for i in range(0, len(lista_filtros), tamano_bloque)]
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_trabajador,
+                             initargs=(dir_cache, dir_instantaneas)) as grupo:
+        return contexto.version, sum(grupo.map(_precalcular_bloque, bloques))
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Instantáneas precalculadas por aeropuerto y empresa")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    precalcular = subparsers.add_parser('precalcular', help="Precalcula las instantáneas de la versión actual")
+    precalcular.add_argument('--dir-datos', default=DIR_DATOS, help="Directorio con los libros Excel")
+    precalcular.add_argument('--patron', default=PATRON_LIBROS, help="Patrón de nombre de los libros")
+    precalcular.add_argument('--dir-cache', default=DIR_CACHE, help="Directorio del almacén columnar")
+    precalcular.add_argument('--procesos', type=int, help="Procesos en paralelo (por defecto, uno por CPU)")
+
+    args = parser.parse_args(argv)
+
+    if args.comando == 'precalcular':
+        try:
+            sincronizar_almacen(args.dir_datos, args.patron, args.dir_cache)
+            version, n = precalcular_instantaneas(args.procesos, args.dir_cache,
+                                                  os.path.join(args.dir_cache, 'instantaneas'))
+        except (OSError, ValueError) as e:
+            print(f"Error al precalcular las instantáneas: {e}", file=sys.stderr)
+            return 1
+        print(f"{n} instantáneas precalculadas (versión {version})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
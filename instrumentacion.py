@@ -0,0 +1,214 @@
+"""
+Instrumentación de las ejecuciones del dashboard.
+
+Cada ejecución del script (un "rerun" de Streamlit) acumula el tiempo de sus
+secciones y los aciertos y fallos de las cachés en un registro propio del
+hilo que la ejecuta. Al terminar, el registro se escribe como una línea JSON
+en el logger ``aena.rendimiento`` y se suma a las métricas globales del
+proceso, que se pueden exportar en formato de texto de Prometheus (p. ej.
+para el recolector de ficheros de texto de node_exporter).
+
+No depende de Streamlit: también sirve para los informes y el banco de
+pruebas.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger('aena.rendimiento')
+
+# Límites superiores (segundos) de los intervalos del histograma de duraciones
+INTERVALOS_SEGUNDOS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+class Ejecucion:
+    """Tiempos y resultados de caché de una ejecución del script"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.tiempos = defaultdict(float)
+        self.llamadas = defaultdict(int)
+        self.aciertos = defaultdict(int)
+        self.fallos = defaultdict(int)
+
+    def duracion(self):
+        """Segundos transcurridos desde el inicio de la ejecución"""
+        return time.perf_counter() - self.inicio
+
+    def como_dict(self):
+        """Resumen serializable de la ejecución"""
+        return {
+            'duracion_ms': round(self.duracion() * 1e3, 3),
+            'secciones': {s: {'ms': round(t * 1e3, 3), 'llamadas': self.llamadas[s]} for s, t in self.tiempos.items()},
+            'caches': {c: {'aciertos': self.aciertos[c], 'fallos': self.fallos[c]}
+                       for c in sorted(set(self.aciertos) | set(self.fallos))},
+        }
+
+
+class MetricasProceso:
+    """Métricas acumuladas de todas las ejecuciones del proceso"""
+
+    def __init__(self):
+        self._bloqueo = threading.Lock()
+        self.ejecuciones = 0
+        self.segundos = defaultdict(float)
+        self.llamadas = defaultdict(int)
+        self.histograma = defaultdict(lambda: [0] * len(INTERVALOS_SEGUNDOS))
+        self.cache = defaultdict(int)
+
+    def observar(self, seccion, segundos):
+        """Añade una duración de una sección"""
+        with self._bloqueo:
+            self.segundos[seccion] += segundos
+            self.llamadas[seccion] += 1
+            cubos = self.histograma[seccion]
+            for i, limite in enumerate(INTERVALOS_SEGUNDOS):
+                if segundos <= limite:
+                    cubos[i] += 1
+
+    def contar_cache(self, cache, acierto):
+        """Añade un acierto o un fallo de una caché"""
+        with self._bloqueo:
+            self.cache[(cache, 'acierto' if acierto else 'fallo')] += 1
+
+    def contar_ejecucion(self):
+        """Añade una ejecución terminada"""
+        with self._bloqueo:
+            self.ejecuciones += 1
+
+    def texto_prometheus(self):
+        """Métricas en el formato de texto de exposición de Prometheus"""
+        with self._bloqueo:
+            lineas = [
+                '# HELP aena_ejecuciones_total Ejecuciones del dashboard terminadas.',
+                '# TYPE aena_ejecuciones_total counter',
+                f'aena_ejecuciones_total {self.ejecuciones}',
+                '# HELP aena_seccion_segundos Duración de las secciones del dashboard.',
+                '# TYPE aena_seccion_segundos histogram',
+            ]
+            for seccion in sorted(self.segundos):
+                etiqueta = _etiqueta(seccion)
+                for limite, n in zip(INTERVALOS_SEGUNDOS, self.histograma[seccion]):
+                    lineas.append(f'aena_seccion_segundos_bucket{{seccion="{etiqueta}",le="{limite}"}} {n}')
+                lineas.append(f'aena_seccion_segundos_bucket{{seccion="{etiqueta}",le="+Inf"}} {self.llamadas[seccion]}')
+                lineas.append(f'aena_seccion_segundos_sum{{seccion="{etiqueta}"}} {self.segundos[seccion]:.6f}')
+                lineas.append(f'aena_seccion_segundos_count{{seccion="{etiqueta}"}} {self.llamadas[seccion]}')
+            lineas += [
+                '# HELP aena_cache_total Consultas a las cachés por resultado.',
+                '# TYPE aena_cache_total counter',
+            ]
+            for (cache, resultado), n in sorted(self.cache.items()):
+                lineas.append(f'aena_cache_total{{cache="{_etiqueta(cache)}",resultado="{resultado}"}} {n}')
+        return '\n'.join(lineas) + '\n'
+
+
+def _etiqueta(valor):
+    """Escapa un valor de etiqueta de Prometheus"""
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metricas = MetricasProceso()
+_local = threading.local()
+
+
+def iniciar_ejecucion():
+    """Empieza el registro de una nueva ejecución en el hilo actual"""
+    _local.ejecucion = Ejecucion()
+    return _local.ejecucion
+
+
+def ejecucion_actual():
+    """Registro de la ejecución en curso del hilo (se crea si no hay ninguna)"""
+    ejecucion = getattr(_local, 'ejecucion', None)
+    return ejecucion if ejecucion is not None else iniciar_ejecucion()
+
+
+def ejecucion_en_curso():
+    """Registro de la ejecución en curso del hilo, o None si no hay ninguna (no la crea)"""
+    return getattr(_local, 'ejecucion', None)
+
+
+def finalizar_ejecucion(ruta_prometheus=None):
+    """Cierra la ejecución: la escribe en el log y, si se indica, vuelca las métricas a fichero"""
+    ejecucion = ejecucion_actual()
+    metricas.contar_ejecucion()
+    logger.info(json.dumps({'evento': 'ejecucion', **ejecucion.como_dict()}, ensure_ascii=False))
+    if ruta_prometheus:
+        escribir_prometheus(ruta_prometheus)
+    _local.ejecucion = None
+    return ejecucion
+
+
+def descartar_ejecucion():
+    """Olvida la ejecución en curso del hilo sin registrarla"""
+    _local.ejecucion = None
+
+
+@contextmanager
+def medir(seccion, cache=None):
+    """Mide la duración de un bloque; con ``cache`` cuenta además si esa caché acertó
+
+    Se considera fallo cuando dentro del bloque se llama a ``marcar_fallo(cache)``
+    (p. ej. desde el cuerpo de una función cacheada, que solo se ejecuta al fallar).
+    """
+    ejecucion = ejecucion_actual()
+    fallos_previos = ejecucion.fallos[cache] if cache else 0
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        ejecucion.tiempos[seccion] += segundos
+        ejecucion.llamadas[seccion] += 1
+        metricas.observar(seccion, segundos)
+        if cache and ejecucion.fallos[cache] == fallos_previos:
+            registrar_cache(cache, acierto=True)
+
+
+def medido(funcion):
+    """Decorador que mide cada llamada a la función, con su nombre como sección"""
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        with medir(funcion.__name__):
+            return funcion(*args, **kwargs)
+    return envoltura
+
+
+def marcar_fallo(cache):
+    """Registra un fallo de caché (llamar desde el código que solo se ejecuta al fallar)"""
+    registrar_cache(cache, acierto=False)
+
+
+def registrar_cache(cache, acierto):
+    """Registra un acierto o un fallo de una caché"""
+    ejecucion = ejecucion_actual()
+    if acierto:
+        ejecucion.aciertos[cache] += 1
+    else:
+        ejecucion.fallos[cache] += 1
+    metricas.contar_cache(cache, acierto)
+
+
+def escribir_prometheus(ruta):
+    """Escribe las métricas del proceso en un fichero de texto de forma atómica"""
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(metricas.texto_prometheus())
+    os.replace(tmp, ruta)
+
+
+def configurar_log(destino):
+    """Envía el log de rendimiento a la salida de errores ('-') o a un fichero, una línea JSON por ejecución"""
+    if any(getattr(h, '_aena_rendimiento', False) for h in logger.handlers):
+        return
+    manejador = logging.StreamHandler() if destino == '-' else logging.FileHandler(destino, encoding='utf-8')
+    manejador.setFormatter(logging.Formatter('%(message)s'))
+    manejador._aena_rendimiento = True
+    logger.addHandler(manejador)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
@@ -0,0 +1,93 @@
+"""
+Mapas de bits comprimidos sobre las posiciones de fila.
+
+Cada conjunto de filas se guarda de la forma más compacta según su
+densidad, como los contenedores de los mapas Roaring: las posiciones
+ordenadas (int32/int64) cuando son pocas, o un bitset de palabras de 64
+bits cuando ocupan más de 1/32 de las filas (a partir de ahí el bitset es
+más pequeño que la lista). Las uniones y las intersecciones entre bitsets
+son operaciones OR/AND palabra a palabra; con listas se resuelven por
+mezcla o comprobando los bits de las posiciones.
+"""
+import numpy as np
+
+# Un conjunto es denso (bitset) cuando tiene al menos n_filas / DENSIDAD_BITSET filas
+DENSIDAD_BITSET = 32
+
+
+def _contar_bits(palabras):
+    """Número de bits a 1 de un array de palabras uint64"""
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(palabras).sum())
+    return int(np.unpackbits(palabras.view(np.uint8)).sum())
+
+
+def _bits_de_posiciones(posiciones):
+    """Desplazamientos de bit (uint64) de cada posición dentro de su palabra"""
+    return np.left_shift(np.uint64(1), (posiciones & 63).astype(np.uint64))
+
+
+class MapaBits:
+    """Conjunto de filas: posiciones ordenadas si es disperso, palabras de 64 bits si es denso"""
+
+    def __init__(self, n_filas, posiciones=None, palabras=None):
+        self.n_filas = n_filas
+        self._posiciones = posiciones
+        self._palabras = palabras
+
+    @classmethod
+    def desde_posiciones(cls, posiciones, n_filas):
+        """Mapa de unas posiciones ordenadas y sin repetir, en la forma más compacta"""
+        if len(posiciones) * DENSIDAD_BITSET < n_filas:
+            return cls(n_filas, posiciones=posiciones)
+        marcas = np.zeros(-(-n_filas // 64) * 64, dtype=bool)
+        marcas[posiciones] = True
+        return cls(n_filas, palabras=np.packbits(marcas, bitorder='little').view('<u8'))
+
+    @classmethod
+    def union(cls, mapas, n_filas):
+        """Unión de varios mapas"""
+        densos = [m._palabras for m in mapas if m.es_denso()]
+        dispersos = [m._posiciones for m in mapas if not m.es_denso()]
+        if not densos:
+            if not dispersos:
+                return cls(n_filas, posiciones=np.empty(0, dtype=np.intp))
+            posiciones = dispersos[0] if len(dispersos) == 1 else np.unique(np.concatenate(dispersos))
+            return cls.desde_posiciones(posiciones, n_filas)
+        palabras = np.bitwise_or.reduce(densos) if len(densos) > 1 else densos[0].copy()
+        for posiciones in dispersos:
+            np.bitwise_or.at(palabras, posiciones >> 6, _bits_de_posiciones(posiciones))
+        return cls(n_filas, palabras=palabras)
+
+    def es_denso(self):
+        """Indica si el mapa se guarda como bitset"""
+        return self._palabras is not None
+
+    def cuenta(self):
+        """Número de filas del conjunto"""
+        return _contar_bits(self._palabras) if self.es_denso() else len(self._posiciones)
+
+    def posiciones(self):
+        """Posiciones ordenadas de las filas del conjunto"""
+        if not self.es_denso():
+            return self._posiciones
+        return np.flatnonzero(np.unpackbits(self._palabras.view(np.uint8), bitorder='little'))
+
+    def contiene(self, posiciones):
+        """Máscara de las posiciones que pertenecen al conjunto"""
+        if self.es_denso():
+            return (self._palabras[posiciones >> 6] & _bits_de_posiciones(posiciones)) != 0
+        i = np.searchsorted(self._posiciones, posiciones)
+        i[i == len(self._posiciones)] = 0
+        return (self._posiciones[i] == posiciones) if len(self._posiciones) else np.zeros(len(posiciones), dtype=bool)
+
+    def __or__(self, otro):
+        return MapaBits.union([self, otro], self.n_filas)
+
+    def __and__(self, otro):
+        if self.es_denso() and otro.es_denso():
+            return MapaBits(self.n_filas, palabras=self._palabras & otro._palabras)
+        if self.es_denso():
+            self, otro = otro, self
+        # Al menos uno es disperso: se comprueban sus posiciones en el otro
+        return MapaBits(self.n_filas, posiciones=self._posiciones[otro.contiene(self._posiciones)])
@@ -0,0 +1,427 @@
+"""
+Normalización de los nombres de los adjudicatarios.
+
+Un mismo adjudicatario aparece escrito de muchas formas en los libros
+("ACCIONA CONSTRUCCION SA", "Acciona Construcción, S.A.", "ACCIONA
+CONSTRUCCION SOCIEDAD ANONIMA"; las UTE con sus miembros en distinto orden)
+y eso fragmenta rankings y filtros. Cada nombre se reduce a una clave
+normalizada (sin acentos ni puntuación, con la forma jurídica abreviada y
+los miembros de las UTE ordenados); los nombres con la misma clave son la
+misma empresa. Las claves distintas pero parecidas (erratas, palabras
+abreviadas como "CONST" por "CONSTRUCCIONES") se agrupan comparando solo
+las que comparten alguna de sus palabras más raras, o su comienzo o final,
+sin comparar todas con todas.
+
+La correspondencia nombre -> empresa canónica se guarda en la caché y se
+amplía de forma incremental: al llegar libros nuevos solo se resuelven los
+nombres que no conocía, y los ya resueltos conservan su empresa. Junto a
+ella se guardan los bloques de las claves conocidas, así que las claves
+nuevas se comparan solo con las de sus bloques sin volver a analizar el
+resto.
+"""
+import json
+import os
+import re
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+from almacen_datos import DIR_CACHE
+from busqueda import normalizar_texto
+from indice_filtros import EMPRESA_COL
+
+FICHERO_EMPRESAS = 'empresas_canonicas.json'
+FICHERO_BLOQUES = 'empresas_bloques.json'
+VERSION_EMPRESAS = 2
+
+# Formas jurídicas escritas con palabras y su abreviatura
+_FORMAS_LARGAS = {
+    'sociedad anonima unipersonal': 'sau',
+    'sociedad limitada unipersonal': 'slu',
+    'sociedad limitada laboral': 'sll',
+    'sociedad anonima laboral': 'sal',
+    'sociedad anonima': 'sa',
+    'sociedad limitada': 'sl',
+    'sociedad cooperativa': 'scoop',
+    'sa unipersonal': 'sau',
+    'sl unipersonal': 'slu',
+    's coop': 'scoop',
+    'union temporal de empresas': 'ute',
+    'union temporal empresas': 'ute',
+}
+FORMAS_JURIDICAS = {'sa', 'sl', 'sau', 'slu', 'sll', 'sal', 'slp', 'scoop'}
+PALABRAS_VACIAS = {'y', 'e', 'de', 'del', 'la', 'las', 'el', 'los'}
+
+UMBRAL_SIMILITUD = 0.85    # Jaccard mínimo entre los trigramas de dos claves
+CLAVES_BLOQUE = 3          # claves de bloque más raras de cada nombre en cuyos bloques entra
+LONGITUD_AFIJO = 5         # letras del comienzo y del final de palabra que forman claves de bloque
+MAX_BLOQUE = 100           # los bloques mayores no discriminan y se descartan
+MIN_ABREVIATURA = 4        # letras mínimas de una palabra abreviada
+
+_PATRON_SIGLAS = re.compile(r'\b(?:[a-z]\.\s?)+[a-z]\b\.?')
+_PATRON_FORMAS = re.compile(r'\b(' + '|'.join(sorted(_FORMAS_LARGAS, key=len, reverse=True)) + r')\b')
+_PATRON_FORMA_GUION = re.compile(r'\b(' + '|'.join(sorted(FORMAS_JURIDICAS)) + r')-')
+_PATRON_MIEMBROS = re.compile(r'\s*/\s*|\s+-\s*|\s*-\s+')
+_PATRON_PALABRAS = re.compile(r'[a-z0-9]+')
+
+
+def _clave_miembro(texto):
+    """Clave de un nombre sin separadores de UTE: palabras normalizadas con la forma jurídica abreviada"""
+    texto = _PATRON_SIGLAS.sub(lambda m: m.group(0).replace('.', '').replace(' ', ''), texto)
+    palabras = ' '.join(_PATRON_PALABRAS.findall(texto))
+    palabras = _PATRON_FORMAS.sub(lambda m: _FORMAS_LARGAS[m.group(1)], palabras).split()
+    ute = 'ute' in palabras
+    return ' '.join(p for p in palabras if p != 'ute'), ute
+
+
+def clave_empresa(nombre):
+    """Clave normalizada de un nombre de adjudicatario
+
+    Las UTE llevan el prefijo 'ute ' y sus miembros ordenados y separados
+    por ' - ', así que el orden en que se escriben no cambia la clave.
+    """
+    texto = re.sub(r'\([^)]*\)', ' ', normalizar_texto(str(nombre)))
+    texto = _PATRON_FORMA_GUION.sub(r'\1 - ', texto)
+    miembros, ute = set(), False
+    for parte in _PATRON_MIEMBROS.split(texto):
+        clave, es_ute = _clave_miembro(parte)
+        ute = ute or es_ute
+        if clave:
+            miembros.add(clave)
+    clave = ' - '.join(sorted(miembros))
+    return f"ute {clave}".strip() if ute or len(miembros) > 1 else clave
+
+
+def _forma_miembro(miembro):
+    """Forma jurídica con la que termina la clave de un miembro de UTE ('' si no tiene)"""
+    palabras = miembro.split()
+    return palabras[-1] if palabras and palabras[-1] in FORMAS_JURIDICAS else ''
+
+
+def _formas_compatibles(formas):
+    """Indica si un conjunto de pares (miembro, forma jurídica) no da dos formas a un mismo miembro"""
+    return len({miembro for miembro, _ in formas}) == len(formas)
+
+
+class _Clave:
+    """Partes de una clave que usan la comparación y la agrupación"""
+
+    __slots__ = ('tipo', 'forma', 'formas', 'nucleo', 'palabras', 'digitos', '_trigramas')
+
+    def __init__(self, clave):
+        ute = clave.startswith('ute ') or clave == 'ute'
+        nucleo = clave[4:] if ute else clave
+        palabras = nucleo.split()
+        self.tipo = (ute, nucleo.count(' - '))
+        # Solo los nombres de una empresa tienen forma jurídica propia; la de los miembros va en el núcleo
+        self.forma = palabras[-1] if not ute and palabras and palabras[-1] in FORMAS_JURIDICAS else ''
+        # Forma jurídica de cada miembro (de la empresa si no es una UTE), '' si no la indica
+        self.formas = tuple(_forma_miembro(m) for m in nucleo.split(' - ')) if ute else (self.forma,)
+        if self.forma:
+            palabras = palabras[:-1]
+            nucleo = ' '.join(palabras)
+        self.nucleo = nucleo
+        self.palabras = [p for p in palabras if p not in PALABRAS_VACIAS and p != '-']
+        self.digitos = sorted(p for p in palabras if p.isdigit())
+        self._trigramas = None
+
+    @property
+    def trigramas(self):
+        """Trigramas del núcleo (se calculan solo para las claves que se comparan)"""
+        if self._trigramas is None:
+            texto = f" {self.nucleo} "
+            self._trigramas = {texto[i:i + 3] for i in range(len(texto) - 2)}
+        return self._trigramas
+
+    def claves_bloque(self):
+        """Cada palabra con su comienzo y su final, que sobreviven a una errata o abreviatura en el otro extremo"""
+        claves = set()
+        for palabra in self.palabras:
+            claves.add(palabra)
+            if len(palabra) > LONGITUD_AFIJO:
+                claves.add(palabra[:LONGITUD_AFIJO] + '-')
+                claves.add('-' + palabra[-LONGITUD_AFIJO:])
+        return claves
+
+
+def _abreviadas(a, b):
+    """Indica si dos listas de palabras coinciden palabra a palabra salvo abreviaturas ('const' por 'construcciones')"""
+    if len(a) != len(b) or len(a) < 2:
+        return False
+    iguales = 0
+    for x, y in zip(a, b):
+        if x == y:
+            iguales += 1
+        else:
+            corta, larga = (x, y) if len(x) < len(y) else (y, x)
+            if len(corta) < MIN_ABREVIATURA or not larga.startswith(corta):
+                return False
+    return iguales > 0
+
+
+def similitud(a, b):
+    """Similitud entre dos claves analizadas (0 si no pueden ser la misma empresa)"""
+    if a.tipo != b.tipo or a.digitos != b.digitos:
+        return 0.0
+    # Dos formas jurídicas distintas (de la empresa o de un mismo miembro de la UTE) son empresas distintas
+    if a.formas != b.formas and any(x and y and x != y for x, y in zip(a.formas, b.formas)):
+        return 0.0
+    if a.nucleo == b.nucleo:
+        return 1.0
+    # Cota de Jaccard por tamaños: solo una abreviatura (mismas palabras) puede salvar la diferencia
+    na, nb = len(a.trigramas), len(b.trigramas)
+    if min(na, nb) < UMBRAL_SIMILITUD * max(na, nb) and len(a.palabras) != len(b.palabras):
+        return 0.0
+    jaccard = len(a.trigramas & b.trigramas) / len(a.trigramas | b.trigramas)
+    if jaccard >= UMBRAL_SIMILITUD:
+        return jaccard
+    return UMBRAL_SIMILITUD if _abreviadas(a.palabras, b.palabras) else 0.0
+
+
+def _formas(analizada):
+    """Pares (miembro, forma jurídica) de una clave analizada"""
+    return {(i, forma) for i, forma in enumerate(analizada.formas) if forma}
+
+
+class IndiceBloques:
+    """Bloques de las claves ya resueltas, guardados junto a la correspondencia
+
+    Cada clave entra en los bloques de sus CLAVES_BLOQUE claves de bloque
+    menos frecuentes (por cada miembro si es una UTE), separados por tipo de
+    nombre (empresa o UTE y número de miembros). La rareza se mide al
+    añadir la clave y su sitio no cambia después: las claves nuevas solo se
+    comparan con las de sus bloques. Las claves se identifican por su orden
+    de llegada.
+    """
+
+    def __init__(self, dir_cache=DIR_CACHE):
+        self.ruta = os.path.join(dir_cache, FICHERO_BLOQUES)
+        try:
+            with open(self.ruta, encoding='utf-8') as f:
+                datos = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            datos = {}
+        if datos.get('version') != VERSION_EMPRESAS:
+            datos = {'version': VERSION_EMPRESAS, 'claves': [], 'frecuencias': {}, 'bloques': {}}
+        self.claves = datos['claves']
+        self.frecuencias = Counter(datos['frecuencias'])
+        self.bloques = defaultdict(list, datos['bloques'])
+        self._posiciones = {clave: i for i, clave in enumerate(self.claves)}
+
+    def guardar(self):
+        """Escribe el índice de forma atómica"""
+        os.makedirs(os.path.dirname(self.ruta) or '.', exist_ok=True)
+        tmp = f"{self.ruta}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'version': VERSION_EMPRESAS, 'claves': self.claves,
+                                'frecuencias': self.frecuencias, 'bloques': self.bloques}, ensure_ascii=False))
+        os.replace(tmp, self.ruta)
+
+    def sincronizar(self, claves):
+        """Ajusta el índice a las claves de la correspondencia
+
+        Si el índice tiene claves que la correspondencia no conoce (p. ej. se
+        guardó uno de los dos ficheros y no el otro) se reconstruye; las que
+        le faltan se añaden.
+        """
+        if len(self._posiciones) > len(claves) or any(c not in claves for c in self.claves):
+            self.claves, self.frecuencias, self.bloques, self._posiciones = [], Counter(), defaultdict(list), {}
+        faltan = sorted(c for c in claves if c not in self._posiciones)
+        if faltan:
+            self.anadir([_Clave(c) for c in faltan], faltan)
+
+    def anadir(self, analizadas, claves):
+        """Añade claves nuevas a sus bloques y devuelve sus identificadores y los pares (i, j) a comparar
+
+        Los pares tienen al menos una clave de las añadidas y salen de los
+        bloques que no superan MAX_BLOQUE.
+        """
+        por_clave = [a.claves_bloque() for a in analizadas]
+        for claves_bloque in por_clave:
+            self.frecuencias.update(claves_bloque)
+        inicio = len(self.claves)
+        tocados = set()
+        for i, (clave, a, claves_bloque) in enumerate(zip(claves, analizadas, por_clave), start=inicio):
+            self.claves.append(clave)
+            self._posiciones[clave] = i
+            # Las UTE tienen tantas claves de bloque como miembros
+            rarezas = sorted((self.frecuencias[c], c) for c in claves_bloque)[:CLAVES_BLOQUE * (a.tipo[1] + 1)]
+            for _, clave_bloque in rarezas:
+                bloque = f"{a.tipo[0]:d}/{a.tipo[1]}/{clave_bloque}"
+                self.bloques[bloque].append(i)
+                tocados.add(bloque)
+        n = len(self.claves)
+        pares = set()
+        for bloque in tocados:
+            miembros = self.bloques[bloque]
+            if len(miembros) < 2 or len(miembros) > MAX_BLOQUE:
+                continue
+            for i in (m for m in miembros if m >= inicio):
+                for j in miembros:
+                    if j != i and (j < inicio or i < j):
+                        pares.add(i * n + j if i < j else j * n + i)
+        return list(range(inicio, n)), [divmod(par, n) for par in sorted(pares)]
+
+
+class NormalizadorEmpresas:
+    """Correspondencia persistente nombre original -> empresa canónica
+
+    Cada empresa tiene un identificador estable (su posición en
+    ``entidades``) y un nombre canónico: la grafía con más filas de sus
+    nombres cuando se resolvió por primera vez.
+    """
+
+    def __init__(self, dir_cache=DIR_CACHE):
+        self.dir_cache = dir_cache
+        self.ruta = os.path.join(dir_cache, FICHERO_EMPRESAS)
+        try:
+            with open(self.ruta, encoding='utf-8') as f:
+                datos = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            datos = {}
+        # Una correspondencia de formato antiguo se descarta y se vuelve a resolver
+        if datos.get('version') != VERSION_EMPRESAS:
+            datos = {'version': VERSION_EMPRESAS, 'entidades': [], 'claves': {}, 'nombres': {}}
+        self.entidades = datos['entidades']
+        self.claves = datos['claves']
+        self.nombres = datos['nombres']
+        # Índice de bloques; solo se lee si hay claves nuevas que agrupar
+        self._indice = None
+
+    def guardar(self):
+        """Escribe la correspondencia de forma atómica y, después, el índice de bloques si se ha usado"""
+        os.makedirs(os.path.dirname(self.ruta) or '.', exist_ok=True)
+        tmp = f"{self.ruta}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'version': VERSION_EMPRESAS, 'entidades': self.entidades,
+                                'claves': self.claves, 'nombres': self.nombres}, ensure_ascii=False))
+        os.replace(tmp, self.ruta)
+        if self._indice is not None:
+            self._indice.guardar()
+
+    def resolver(self, recuentos):
+        """Asigna empresa a los nombres de ``recuentos`` (nombre -> filas) que no tenían; devuelve cuántos
+
+        Los nombres cuya clave ya se conoce heredan su empresa. El resto se
+        agrupa con las claves parecidas de su bloque (uniendo primero los
+        pares más parecidos) sin juntar nunca dos empresas existentes ni dos
+        formas jurídicas distintas; cada grupo sin empresa crea una nueva.
+        """
+        nuevos = sorted(n for n in recuentos if n not in self.nombres)
+        if not nuevos:
+            return 0
+        por_clave = defaultdict(list)
+        for nombre in nuevos:
+            clave = clave_empresa(nombre)
+            if clave in self.claves:
+                self.nombres[nombre] = self.claves[clave]
+            else:
+                por_clave[clave].append(nombre)
+        if por_clave:
+            self._agrupar(por_clave, recuentos)
+        return len(nuevos)
+
+    def _agrupar(self, por_clave, recuentos):
+        """Agrupa las claves nuevas entre sí y con las existentes de sus bloques"""
+        if self._indice is None:
+            self._indice = IndiceBloques(self.dir_cache)
+            self._indice.sincronizar(self.claves)
+        claves = sorted(por_clave)
+        analizadas_nuevas = [_Clave(c) for c in claves]
+        nuevas, candidatos = self._indice.anadir(analizadas_nuevas, claves)
+        clave_de = self._indice.claves
+        analizadas = dict(zip(nuevas, analizadas_nuevas))
+
+        def analizada(i):
+            if i not in analizadas:
+                analizadas[i] = _Clave(clave_de[i])
+            return analizadas[i]
+
+        pares = []
+        for i, j in candidatos:
+            s = similitud(analizada(i), analizada(j))
+            if s > 0:
+                pares.append((-s, clave_de[i], clave_de[j], i, j))
+
+        # Solo participan las claves nuevas y las existentes con las que se comparan
+        nodos = set(nuevas)
+        for par in pares:
+            nodos.update(par[3:])
+        entidad = [None] * len(clave_de)
+        for i in nodos:
+            entidad[i] = self.claves.get(clave_de[i])
+        # Formas jurídicas (por miembro) de cada empresa existente: todas sus claves cuentan al unir
+        existentes = {entidad[i] for i in nodos} - {None}
+        formas_entidad = defaultdict(set)
+        for clave, e in self.claves.items():
+            if e in existentes:
+                formas_entidad[e] |= _formas(_Clave(clave))
+        formas = {}
+
+        def formas_de(r):
+            if r not in formas:
+                formas[r] = formas_entidad[entidad[r]] if entidad[r] is not None else _formas(analizada(r))
+            return formas[r]
+
+        padre = list(range(len(clave_de)))
+
+        def raiz(i):
+            while padre[i] != i:
+                padre[i] = padre[padre[i]]
+                i = padre[i]
+            return i
+
+        for _, _, _, i, j in sorted(pares):
+            ri, rj = raiz(i), raiz(j)
+            if ri == rj:
+                continue
+            if entidad[ri] is not None and entidad[rj] is not None and entidad[ri] != entidad[rj]:
+                continue
+            union = formas_de(ri) | formas_de(rj)
+            if not _formas_compatibles(union):
+                continue
+            # Las claves existentes (identificadores menores) siguen siendo la raíz para conservar su empresa
+            if rj < ri:
+                ri, rj = rj, ri
+            padre[rj] = ri
+            formas[ri] = union
+            entidad[ri] = entidad[ri] if entidad[ri] is not None else entidad[rj]
+
+        grupos = defaultdict(list)
+        for i in nuevas:
+            grupos[raiz(i)].append(i)
+        for r, miembros in sorted(grupos.items()):
+            if entidad[r] is None:
+                nombres = [n for i in miembros for n in por_clave[clave_de[i]]]
+                # La grafía con más filas; a igualdad, la más completa
+                canonico = min(nombres, key=lambda n: (-recuentos.get(n, 0), -len(n), n))
+                entidad[r] = len(self.entidades)
+                self.entidades.append(canonico)
+            for i in miembros:
+                self.claves[clave_de[i]] = entidad[r]
+                for nombre in por_clave[clave_de[i]]:
+                    self.nombres[nombre] = entidad[r]
+
+    def canonico(self, nombre):
+        """Nombre canónico de un nombre ya resuelto"""
+        return self.entidades[self.nombres[nombre]]
+
+
+def canonizar(recuentos, dir_cache=DIR_CACHE):
+    """Correspondencia nombre -> nombre canónico de ``recuentos`` (nombre -> filas), ampliando la guardada"""
+    normalizador = NormalizadorEmpresas(dir_cache)
+    if normalizador.resolver(recuentos):
+        normalizador.guardar()
+    return {nombre: normalizador.canonico(nombre) for nombre in recuentos}
+
+
+def normalizar_empresas(df, dir_cache=DIR_CACHE):
+    """Sustituye los adjudicatarios de ``df`` por su nombre canónico"""
+    if EMPRESA_COL not in df.columns:
+        return df
+    serie = df[EMPRESA_COL]
+    recuentos = serie.value_counts()
+    mapa = canonizar(recuentos[recuentos > 0].to_dict(), dir_cache)
+    canonica = serie.map(mapa)
+    df[EMPRESA_COL] = canonica.astype('category') if isinstance(serie.dtype, pd.CategoricalDtype) else canonica
+    return df
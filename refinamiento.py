@@ -0,0 +1,61 @@
+"""
+Evaluación incremental de los filtros dentro de una sesión.
+
+Al estrechar un filtro (un rango de fechas más corto, un importe mínimo más
+alto, menos aeropuertos o empresas elegidos o un término de búsqueda que se
+alarga) las filas del nuevo estado son un subconjunto de las del anterior.
+Cada sesión guarda su último resultado de filas y de medidas: si el nuevo
+estado de filtros es un refinamiento del guardado, se evalúa solo sobre sus
+filas y las medidas se obtienen restando las de las filas que salen.
+
+Las comparaciones se hacen sobre las claves normalizadas de cache_consultas,
+así que fechas o importes escritos de otra forma se reconocen igual.
+"""
+from instrumentacion import registrar_cache
+
+
+def _subseleccion(valores, anteriores):
+    """Indica si una selección de valores está contenida en otra (vacía: todos)"""
+    return not anteriores or (bool(valores) and set(valores) <= set(anteriores))
+
+
+def _dentro(rango, anterior):
+    """Indica si un rango está contenido en otro (vacío: sin límites)"""
+    return not anterior or (bool(rango) and anterior[0] <= rango[0] and rango[1] <= anterior[1])
+
+
+def es_refinamiento(clave, anterior):
+    """Indica si el estado de filtros ``clave`` selecciona un subconjunto de las filas de ``anterior``
+
+    Ambas son claves de ``clave_filtros``. La búsqueda es una coincidencia
+    literal, así que un término que contiene al anterior solo puede coincidir
+    con filas que ya coincidían.
+    """
+    aeropuertos, empresas, fechas, importes, busqueda = clave
+    aeropuertos_ant, empresas_ant, fechas_ant, importes_ant, busqueda_ant = anterior
+    return (_subseleccion(aeropuertos, aeropuertos_ant) and _subseleccion(empresas, empresas_ant)
+            and _dentro(fechas, fechas_ant) and _dentro(importes, importes_ant)
+            and busqueda_ant in busqueda)
+
+
+class SesionConsultas:
+    """Últimos resultados de una sesión por tipo de consulta ('filas', 'busqueda', 'medidas')
+
+    Cada resultado guarda la clave de filtros, las posiciones ordenadas de sus
+    filas y, opcionalmente, datos calculados sobre ellas (p. ej. las medidas).
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self._ultimos = {}
+
+    def anterior(self, tipo, clave):
+        """(clave, posiciones, datos) del último resultado del tipo si ``clave`` lo refina, o None"""
+        ultimo = self._ultimos.get(tipo)
+        refina = ultimo is not None and es_refinamiento(clave, ultimo[0])
+        registrar_cache(f'refinamiento_{tipo}', acierto=refina)
+        return ultimo if refina else None
+
+    def recordar(self, tipo, clave, posiciones, datos=None):
+        """Guarda el último resultado del tipo; ``posiciones`` debe estar ordenado"""
+        self._ultimos[tipo] = (clave, posiciones, datos)
@@ -0,0 +1,158 @@
+"""
+Refresco de los datos en segundo plano.
+
+Un hilo vigilante comprueba periódicamente si hay libros nuevos, modificados
+o eliminados (solo fechas de modificación y tamaños). Cuando hay cambios, la
+ingesta de los Excel se hace en un proceso aparte, para no competir por el
+GIL con las sesiones, y después el hilo construye el paquete de datos de la
+nueva versión (conjunto e índices). Solo cuando está completo se publica,
+sustituyendo la referencia al paquete vigente en una única asignación.
+Las sesiones toman el paquete vigente al empezar cada ejecución y lo usan
+hasta terminarla, así que nunca esperan a una recarga ni mezclan versiones.
+Las partes de una versión sustituida se borran cuando ya no queda ninguna
+referencia a su paquete.
+"""
+import gc
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+from almacen_datos import (DIR_CACHE, DIR_DATOS, PATRON_LIBROS, almacen_al_dia, leer_manifiesto, purgar_version,
+                           sincronizar_almacen, version_almacen)
+from instrumentacion import descartar_ejecucion, finalizar_ejecucion, iniciar_ejecucion
+
+logger = logging.getLogger('aena.refresco')
+
+INTERVALO_REFRESCO = float(os.environ.get('AENA_INTERVALO_REFRESCO', '60'))
+
+
+def sincronizar_en_proceso(dir_datos=DIR_DATOS, patron=PATRON_LIBROS, dir_cache=DIR_CACHE):
+    """Sincroniza el almacén en un proceso nuevo y devuelve el manifiesto"""
+    # 'spawn' evita heredar los hilos del servidor en un fork
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as proceso:
+        return proceso.submit(sincronizar_almacen, dir_datos, patron, dir_cache).result()
+
+
+class VigilanteDatos:
+    """Mantiene el paquete de datos vigente y lo renueva en segundo plano
+
+    ``construir(manifiesto)`` devuelve el paquete de una versión (con atributo
+    ``version``); se llama fuera de las sesiones salvo en la primera carga.
+    """
+
+    def __init__(self, construir, intervalo=INTERVALO_REFRESCO, dir_datos=DIR_DATOS,
+                 patron=PATRON_LIBROS, dir_cache=DIR_CACHE, ingesta_en_proceso=True):
+        self._construir = construir
+        self.intervalo = intervalo
+        self.dir_datos = dir_datos
+        self.patron = patron
+        self.dir_cache = dir_cache
+        self.ingesta_en_proceso = ingesta_en_proceso
+        self._vigente = None
+        # Versiones sustituidas y una referencia débil a su paquete: sus partes se borran al liberarlo
+        self._retiradas = []
+        # Último error al refrescar (se sigue sirviendo la versión anterior)
+        self.error = None
+        self.actualizado = None
+        self._bloqueo_carga = threading.Lock()
+        self._parar = threading.Event()
+        self._hilo = None
+
+    def vigente(self):
+        """Paquete vigente; solo la primera carga del proceso espera a que se construya"""
+        paquete = self._vigente
+        if paquete is None:
+            with self._bloqueo_carga:
+                if self._vigente is None:
+                    self._publicar(self._construir(sincronizar_almacen(self.dir_datos, self.patron, self.dir_cache)))
+                paquete = self._vigente
+        return paquete
+
+    def _publicar(self, paquete):
+        """Sustituye el paquete vigente de una sola vez"""
+        anterior = self._vigente
+        self._vigente = paquete
+        self.actualizado = time.time()
+        self.error = None
+        if anterior is not None and anterior.version != paquete.version:
+            self._retiradas.append((anterior.version, weakref.ref(anterior)))
+
+    def purgar_retiradas(self):
+        """Borra las partes de las versiones sustituidas cuyo paquete ya no usa ninguna sesión
+
+        Devuelve las versiones borradas.
+        """
+        if any(paquete() is not None for _, paquete in self._retiradas):
+            # Los paquetes pueden tener ciclos de referencias (p. ej. contexto y motor SQL)
+            gc.collect()
+        liberadas = {version for version, paquete in self._retiradas if paquete() is None}
+        self._retiradas = [(version, paquete) for version, paquete in self._retiradas if paquete() is not None]
+        # Una versión liberada puede volver a estar vigente o seguir en uso por otro paquete
+        en_uso = {version for version, _ in self._retiradas}
+        if self._vigente is not None:
+            en_uso.add(self._vigente.version)
+        borradas = sorted(liberadas - en_uso)
+        for version in borradas:
+            purgar_version(version, self.dir_cache)
+        return borradas
+
+    def refrescar(self):
+        """Ingiere los libros cambiados y, si cambia la versión, construye y publica el nuevo paquete
+
+        Devuelve True si se publicó una versión nueva.
+        """
+        with self._bloqueo_carga:
+            try:
+                self.purgar_retiradas()
+                manifiesto = leer_manifiesto(self.dir_cache)
+                if not almacen_al_dia(manifiesto, self.dir_datos, self.patron):
+                    if self.ingesta_en_proceso:
+                        manifiesto = sincronizar_en_proceso(self.dir_datos, self.patron, self.dir_cache)
+                    else:
+                        manifiesto = sincronizar_almacen(self.dir_datos, self.patron, self.dir_cache)
+                actual = self._vigente
+                if actual is not None and version_almacen(manifiesto) == actual.version:
+                    self.error = None
+                    return False
+                inicio = time.perf_counter()
+                paquete = self._construir(manifiesto)
+                self._publicar(paquete)
+                logger.info("Datos actualizados a la versión %s en %.1f s", paquete.version, time.perf_counter() - inicio)
+                return True
+            except Exception as e:
+                self.error = e
+                logger.exception("Error al refrescar los datos")
+                return False
+
+    def _bucle(self):
+        """Bucle del hilo vigilante
+
+        Cada ciclo es una ejecución propia del hilo: se registra si publicó una
+        versión nueva y se descarta si no, para que sus tiempos no se acumulen.
+        """
+        while not self._parar.wait(self.intervalo):
+            iniciar_ejecucion()
+            publicado = False
+            try:
+                publicado = self.refrescar()
+            finally:
+                if publicado:
+                    finalizar_ejecucion()
+                else:
+                    descartar_ejecucion()
+
+    def iniciar(self):
+        """Arranca el hilo vigilante (una sola vez)"""
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name='vigilante-datos-aena', daemon=True)
+            self._hilo.start()
+        return self
+
+    def detener(self):
+        """Detiene el hilo vigilante"""
+        self._parar.set()
@@ -0,0 +1,46 @@
+"""
+Tabla de datos paginada en el servidor.
+
+La tabla trabaja con posiciones de fila: la ordenación se hace sobre la
+columna tipada (solo esa columna de las filas seleccionadas) y únicamente
+las filas de la página visible se extraen y se formatean para el navegador.
+"""
+import math
+
+from indice_filtros import FECHA_COL, AEROPUERTO_COL, EMPRESA_COL, IMPORTE_COL
+
+PRESUPUESTO_COL = 'Presupuesto base sin impuestos'
+COLUMNAS_TABLA = [
+    AEROPUERTO_COL, 'Número de expediente', 'Objeto del Contrato',
+    PRESUPUESTO_COL, IMPORTE_COL,
+    FECHA_COL, EMPRESA_COL, 'Porcentaje_Ahorro'
+]
+TAMANOS_PAGINA = [25, 50, 100, 250]
+
+
+def ordenar_posiciones(df, posiciones, columna, ascendente=True):
+    """Reordena las posiciones según los valores tipados de una columna (nulos al final)"""
+    valores = df[columna].iloc[posiciones]
+    valores.index = posiciones
+    return valores.sort_values(ascending=ascendente, kind='stable', na_position='last').index.to_numpy()
+
+
+def numero_paginas(n_filas, tamano_pagina):
+    """Número de páginas necesarias (al menos una)"""
+    return max(1, math.ceil(n_filas / tamano_pagina))
+
+
+def posiciones_pagina(posiciones, pagina, tamano_pagina):
+    """Posiciones de las filas de una página (numerada desde 1)"""
+    inicio = (pagina - 1) * tamano_pagina
+    return posiciones[inicio:inicio + tamano_pagina]
+
+
+def formatear_pagina(df_pagina):
+    """Da formato de presentación a las filas de una página"""
+    df_mostrar = df_pagina[COLUMNAS_TABLA].copy()
+    for columna in (PRESUPUESTO_COL, IMPORTE_COL):
+        df_mostrar[columna] = df_mostrar[columna].map('{:,.0f} €'.format)
+    df_mostrar[FECHA_COL] = df_mostrar[FECHA_COL].dt.strftime('%d/%m/%Y')
+    df_mostrar['Porcentaje_Ahorro'] = df_mostrar['Porcentaje_Ahorro'].map('{:.1f}%'.format)
+    return df_mostrar
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from almacen_datos import sincronizar_almacen
+from benchmark import generar_datos
+from indice_filtros import AEROPUERTO_COL, EMPRESA_COL, FECHA_COL, IMPORTE_COL
+from informes import Contexto
+
+
+@pytest.fixture
+def datos_sinteticos():
+    """Filas sintéticas con las columnas de los libros de AENA, con acentos y signos en los textos"""
+    df = generar_datos(400, semilla=1)
+    df.loc[:9, 'Objeto del Contrato'] = 'Señalización de la terminal de MÁLAGA (n.º 2)'
+    df.loc[10:14, EMPRESA_COL] = 'CONSTRUCCIÓN Y ÑANDÚ, S.A.'
+    return df
+
+
+@pytest.fixture
+def escribir_libro(tmp_path):
+    """Escribe un DataFrame como libro de AENA en ``tmp_path/datos`` y devuelve su ruta"""
+    dir_datos = tmp_path / 'datos'
+    dir_datos.mkdir(exist_ok=True)
+
+    def escribir(df, nombre='2024_AENA.xlsx'):
+        ruta = dir_datos / nombre
+        df.to_excel(ruta, index=False)
+        return str(ruta)
+    return escribir
+
+
+@pytest.fixture
+def almacen(tmp_path, datos_sinteticos, escribir_libro):
+    """Manifiesto y directorio de un almacén con los datos sintéticos"""
+    ruta = escribir_libro(datos_sinteticos)
+    dir_cache = str(tmp_path / 'cache')
+    return sincronizar_almacen(os.path.dirname(ruta), dir_cache=dir_cache), dir_cache
+
+
+@pytest.fixture
+def contexto(almacen):
+    """Contexto en memoria (conjunto preparado, índices y motor) del almacén sintético"""
+    manifiesto, dir_cache = almacen
+    return Contexto(manifiesto, dir_cache)
+
+
+def _mascara_filtros(df, filtros):
+    """Máscara de un estado de filtros calculada directamente en pandas; las fechas sin hora abarcan el día"""
+    mascara = df[IMPORTE_COL].between(*filtros.rango_importes)
+    if filtros.aeropuertos:
+        mascara &= df[AEROPUERTO_COL].isin(filtros.aeropuertos)
+    if filtros.empresas:
+        mascara &= df[EMPRESA_COL].isin(filtros.empresas)
+    if filtros.rango_fechas:
+        desde, hasta = filtros.rango_fechas[0], filtros.rango_fechas[-1]
+        mascara &= (df[FECHA_COL] >= pd.Timestamp(desde)) & (df[FECHA_COL] < pd.Timestamp(hasta) + pd.Timedelta(days=1))
+    return mascara.to_numpy()
+
+
+@pytest.fixture
+def mascara_filtros():
+    """Referencia en pandas de los filtros del sidebar"""
+    return _mascara_filtros
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from agregaciones import AHORRO_COL, EXPEDIENTE_COL, MESES, PRESUPUESTO_COL
+from benchmark import filtros_aleatorios
+from indice_filtros import AEROPUERTO_COL, EMPRESA_COL, FECHA_COL, IMPORTE_COL
+
+
+@pytest.fixture
+def filtros_variados(contexto):
+    # Con y sin filtro de importes: del cubo y recorriendo filas
+    return [contexto.filtros(), contexto.filtros(importe_min=50_000)] + filtros_aleatorios(contexto.opciones, 30, 5)
+
+
+def comprobar_agregados(agregados, df):
+    """Compara unos agregados con los mismos cálculos hechos en pandas sobre las filas filtradas"""
+    assert agregados.total_licitaciones == len(df)
+    assert agregados.presupuesto_total == pytest.approx(df[PRESUPUESTO_COL].sum())
+    assert agregados.adjudicado_total == pytest.approx(df[IMPORTE_COL].sum())
+    if len(df):
+        assert agregados.porcentaje_baja_medio == pytest.approx(df[AHORRO_COL].astype(float).mean())
+
+    por_aeropuerto = df.groupby(AEROPUERTO_COL, observed=True)
+    assert agregados.aeropuertos_count.to_dict() == por_aeropuerto.size().to_dict()
+    pd.testing.assert_series_equal(agregados.aeropuertos_importe.sort_index(),
+                                   por_aeropuerto[IMPORTE_COL].sum().astype(float), check_names=False,
+                                   check_index_type=False, check_categorical=False)
+    con_empresa = df[df[EMPRESA_COL].notna()]
+    assert agregados.empresas_count.to_dict() == con_empresa.groupby(EMPRESA_COL, observed=True).size().to_dict()
+    assert agregados.total_empresas == con_empresa[EMPRESA_COL].nunique()
+    # Los rankings van de mayor a menor
+    assert agregados.empresas_importe.is_monotonic_decreasing
+
+    meses = df[FECHA_COL].dt.to_period('M').dt.to_timestamp()
+    mensual = df.groupby(meses).agg(expedientes=(EXPEDIENTE_COL, 'count'), presupuesto=(PRESUPUESTO_COL, 'sum'))
+    assert agregados.mensual[EXPEDIENTE_COL].tolist() == mensual['expedientes'].tolist()
+    np.testing.assert_allclose(agregados.mensual[PRESUPUESTO_COL], mensual['presupuesto'])
+    por_mes = df[FECHA_COL].dt.month_name().value_counts().reindex(MESES, fill_value=0)
+    assert agregados.licitaciones_por_mes.tolist() == por_mes.tolist()
+
+
+def test_agregados_igual_que_pandas(contexto, filtros_variados, mascara_filtros):
+    for filtros in filtros_variados:
+        filas = contexto.df[mascara_filtros(contexto.df, filtros)]
+        comprobar_agregados(contexto.motor.agregados(filtros), filas)
+
+
+def test_agregados_memorizados_por_estado_normalizado(contexto):
+    filtros = contexto.filtros(aeropuertos=contexto.opciones.aeropuertos[:2])
+    primero = contexto.motor.agregados(filtros)
+    # El mismo estado con la selección en otro orden es la misma consulta
+    assert contexto.motor.agregados(filtros._replace(aeropuertos=filtros.aeropuertos[::-1])) is primero
+    assert contexto.motor.cache.estadisticas.aciertos == 1
+
+
+def test_cubo_responde_solo_sin_filtro_de_importes(contexto):
+    cubo = contexto.motor.cubo
+    assert cubo.responde(contexto.filtros())
+    assert not cubo.responde(contexto.filtros(importe_min=50_000))
+    assert not cubo.responde(contexto.filtros(importe_max=contexto.opciones.importe_max / 2))
+
+
+def test_cubo_descompone_en_celdas_completas_y_filas_de_borde(contexto):
+    cubo, base = contexto.motor.cubo, contexto.motor.base
+    fecha_min, fecha_max = contexto.opciones.fecha_min.date(), contexto.opciones.fecha_max.date()
+    estados = [contexto.filtros(), contexto.filtros(desde=fecha_min.replace(day=15), hasta=fecha_max.replace(day=10)),
+               contexto.filtros(desde=fecha_max.replace(day=3), hasta=fecha_max.replace(day=20)),
+               contexto.filtros(aeropuertos=contexto.opciones.aeropuertos[:3])]
+    estados += [f for f in filtros_aleatorios(contexto.opciones, 30, 7) if cubo.responde(f)]
+    for filtros in estados:
+        seleccion, bordes = cubo.descomponer(filtros)
+        filas = contexto.indice.filtrar(*filtros)
+        # Cada fila filtrada está en una celda completa o en los bordes, nunca en ambos
+        en_celdas = seleccion[base.celda_de_fila[filas]]
+        np.testing.assert_array_equal(np.sort(bordes), filas[~en_celdas])
+        np.testing.assert_allclose(cubo.medidas_filtradas(filtros), base.sumar_filas(filas))
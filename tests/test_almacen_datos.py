@@ -0,0 +1,82 @@
+import os
+
+import pandas as pd
+
+import almacen_datos
+from almacen_datos import PREFIJO_BUSQUEDA, leer_almacen, leer_manifiesto, sincronizar_almacen, version_almacen
+from indice_filtros import EMPRESA_COL, FECHA_COL, IMPORTE_COL
+
+
+def test_almacen_reproduce_el_libro(almacen, datos_sinteticos):
+    manifiesto, _ = almacen
+    df = leer_almacen(manifiesto)
+    assert list(df.columns) == list(datos_sinteticos.columns)
+    assert not any(c.startswith(PREFIJO_BUSQUEDA) for c in df.columns)
+    pd.testing.assert_series_equal(df[FECHA_COL], datos_sinteticos[FECHA_COL], check_dtype=False)
+    pd.testing.assert_series_equal(df[IMPORTE_COL], datos_sinteticos[IMPORTE_COL])
+    assert df[EMPRESA_COL].fillna('').tolist() == datos_sinteticos[EMPRESA_COL].fillna('').tolist()
+
+
+def test_manifiesto_persistente_y_version_estable(almacen):
+    manifiesto, dir_cache = almacen
+    guardado = leer_manifiesto(dir_cache)
+    assert guardado == manifiesto
+    assert version_almacen(guardado) == version_almacen(manifiesto)
+    # Las partes se guardan relativas al almacén y se leen con ruta absoluta
+    parte = next(iter(guardado['libros'].values()))['partes'][0]
+    assert os.path.isabs(parte['parquet']) and os.path.exists(parte['parquet'])
+
+
+def no_ingerir(ruta, *args):
+    raise AssertionError(f"No debería ingerirse {ruta}")
+
+
+def test_libro_sin_cambios_no_se_vuelve_a_leer(almacen, monkeypatch):
+    manifiesto, dir_cache = almacen
+    dir_datos = os.path.dirname(next(iter(manifiesto['libros'])))
+    monkeypatch.setattr(almacen_datos, 'ingerir_libro', no_ingerir)
+    assert sincronizar_almacen(dir_datos, dir_cache=dir_cache) == manifiesto
+
+
+def test_solo_se_ingieren_los_libros_nuevos_o_modificados(almacen, datos_sinteticos, escribir_libro, monkeypatch):
+    manifiesto, dir_cache = almacen
+    ruta_2024 = next(iter(manifiesto['libros']))
+    dir_datos = os.path.dirname(ruta_2024)
+    ingeridos = []
+    ingerir = almacen_datos.ingerir_libro
+
+    def contar(ruta, *args):
+        ingeridos.append(os.path.basename(ruta))
+        return ingerir(ruta, *args)
+    monkeypatch.setattr(almacen_datos, 'ingerir_libro', contar)
+
+    escribir_libro(datos_sinteticos.iloc[:100], '2023_AENA.xlsx')
+    manifiesto = sincronizar_almacen(dir_datos, dir_cache=dir_cache)
+    assert ingeridos == ['2023_AENA.xlsx']
+    # Las partes se concatenan en el orden de los libros
+    df = leer_almacen(manifiesto)
+    assert len(df) == 500
+    assert df[IMPORTE_COL].iloc[:100].equals(datos_sinteticos[IMPORTE_COL].iloc[:100])
+
+    escribir_libro(datos_sinteticos.iloc[:50], '2023_AENA.xlsx')
+    manifiesto = sincronizar_almacen(dir_datos, dir_cache=dir_cache)
+    assert ingeridos == ['2023_AENA.xlsx', '2023_AENA.xlsx']
+    assert len(leer_almacen(manifiesto)) == 450
+
+    os.remove(os.path.join(dir_datos, '2023_AENA.xlsx'))
+    manifiesto = sincronizar_almacen(dir_datos, dir_cache=dir_cache)
+    assert list(manifiesto['libros']) == [ruta_2024]
+    assert len(leer_almacen(manifiesto)) == 400
+
+
+def test_hojas_sin_licitaciones_se_ignoran(tmp_path, datos_sinteticos):
+    dir_datos = tmp_path / 'datos'
+    dir_datos.mkdir()
+    with pd.ExcelWriter(dir_datos / '2024_AENA.xlsx') as libro:
+        datos_sinteticos.iloc[:30].to_excel(libro, sheet_name='Enero', index=False)
+        pd.DataFrame({'Nota': ['Resumen']}).to_excel(libro, sheet_name='Notas', index=False)
+        datos_sinteticos.iloc[30:70].to_excel(libro, sheet_name='Febrero', index=False)
+    manifiesto = sincronizar_almacen(str(dir_datos), dir_cache=str(tmp_path / 'cache'))
+    partes = next(iter(manifiesto['libros'].values()))['partes']
+    assert [(p['hoja'], p['filas']) for p in partes] == [('Enero', 30), ('Febrero', 40)]
+    assert len(leer_almacen(manifiesto)) == 70
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('duckdb')
+
+from agregaciones import EXPEDIENTE_COL
+from backend_sql import CONSULTAS_PARIDAD, ContextoSQL, comprobar_busqueda
+from benchmark import filtros_aleatorios
+from indice_filtros import IMPORTE_COL
+from informes import Contexto, tablas_informe
+from tabla_paginada import ordenar_posiciones
+
+
+@pytest.fixture
+def contextos(almacen):
+    manifiesto, dir_cache = almacen
+    return Contexto(manifiesto, dir_cache, con_busqueda=True), ContextoSQL(manifiesto, dir_cache)
+
+
+def test_busqueda_igual_en_los_dos_backends(contextos):
+    contexto, contexto_sql = contextos
+    consultas = CONSULTAS_PARIDAD + ['senalizacion', 'MALAGA', 'construccion y nandu', 's.a', 'empresa 0000']
+    assert comprobar_busqueda(contexto, contexto_sql, contexto.filtros(), consultas) == []
+    # Las filas sin importe nunca entran en el rango de importes
+    esperadas = [i for i in range(10) if contexto.df[IMPORTE_COL].notna().iloc[i]]
+    assert contexto_sql.filas(contexto.filtros(), 'malaga').tolist() == esperadas
+
+
+def test_busqueda_usa_los_textos_normalizados_de_las_partes(contextos):
+    _, contexto_sql = contextos
+    # Sin funciones de Python por fila: la búsqueda es un contains sobre columnas guardadas
+    condicion, parametros = contexto_sql._condicion_busqueda(contextos[0].filtros(), 'MÁLAGA')
+    assert 'normalizar' not in condicion
+    assert 'malaga' in parametros
+
+
+def test_agregados_y_filas_igual_que_en_memoria(contextos):
+    contexto, contexto_sql = contextos
+    lista = [contexto.filtros(), contexto.filtros(importe_min=50_000)] + filtros_aleatorios(contexto.opciones, 15, 8)
+    for filtros in lista:
+        posiciones = contexto.indice.filtrar(*filtros)
+        np.testing.assert_array_equal(contexto_sql.filas(filtros), posiciones)
+        assert contexto_sql.contar(filtros) == len(posiciones)
+        en_memoria, en_sql = contexto.motor.agregados(filtros), contexto_sql.motor.agregados(filtros)
+        assert en_sql.total_licitaciones == en_memoria.total_licitaciones
+        for nombre, tabla in tablas_informe(en_memoria).items():
+            pd.testing.assert_frame_equal(tablas_informe(en_sql)[nombre], tabla, check_dtype=False, obj=nombre)
+        pd.testing.assert_frame_equal(contexto_sql.motor.serie_temporal(filtros, 'W'),
+                                      contexto.motor.serie_temporal(filtros, 'W'), check_dtype=False)
+
+
+def test_pagina_ordenada_igual_que_en_memoria(contextos):
+    contexto, contexto_sql = contextos
+    filtros = contexto.filtros()
+    ordenadas = ordenar_posiciones(contexto.df, contexto.indice.filtrar(*filtros), IMPORTE_COL, ascendente=False)
+    pagina = contexto_sql.pagina(filtros, columna_orden=IMPORTE_COL, ascendente=False, pagina=2, tamano_pagina=30)
+    esperada = contexto.df.iloc[ordenadas[30:60]]
+    assert pagina[IMPORTE_COL].tolist() == esperada[IMPORTE_COL].tolist()
+    assert pagina[EXPEDIENTE_COL].tolist() == esperada[EXPEDIENTE_COL].astype(str).tolist()
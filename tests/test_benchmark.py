@@ -0,0 +1,34 @@
+import json
+
+import pandas as pd
+
+import benchmark
+from benchmark import comparar, generar_datos, main
+
+
+def test_datos_sinteticos_deterministas():
+    pd.testing.assert_frame_equal(generar_datos(300, semilla=3), generar_datos(300, semilla=3))
+    assert not generar_datos(300, semilla=3).equals(generar_datos(300, semilla=4))
+
+
+def test_comparar_detecta_regresiones():
+    referencia = {'1000': {'agregados': {'p50_ms': 10.0}, 'buscar': {'p50_ms': 0.1}}}
+    resultados = {'1000': {'agregados': {'p50_ms': 14.0}, 'buscar': {'p50_ms': 0.5}, 'nueva': {'p50_ms': 99.0}}}
+    # Solo supera el límite la etapa lenta; la rápida queda dentro del margen absoluto
+    assert comparar(resultados, referencia, 0.25, 0.5) == [('1000', 'agregados', 10.0, 14.0)]
+    assert comparar(resultados, referencia, 0.5, 0.5) == []
+
+
+def test_cli_guarda_y_compara(tmp_path, monkeypatch):
+    ruta = tmp_path / 'base.json'
+    assert main(['--tamanos', '500', '--consultas', '3', '--guardar', str(ruta)]) == 0
+    resultados = json.loads(ruta.read_text(encoding='utf-8'))
+    assert set(resultados['500']) >= {'cargar_datos', 'agregados', 'buscar', 'tabla_ordenada'}
+    assert all(v['repeticiones'] >= 1 and v['p50_ms'] >= 0 for v in resultados['500'].values())
+
+    # Una referencia imposiblemente rápida hace fallar la comparación
+    for valores in resultados['500'].values():
+        valores['p50_ms'] = 0.0
+    ruta.write_text(json.dumps(resultados), encoding='utf-8')
+    monkeypatch.setattr(benchmark, 'imprimir', lambda resultados: None)
+    assert main(['--tamanos', '500', '--consultas', '3', '--comparar', str(ruta), '--margen-ms', '0']) == 1
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from backend_sql import CONSULTAS_PARIDAD
+from busqueda import CAMPOS_BUSQUEDA, PATRON_PALABRA, IndiceBusqueda, normalizar_consulta, normalizar_serie
+
+CONSULTAS = CONSULTAS_PARIDAD + ['MÁLAGA', 'malaga (n', 'construccion y nandu', 'empresa 00001', 'pista',
+                                 'PISTA ilumin', 'zzz', 'señalizacion terminal']
+
+
+@pytest.fixture
+def textos(datos_sinteticos):
+    """Campos del buscador normalizados, fila a fila"""
+    return [normalizar_serie(datos_sinteticos[c]).tolist() for c in CAMPOS_BUSQUEDA]
+
+
+@pytest.fixture
+def indice(datos_sinteticos):
+    return IndiceBusqueda(datos_sinteticos)
+
+
+def literal(textos, consulta):
+    consulta = normalizar_consulta(consulta)
+    return np.array([i for i, fila in enumerate(zip(*textos)) if any(consulta in t for t in fila)], dtype=np.int64)
+
+
+def por_palabras(textos, consulta):
+    terminos = PATRON_PALABRA.findall(normalizar_consulta(consulta))
+    filas = []
+    for i, fila in enumerate(zip(*textos)):
+        palabras = [p for t in fila for p in PATRON_PALABRA.findall(t)]
+        if all(any(termino in p for p in palabras) for termino in terminos):
+            filas.append(i)
+    return np.array(filas, dtype=np.int64)
+
+
+def test_busqueda_literal_igual_que_fuerza_bruta(indice, textos):
+    for consulta in CONSULTAS:
+        np.testing.assert_array_equal(indice.buscar(consulta), literal(textos, consulta), err_msg=consulta)
+
+
+def test_busqueda_por_palabras_igual_que_fuerza_bruta(indice, textos):
+    for consulta in CONSULTAS:
+        if PATRON_PALABRA.findall(normalizar_consulta(consulta)):
+            np.testing.assert_array_equal(indice.buscar(consulta, exacta=False), por_palabras(textos, consulta),
+                                          err_msg=consulta)
+
+
+def test_relevancia_posiciones_y_refinado(indice, textos):
+    posiciones = np.arange(0, indice.n_filas, 3)
+    for consulta in ['malaga', 'mantenimiento', 'empresa 0000']:
+        esperadas = literal(textos, consulta)
+        # Por relevancia salen las mismas filas en otro orden
+        np.testing.assert_array_equal(np.sort(indice.buscar(consulta, por_relevancia=True)), esperadas)
+        np.testing.assert_array_equal(indice.buscar(consulta, posiciones), np.intersect1d(esperadas, posiciones))
+        # Al añadir una letra basta con refinar las filas del término anterior
+        np.testing.assert_array_equal(indice.refinar(consulta, indice.buscar(consulta[:-1])), esperadas)
@@ -0,0 +1,78 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cache_consultas
+from cache_consultas import CacheDisco, CacheMemoria, clave_filtros, crear_cache
+from indice_filtros import Filtros
+
+
+def test_lru_por_entradas_y_por_bytes():
+    cache = CacheMemoria(capacidad=2, ttl=60, max_bytes=1000)
+    cache.guardar('a', 1, tamano=100)
+    cache.guardar('b', 2, tamano=100)
+    assert cache.obtener('a') == 1
+    cache.guardar('c', 3, tamano=100)
+    # Sale la menos usada, no la más antigua
+    assert cache.obtener('b') is None and cache.obtener('a') == 1
+
+    cache.guardar('grande', np.zeros(100), tamano=None)
+    assert cache.bytes <= 1000 and cache.obtener('grande') is not None
+    cache.guardar('enorme', 0, tamano=2000)
+    assert cache.obtener('enorme') is None
+    assert cache.estadisticas.desalojos == 2
+
+
+def test_caducidad(monkeypatch):
+    ahora = [1000.0]
+    monkeypatch.setattr(cache_consultas.time, 'monotonic', lambda: ahora[0])
+    cache = CacheMemoria(capacidad=10, ttl=5, max_bytes=10_000)
+    cache.guardar('a', 1)
+    ahora[0] += 4
+    assert cache.obtener('a') == 1
+    ahora[0] += 2
+    assert cache.obtener('a') is None
+    assert cache.estadisticas.caducados == 1 and cache.bytes == 0
+
+
+def test_cache_en_disco_sobrevive_al_reinicio(tmp_path):
+    ruta = str(tmp_path / 'consultas.sqlite')
+    cache = CacheDisco(ruta, capacidad=2, ttl=60)
+    valor = pd.Series([1.0, 2.0], index=['x', 'y'])
+    cache.guardar(('k', 1), valor)
+    cache.guardar(('k', 2), 'dos')
+    cache.obtener(('k', 1))
+    cache.guardar(('k', 3), 'tres')
+
+    reabierta = CacheDisco(ruta, capacidad=2, ttl=60)
+    pd.testing.assert_series_equal(reabierta.obtener(('k', 1)), valor)
+    assert reabierta.obtener(('k', 2)) is None
+    assert reabierta.obtener(('k', 3)) == 'tres'
+    assert reabierta.estadisticas.como_dict()['proporcion_aciertos'] == pytest.approx(2 / 3)
+
+
+def test_clave_filtros_equivalentes():
+    dia = datetime.date(2024, 3, 1)
+    a = Filtros(['MAD', 'BCN'], [], (dia, datetime.date(2024, 3, 31)), (0, 10))
+    b = Filtros(('BCN', 'MAD'), (), (pd.Timestamp(dia), datetime.date(2024, 3, 31)), (0.0, 10.0))
+    assert clave_filtros(a) == clave_filtros(b)
+    # Un instante exacto como fin no abarca el día entero
+    c = Filtros(a.aeropuertos, a.empresas, (dia, pd.Timestamp('2024-03-31')), a.rango_importes)
+    assert clave_filtros(a) != clave_filtros(c)
+    assert clave_filtros(a, 'Málaga ') == clave_filtros(b, 'malaga ')
+    assert clave_filtros(a, 'malaga') != clave_filtros(a, 'malaga ')
+
+
+def test_motor_sirve_de_la_cache(contexto):
+    filtros = contexto.filtros(aeropuertos=contexto.opciones.aeropuertos[:2])
+    contexto.motor.cache = crear_cache('memoria')
+    primero = contexto.motor.agregados(filtros)
+    assert contexto.motor.agregados(filtros) is primero
+    assert contexto.motor.cache.estadisticas.aciertos >= 1
+
+
+def test_tipo_desconocido():
+    with pytest.raises(ValueError):
+        crear_cache('redis')
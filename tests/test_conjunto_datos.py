@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+import conjunto_datos
+from agregaciones import PRESUPUESTO_COL
+from almacen_datos import version_almacen
+from conjunto_datos import cargar_conjunto, purgar_conjuntos, ruta_conjunto
+
+
+def test_conjunto_se_genera_una_vez_y_se_comparte(almacen, monkeypatch, tmp_path):
+    manifiesto, dir_cache = almacen
+    dir_conjuntos = str(tmp_path / 'conjuntos')
+    primero = cargar_conjunto(manifiesto, dir_conjuntos, dir_cache)
+    assert os.path.exists(ruta_conjunto(version_almacen(manifiesto), dir_conjuntos))
+
+    # Las siguientes cargas abren el fichero sin volver a leer el almacén
+    monkeypatch.setattr(conjunto_datos, 'leer_almacen', lambda m: pytest.fail("Se ha vuelto a leer el almacén"))
+    segundo = cargar_conjunto(manifiesto, dir_conjuntos, dir_cache)
+    assert segundo.equals(primero)
+    # Las columnas numéricas sin nulos se usan directamente desde el fichero mapeado, de solo lectura
+    assert not segundo[PRESUPUESTO_COL].to_numpy().flags.writeable
+
+
+def test_purga_conserva_solo_la_version_vigente(tmp_path):
+    dir_conjuntos = tmp_path / 'conjuntos'
+    dir_conjuntos.mkdir()
+    for version in ('a', 'b', 'c'):
+        open(ruta_conjunto(version, str(dir_conjuntos)), 'w').close()
+    purgar_conjuntos('b', str(dir_conjuntos))
+    assert [p.name for p in dir_conjuntos.iterdir()] == [os.path.basename(ruta_conjunto('b'))]
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+RUTA_DASHBOARD = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ejecutar_dashboard.py')
+
+
+@pytest.fixture
+def app(tmp_path, datos_sinteticos, monkeypatch):
+    """Dashboard sobre un libro sintético; almacén y cachés quedan dentro de ``tmp_path``"""
+    datos_sinteticos.to_excel(tmp_path / '2024_AENA.xlsx', index=False)
+    monkeypatch.chdir(tmp_path)
+    # El vigilante y la caché de consultas son recursos del proceso: cada prueba empieza de cero
+    st.cache_resource.clear()
+    app = AppTest.from_file(RUTA_DASHBOARD, default_timeout=60).run()
+    assert not app.exception
+    return app
+
+
+def graficos(app):
+    return len(app.get('plotly_chart'))
+
+
+def test_solo_se_calcula_la_seccion_visible(app):
+    assert app.toggle(key='modo_perezoso').value
+    secciones = app.radio(key='seccion_activa').options
+    en_evolucion = graficos(app)
+    app.radio(key='seccion_activa').set_value(secciones[1]).run()
+    assert not app.exception
+    en_aeropuertos = graficos(app)
+    assert en_evolucion > 0 and en_aeropuertos > 0
+
+    # Con pestañas se dibujan todas las secciones en cada ejecución
+    app.toggle(key='modo_perezoso').set_value(False).run()
+    assert not app.exception
+    assert graficos(app) > max(en_evolucion, en_aeropuertos)
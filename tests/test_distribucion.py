@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import distribucion
+from agregaciones import AHORRO_COL
+from distribucion import (ANCHO_CLASE, CUANTILES, NOMBRES_CUANTILES, HistogramasAgrupados, agrupar_entradas,
+                          cuantiles_exactos)
+from indice_filtros import AEROPUERTO_COL
+
+
+def valores_filtrados(contexto, mascara_filtros, filtros):
+    df = contexto.df[mascara_filtros(contexto.df, filtros)]
+    return df[df[AHORRO_COL].notna()].assign(**{AHORRO_COL: lambda d: d[AHORRO_COL].astype(float)})
+
+
+def test_cuantiles_exactos_como_numpy():
+    rng = np.random.default_rng(0)
+    grupos = rng.integers(0, 5, 300)
+    valores = rng.normal(10, 5, 300)
+    resultado = cuantiles_exactos(grupos, valores, 6)
+    for g in range(5):
+        np.testing.assert_allclose(resultado[g], np.quantile(valores[grupos == g], CUANTILES))
+    assert np.isnan(resultado[5]).all()
+
+
+@pytest.mark.parametrize('importe_min', [None, 50_000])
+def test_grupos_pequenos_exactos_y_grandes_dentro_de_la_clase(contexto, mascara_filtros, importe_min):
+    # Con o sin filtro de importes: desde el cubo o desde las filas
+    filtros = contexto.filtros(importe_min=importe_min)
+    df = valores_filtrados(contexto, mascara_filtros, filtros)
+    resultado = contexto.motor.distribucion(filtros)
+    assert resultado.total == len(df) > distribucion.UMBRAL_EXACTO
+    assert resultado.histograma['Licitaciones'].sum() == len(df)
+    assert resultado.resumen['Mínimo'] == df[AHORRO_COL].min() and resultado.resumen['Máximo'] == df[AHORRO_COL].max()
+    exactos = np.quantile(df[AHORRO_COL], CUANTILES)
+    np.testing.assert_allclose(resultado.resumen[list(NOMBRES_CUANTILES)], exactos, atol=ANCHO_CLASE)
+
+    # Cada aeropuerto tiene pocas filas: sus cuantiles son los de numpy
+    tabla = resultado.por_grupo['Aeropuerto'].set_index('Aeropuerto')
+    for aeropuerto, grupo in df.groupby(AEROPUERTO_COL, observed=True):
+        assert tabla.loc[aeropuerto, 'Licitaciones'] == len(grupo)
+        np.testing.assert_allclose(tabla.loc[aeropuerto, list(NOMBRES_CUANTILES)].to_numpy(dtype=float),
+                                   np.quantile(grupo[AHORRO_COL], CUANTILES))
+
+
+def test_histograma_denso_dentro_de_la_clase():
+    rng = np.random.default_rng(1)
+    valores = np.concatenate((rng.normal(15, 8, 20_000), [-35.0, 140.0]))
+    grupos = np.zeros(len(valores), dtype=np.int64)
+    histogramas = HistogramasAgrupados(*agrupar_entradas(grupos, valores), 1)
+    # Los extremos son exactos, incluidos los de las clases abiertas de los bordes
+    assert histogramas.minimo[0] == -35.0 and histogramas.maximo[0] == 140.0
+    np.testing.assert_allclose(histogramas.cuantiles()[0], np.quantile(valores, CUANTILES), atol=ANCHO_CLASE)
+
+
+def test_grupos_pequenos_necesitan_los_valores(contexto, mascara_filtros, monkeypatch):
+    filtros = contexto.filtros()
+    df = valores_filtrados(contexto, mascara_filtros, filtros)
+    grupos = df.groupby(AEROPUERTO_COL, observed=True)
+    exactos = np.array([np.quantile(g[AHORRO_COL], CUANTILES) for _, g in grupos])
+    monkeypatch.setattr(distribucion, 'UMBRAL_EXACTO', 0)
+    tabla = contexto.motor.histogramas.distribucion(filtros).por_grupo['Aeropuerto'].sort_values('Aeropuerto')
+    assert tabla['Aeropuerto'].tolist() == list(grupos.groups)
+    interpolados = tabla[list(NOMBRES_CUANTILES)].to_numpy(dtype=float)
+    # Con las clases dispersas de unos pocos valores la interpolación se aleja de los cuantiles reales
+    assert np.abs(interpolados - exactos).max() > ANCHO_CLASE
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from esquema_datos import (COLUMNAS_CATEGORICAS, COLUMNAS_TEXTO, columna_derivada, con_columnas_derivadas,
+                           informe_memoria, preparar_dataset)
+from indice_filtros import EMPRESA_COL, FECHA_COL, IMPORTE_COL
+
+
+@pytest.fixture
+def preparado(datos_sinteticos):
+    return preparar_dataset(datos_sinteticos.copy())
+
+
+def test_esquema_compacto_conserva_los_valores(datos_sinteticos, preparado):
+    for columna in COLUMNAS_CATEGORICAS:
+        assert isinstance(preparado[columna].dtype, pd.CategoricalDtype)
+    for columna in COLUMNAS_TEXTO:
+        assert preparado[columna].dtype == 'string[pyarrow]'
+    assert preparado['Porcentaje_Ahorro'].dtype == np.float32
+    assert preparado[IMPORTE_COL].dtype == np.float64
+    assert preparado[EMPRESA_COL].astype(object).fillna('').tolist() == datos_sinteticos[EMPRESA_COL].fillna('').tolist()
+    np.testing.assert_allclose(preparado['Porcentaje_Ahorro'], datos_sinteticos['%baja'] * 100, rtol=1e-6)
+    assert preparado.memory_usage(deep=True).sum() < datos_sinteticos.memory_usage(deep=True).sum()
+
+
+def test_columnas_derivadas_bajo_demanda(preparado):
+    fechas = preparado[FECHA_COL]
+    assert columna_derivada(preparado, 'Año').tolist() == fechas.dt.year.tolist()
+    assert columna_derivada(preparado, 'Trimestre').tolist() == fechas.dt.quarter.tolist()
+    assert columna_derivada(preparado, 'Nombre_Mes').astype(str).tolist() == fechas.dt.month_name().tolist()
+    assert columna_derivada(preparado, 'Día_Semana').astype(str).tolist() == fechas.dt.day_name().tolist()
+    with pytest.raises(KeyError):
+        columna_derivada(preparado, 'Semana')
+    assert 'Mes' in con_columnas_derivadas(preparado.iloc[:5]).columns and 'Mes' not in preparado.columns
+
+
+def test_informe_de_memoria_por_anio(preparado):
+    informe = informe_memoria(preparado, presupuesto_mb=0)
+    assert informe['Filas'].sum() == len(preparado)
+    assert not informe['Dentro del presupuesto'].any()
+    assert informe['MB'].sum() == pytest.approx(preparado.memory_usage(deep=True).sum() / 1e6)
@@ -0,0 +1,60 @@
+import gzip
+import io
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import exportacion
+from esquema_datos import con_columnas_derivadas
+from exportacion import clave_exportacion, escribir_exportacion, exportar, iterar_csv, purgar_exportaciones
+from indice_filtros import IMPORTE_COL
+
+
+@pytest.fixture
+def posiciones(contexto):
+    return contexto.indice.filtrar(*contexto.filtros(importe_min=100_000))
+
+
+def test_csv_por_bloques_igual_que_de_una_vez(contexto, posiciones):
+    esperado = '\ufeff' + con_columnas_derivadas(contexto.df.iloc[posiciones]).to_csv(index=False)
+    assert b''.join(iterar_csv(contexto.df, posiciones, tamano_bloque=7)).decode('utf-8') == esperado
+    vacio = b''.join(iterar_csv(contexto.df, posiciones[:0])).decode('utf-8')
+    assert vacio == '\ufeff' + con_columnas_derivadas(contexto.df.iloc[:0]).to_csv(index=False)
+
+
+def test_formatos_de_exportacion(contexto, posiciones, tmp_path):
+    esperado = con_columnas_derivadas(contexto.df.iloc[posiciones]).reset_index(drop=True)
+    ruta = str(tmp_path / 'datos.csv.gz')
+    escribir_exportacion(contexto.df, posiciones, 'CSV comprimido (gzip)', ruta, tamano_bloque=7)
+    with gzip.open(ruta) as f:
+        assert len(pd.read_csv(io.BytesIO(f.read()), encoding='utf-8-sig')) == len(posiciones)
+
+    ruta = str(tmp_path / 'datos.parquet')
+    escribir_exportacion(contexto.df, posiciones, 'Parquet', ruta, tamano_bloque=7)
+    leido = pd.read_parquet(ruta)
+    assert list(leido.columns) == list(esperado.columns)
+    np.testing.assert_allclose(leido[IMPORTE_COL], esperado[IMPORTE_COL])
+
+
+def test_clave_de_estados_equivalentes(contexto):
+    filtros = contexto.filtros(aeropuertos=contexto.opciones.aeropuertos[:2])
+    desde, hasta = filtros.rango_fechas
+    equivalente = filtros._replace(aeropuertos=filtros.aeropuertos[::-1],
+                                   rango_fechas=(datetime.combine(desde, datetime.min.time()), hasta))
+    assert clave_exportacion('v1', filtros) == clave_exportacion('v1', equivalente)
+    assert clave_exportacion('v1', filtros) != clave_exportacion('v2', filtros)
+    assert clave_exportacion('v1', filtros) != clave_exportacion('v1', filtros._replace(aeropuertos=()))
+
+
+def test_exportacion_reutilizada_y_purgada(contexto, posiciones, tmp_path, monkeypatch):
+    dir_exportaciones = str(tmp_path / 'exportaciones')
+    ruta = exportar(contexto.df, posiciones, 'CSV', 'clave', dir_exportaciones)
+    monkeypatch.setattr(exportacion, 'escribir_exportacion', lambda *args: pytest.fail("Se ha vuelto a generar"))
+    assert exportar(contexto.df, posiciones, 'CSV', 'clave', dir_exportaciones) == ruta
+
+    for i in range(5):
+        (tmp_path / 'exportaciones' / f"otra{i}.csv").write_text('x')
+    purgar_exportaciones(dir_exportaciones, maximo=3)
+    assert len(list((tmp_path / 'exportaciones').iterdir())) == 3
@@ -0,0 +1,47 @@
+import numpy as np
+import plotly.graph_objects as go
+import pytest
+
+from agregaciones import EXPEDIENTE_COL, PRESUPUESTO_COL
+from graficos import lttb, traza_linea
+from indice_filtros import FECHA_COL
+
+
+def test_lttb_conserva_extremos_y_picos():
+    x = np.arange(10_000)
+    y = np.sin(x / 300.0)
+    y[4321] = 50.0
+    y[7000] = -50.0
+    indices = lttb(x, y, 200)
+    assert len(indices) == 200
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert np.all(np.diff(indices) > 0)
+    assert {4321, 7000} <= set(indices.tolist())
+    # Series cortas se dejan intactas
+    assert lttb(x[:50], y[:50], 200).tolist() == list(range(50))
+
+
+def test_traza_linea_cambia_a_webgl_por_encima_del_umbral():
+    fechas = np.arange('2020-01-01', '2025-01-01', dtype='datetime64[D]')
+    valores = np.random.default_rng(0).random(len(fechas))
+    corta = traza_linea(fechas[:100], valores[:100], umbral=1000, marker=dict(size=4))
+    assert isinstance(corta, go.Scatter) and corta.mode == 'lines+markers' and len(corta.x) == 100
+    larga = traza_linea(fechas, valores, umbral=1000, max_puntos=300, marker=dict(size=4), name='serie')
+    assert isinstance(larga, go.Scattergl) and larga.mode == 'lines' and larga.name == 'serie'
+    assert len(larga.x) == 300 and larga.x[0] == fechas[0] and larga.x[-1] == fechas[-1]
+
+
+@pytest.mark.parametrize('granularidad, frecuencia', [('D', 'D'), ('W', 'W-SUN')])
+def test_serie_temporal_como_pandas(contexto, mascara_filtros, granularidad, frecuencia):
+    filtros = contexto.filtros(aeropuertos=contexto.opciones.aeropuertos[:3])
+    df = contexto.df[mascara_filtros(contexto.df, filtros)]
+    df = df[df[FECHA_COL].notna()]
+    serie = contexto.motor.serie_temporal(filtros, granularidad)
+
+    periodos = df[FECHA_COL].dt.to_period(frecuencia).dt.start_time
+    esperada = df.groupby(periodos).agg(expedientes=(EXPEDIENTE_COL, 'count'), presupuesto=(PRESUPUESTO_COL, 'sum'))
+    assert serie['Fecha'].tolist() == esperada.index.tolist()
+    assert serie[EXPEDIENTE_COL].tolist() == esperada['expedientes'].tolist()
+    np.testing.assert_allclose(serie[PRESUPUESTO_COL], esperada['presupuesto'])
+    # Memorizada por estado de filtros
+    assert contexto.motor.serie_temporal(filtros, granularidad) is serie
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from agregaciones import MotorAgregaciones
+from benchmark import filtros_aleatorios
+from esquema_datos import preparar_dataset
+from indice_filtros import AEROPUERTO_COL, EMPRESA_COL, FECHA_COL, IMPORTE_COL, Filtros, IndiceFiltros, OpcionesFiltros
+
+
+@pytest.fixture
+def indice(datos_sinteticos):
+    return IndiceFiltros(datos_sinteticos)
+
+
+@pytest.fixture
+def filtros_variados(datos_sinteticos, indice):
+    return filtros_aleatorios(OpcionesFiltros(datos_sinteticos, indice), 60, semilla=3)
+
+
+def test_filtrar_igual_que_pandas(datos_sinteticos, indice, filtros_variados, mascara_filtros):
+    for filtros in filtros_variados:
+        esperadas = np.flatnonzero(mascara_filtros(datos_sinteticos, filtros))
+        np.testing.assert_array_equal(indice.filtrar(*filtros), esperadas)
+
+
+def test_comprobar_coincide_con_filtrar(indice, filtros_variados):
+    todas = np.arange(indice.n_filas)
+    for filtros in filtros_variados:
+        np.testing.assert_array_equal(todas[indice.comprobar(todas, *filtros)], indice.filtrar(*filtros))
+
+
+def test_valores_inexistentes_y_rangos_vacios(datos_sinteticos, indice):
+    importes = (0, float('inf'))
+    assert len(indice.filtrar(('ZZZ',), (), (), importes)) == 0
+    assert len(indice.filtrar((), (), (), (5, 1))) == 0
+    # Los importes nulos nunca entran en el rango
+    assert len(indice.filtrar((), (), (), importes)) == datos_sinteticos[IMPORTE_COL].notna().sum()
+
+
+def test_opciones_en_cascada_igual_que_pandas(datos_sinteticos, indice):
+    opciones = OpcionesFiltros(datos_sinteticos, indice)
+    df = datos_sinteticos
+    assert opciones.aeropuertos == sorted(df[AEROPUERTO_COL].unique())
+    assert opciones.empresas == sorted(df[EMPRESA_COL].dropna().unique())
+    for i in range(0, len(opciones.aeropuertos), 5):
+        seleccion = tuple(opciones.aeropuertos[i:i + 2])
+        esperadas = tuple(sorted(df.loc[df[AEROPUERTO_COL].isin(seleccion), EMPRESA_COL].dropna().unique()))
+        assert opciones.empresas_disponibles(seleccion) == esperadas
+    for i in range(0, len(opciones.empresas), 7):
+        seleccion = tuple(opciones.empresas[i:i + 3])
+        esperados = tuple(sorted(df.loc[df[EMPRESA_COL].isin(seleccion), AEROPUERTO_COL].unique()))
+        assert opciones.aeropuertos_disponibles(seleccion) == esperados
+    assert opciones.empresas_disponibles(()) == tuple(opciones.empresas)
+
+
+def test_opciones_memorizadas_por_seleccion(datos_sinteticos, indice):
+    opciones = OpcionesFiltros(datos_sinteticos, indice)
+    seleccion = tuple(opciones.aeropuertos[:2])
+    assert opciones.empresas_disponibles(seleccion) is opciones.empresas_disponibles(seleccion)
+    assert opciones.empresas_disponibles.cache_info().hits == 1
+
+
+def test_rangos_con_hora_igual_que_pandas(datos_sinteticos):
+    df = datos_sinteticos.copy()
+    segundos = np.random.default_rng(2).integers(0, 86_400, len(df))
+    df[FECHA_COL] = pd.to_datetime(df[FECHA_COL]) + pd.to_timedelta(segundos, unit='s')
+    df = preparar_dataset(df)
+    indice = IndiceFiltros(df)
+    motor = MotorAgregaciones(df, indice, capacidad=0)
+    fechas = df[FECHA_COL].dropna().sort_values()
+    dia = pd.Timedelta(days=1)
+    # (desde, hasta, límite exclusivo esperado): las fechas sin hora abarcan el día, los instantes no
+    rangos = [
+        (fechas.iloc[10], fechas.iloc[10], fechas.iloc[10] + pd.Timedelta(1, 'ns')),
+        (fechas.iloc[20] - pd.Timedelta(hours=3), fechas.iloc[20] + pd.Timedelta(minutes=1),
+         fechas.iloc[20] + pd.Timedelta(minutes=1, nanoseconds=1)),
+        (fechas.iloc[5].to_pydatetime(), fechas.iloc[300].to_pydatetime(), fechas.iloc[300] + pd.Timedelta(1, 'ns')),
+        (fechas.iloc[0].date(), fechas.iloc[-1].date(), fechas.iloc[-1].normalize() + dia),
+        (np.datetime64('2022-02-01T12:30'), np.datetime64('2023-06-30'), pd.Timestamp('2023-07-01')),
+    ]
+    importes = (0, float('inf'))
+    for desde, hasta, fin in rangos:
+        mascara = (df[FECHA_COL] >= pd.Timestamp(desde)) & (df[FECHA_COL] < fin) & df[IMPORTE_COL].notna()
+        esperadas = np.flatnonzero(mascara.to_numpy())
+        np.testing.assert_array_equal(indice.filtrar((), (), (desde, hasta), importes), esperadas)
+        # El cubo resuelve los meses enteros y recorre solo las filas de los meses de los bordes
+        assert motor.agregados(Filtros((), (), (desde, hasta), importes)).total_licitaciones == len(esperadas)
@@ -0,0 +1,55 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from indice_filtros import AEROPUERTO_COL, IMPORTE_COL
+from informes import main, tablas_informe
+
+
+@pytest.fixture
+def argumentos(almacen):
+    manifiesto, dir_cache = almacen
+    return ['--dir-datos', os.path.dirname(next(iter(manifiesto['libros']))), '--dir-cache', dir_cache]
+
+
+def test_consulta_por_linea_de_comandos(argumentos, contexto, tmp_path, mascara_filtros):
+    aeropuerto = contexto.opciones.aeropuertos[0]
+    salida = str(tmp_path / 'informe.json')
+    assert main(argumentos + ['consultar', '--aeropuerto', aeropuerto, '--importe-min', '10000', '--salida', salida]) == 0
+    with open(salida, encoding='utf-8') as f:
+        informe = json.load(f)
+
+    filtros = contexto.filtros(aeropuertos=aeropuerto, importe_min=10000)
+    filas = contexto.df[mascara_filtros(contexto.df, filtros)]
+    assert informe['version'] == contexto.version
+    assert informe['filtros']['aeropuertos'] == [aeropuerto]
+    assert informe['metricas']['Total licitaciones'] == len(filas)
+    assert informe['metricas']['Adjudicado total'] == pytest.approx(filas[IMPORTE_COL].sum())
+    assert [r['Aeropuerto'] for r in informe['aeropuertos_licitaciones']] == [aeropuerto]
+
+
+def test_informe_parquet_con_las_mismas_tablas(argumentos, contexto, tmp_path):
+    salida = str(tmp_path / 'informe')
+    assert main(argumentos + ['consultar', '--formato', 'parquet', '--salida', salida]) == 0
+    tablas = tablas_informe(contexto.motor.agregados(contexto.filtros()))
+    assert sorted(os.listdir(salida)) == sorted(f"{nombre}.parquet" for nombre in tablas)
+    leida = pd.read_parquet(os.path.join(salida, 'empresas_importe.parquet'))
+    pd.testing.assert_frame_equal(leida, tablas['empresas_importe'], check_dtype=False)
+    assert pd.read_parquet(os.path.join(salida, 'metricas.parquet'))['version'].iloc[0] == contexto.version
+
+
+def test_lote_un_informe_por_aeropuerto(argumentos, contexto, tmp_path):
+    dir_salida = str(tmp_path / 'lote')
+    assert main(argumentos + ['lote', '--por', 'aeropuerto', '--dir-salida', dir_salida, '--procesos', '1']) == 0
+    informes = []
+    for nombre in os.listdir(dir_salida):
+        with open(os.path.join(dir_salida, nombre), encoding='utf-8') as f:
+            informes.append(json.load(f))
+    assert sorted(i['filtros']['aeropuertos'][0] for i in informes) == contexto.opciones.aeropuertos
+    por_aeropuerto = contexto.df[AEROPUERTO_COL].value_counts()
+    for informe in informes:
+        # Las filas sin importe quedan fuera del rango de importes por defecto
+        assert informe['metricas']['Total licitaciones'] <= por_aeropuerto[informe['filtros']['aeropuertos'][0]]
+    assert sum(i['metricas']['Total licitaciones'] for i in informes) == contexto.df[IMPORTE_COL].notna().sum()
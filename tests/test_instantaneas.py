@@ -0,0 +1,37 @@
+import os
+
+import pandas as pd
+
+from instantaneas import AlmacenInstantaneas, filtros_precalculados, precalcular_instantaneas
+from informes import tablas_informe
+
+
+def mismas_tablas(a, b):
+    for nombre, tabla in tablas_informe(a).items():
+        pd.testing.assert_frame_equal(tabla, tablas_informe(b)[nombre])
+
+
+def test_precalculo_en_paralelo_igual_que_el_motor(almacen, contexto, tmp_path):
+    _, dir_cache = almacen
+    dir_instantaneas = str(tmp_path / 'instantaneas')
+    os.makedirs(os.path.join(dir_instantaneas, 'antigua_f1'))
+    version, n = precalcular_instantaneas(procesos=2, dir_cache=dir_cache, dir_instantaneas=dir_instantaneas)
+    lista = filtros_precalculados(contexto)
+    assert version == contexto.version and n == len(lista)
+    # Las instantáneas de otras versiones se purgan
+    assert os.listdir(dir_instantaneas) == [os.path.basename(AlmacenInstantaneas(version, dir_instantaneas).directorio)]
+
+    instantaneas = AlmacenInstantaneas(version, dir_instantaneas)
+    for filtros in lista[:5] + lista[-5:]:
+        mismas_tablas(instantaneas.cargar(filtros), contexto.motor.agregados(filtros))
+
+
+def test_instantanea_de_otro_estado_no_se_usa(contexto, tmp_path):
+    instantaneas = AlmacenInstantaneas(contexto.version, str(tmp_path))
+    filtros = contexto.filtros(aeropuertos=contexto.opciones.aeropuertos[0])
+    assert instantaneas.cargar(filtros) is None
+    instantaneas.guardar(filtros, contexto.motor.agregados(filtros))
+    # Un fichero con la clave de otro estado (colisión) se descarta
+    otro = contexto.filtros(aeropuertos=contexto.opciones.aeropuertos[1])
+    os.replace(instantaneas.ruta(filtros), instantaneas.ruta(otro))
+    assert instantaneas.cargar(otro) is None
@@ -0,0 +1,59 @@
+import json
+import logging
+import threading
+
+import instrumentacion
+from instrumentacion import (MetricasProceso, descartar_ejecucion, ejecucion_en_curso, finalizar_ejecucion,
+                             iniciar_ejecucion, marcar_fallo, medido, medir)
+
+
+def test_ejecucion_registra_secciones_y_caches(monkeypatch, tmp_path, caplog):
+    monkeypatch.setattr(instrumentacion, 'metricas', MetricasProceso())
+
+    @medido
+    def cargar():
+        return 1
+
+    iniciar_ejecucion()
+    cargar()
+    cargar()
+    with medir('agregados', cache='motor'):
+        marcar_fallo('motor')
+    with medir('agregados', cache='motor'):
+        pass
+    ruta = tmp_path / 'metricas.prom'
+    with caplog.at_level(logging.INFO, logger='aena.rendimiento'):
+        ejecucion = finalizar_ejecucion(str(ruta))
+    assert ejecucion_en_curso() is None
+
+    resumen = ejecucion.como_dict()
+    assert resumen['secciones']['cargar']['llamadas'] == 2
+    assert resumen['secciones']['agregados']['llamadas'] == 2
+    assert resumen['caches'] == {'motor': {'aciertos': 1, 'fallos': 1}}
+    assert json.loads(caplog.records[-1].getMessage())['caches'] == resumen['caches']
+
+    texto = ruta.read_text(encoding='utf-8')
+    assert 'aena_ejecuciones_total 1' in texto
+    assert 'aena_seccion_segundos_count{seccion="cargar"} 2' in texto
+    assert 'aena_seccion_segundos_bucket{seccion="cargar",le="+Inf"} 2' in texto
+    assert 'aena_cache_total{cache="motor",resultado="acierto"} 1' in texto
+    assert 'aena_cache_total{cache="motor",resultado="fallo"} 1' in texto
+
+
+def test_histograma_acumulado():
+    metricas = MetricasProceso()
+    metricas.observar('s', 0.02)
+    metricas.observar('s', 3.0)
+    cubos = dict(zip(instrumentacion.INTERVALOS_SEGUNDOS, metricas.histograma['s']))
+    assert cubos[0.01] == 0 and cubos[0.025] == 1 and cubos[2.5] == 1 and cubos[5.0] == 2
+
+
+def test_ejecuciones_por_hilo_y_descartar():
+    iniciar_ejecucion()
+    en_hilo = []
+    hilo = threading.Thread(target=lambda: en_hilo.append(ejecucion_en_curso()))
+    hilo.start()
+    hilo.join()
+    assert en_hilo == [None] and ejecucion_en_curso() is not None
+    descartar_ejecucion()
+    assert ejecucion_en_curso() is None
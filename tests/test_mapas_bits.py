@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from indice_filtros import AEROPUERTO_COL, EMPRESA_COL, IndiceFiltros
+from mapas_bits import MapaBits
+
+
+def conjuntos_aleatorios(n_filas, semilla):
+    rng = np.random.default_rng(semilla)
+    # De muy dispersos a muy densos, con los bordes de las palabras (0, 63, 64, n - 1)
+    conjuntos = [np.sort(rng.choice(n_filas, k, replace=False)) for k in (0, 1, 5, n_filas // 40, n_filas // 10, n_filas // 2)]
+    conjuntos.append(np.array([0, 63, 64, n_filas - 1]))
+    return conjuntos
+
+
+@pytest.mark.parametrize('n_filas', [1000, 4097])
+def test_operaciones_igual_que_conjuntos(n_filas):
+    conjuntos = conjuntos_aleatorios(n_filas, n_filas)
+    mapas = [MapaBits.desde_posiciones(c, n_filas) for c in conjuntos]
+    assert any(m.es_denso() for m in mapas) and any(not m.es_denso() for m in mapas)
+    todas = np.arange(n_filas)
+    for a, mapa_a in zip(conjuntos, mapas):
+        assert mapa_a.cuenta() == len(a)
+        np.testing.assert_array_equal(mapa_a.posiciones(), a)
+        np.testing.assert_array_equal(np.flatnonzero(mapa_a.contiene(todas)), a)
+        for b, mapa_b in zip(conjuntos, mapas):
+            assert (mapa_a | mapa_b).posiciones().tolist() == sorted(set(a.tolist()) | set(b.tolist()))
+            assert (mapa_a & mapa_b).posiciones().tolist() == sorted(set(a.tolist()) & set(b.tolist()))
+    union = MapaBits.union(mapas, n_filas)
+    assert union.posiciones().tolist() == sorted(set(np.concatenate(conjuntos).tolist()))
+    assert MapaBits.union([], n_filas).cuenta() == 0
+
+
+def test_seleccion_multiple_igual_que_pandas(datos_sinteticos):
+    indice = IndiceFiltros(datos_sinteticos)
+    aeropuertos = sorted(datos_sinteticos[AEROPUERTO_COL].unique())
+    empresas = sorted(datos_sinteticos[EMPRESA_COL].dropna().unique())
+    for n_aeropuertos, n_empresas in [(1, 0), (4, 0), (0, 3), (len(aeropuertos), 0), (5, 30), (2, len(empresas))]:
+        elegidos, elegidas = aeropuertos[:n_aeropuertos], empresas[:n_empresas]
+        mascara = np.ones(len(datos_sinteticos), dtype=bool)
+        if elegidos:
+            mascara &= datos_sinteticos[AEROPUERTO_COL].isin(elegidos).to_numpy()
+        if elegidas:
+            mascara &= datos_sinteticos[EMPRESA_COL].isin(elegidas).to_numpy()
+        np.testing.assert_array_equal(indice.seleccion(elegidos, elegidas).posiciones(), np.flatnonzero(mascara))
+    assert indice.seleccion((), ()) is None
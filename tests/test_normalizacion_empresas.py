@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from almacen_datos import sincronizar_almacen
+from indice_filtros import EMPRESA_COL
+from informes import Contexto
+from normalizacion_empresas import FICHERO_BLOQUES, NormalizadorEmpresas, canonizar, clave_empresa
+
+
+@pytest.mark.parametrize('a, b', [
+    ('ACCIONA CONSTRUCCION SA', 'Acciona Construcción, S.A.'),
+    ('ACCIONA CONSTRUCCION SA', 'ACCIONA CONSTRUCCION SOCIEDAD ANONIMA'),
+    ('UTE ACCIONA SA - FERROVIAL SL', 'FERROVIAL S.L. / ACCIONA S.A. UTE'),
+    ('FERROVIAL SERVICIOS S.A. (UTE)', 'FERROVIAL SERVICIOS SA'),
+])
+def test_misma_clave(a, b):
+    assert clave_empresa(a) == clave_empresa(b)
+
+
+def test_variantes_se_agrupan(tmp_path):
+    recuentos = {'ACCIONA CONSTRUCCION SA': 5, 'Acciona Construcción, S.A.': 1,
+                 'ACCIONA CONSTRUCCIONES SA': 2, 'ACCIONA CONSTRUCION SA': 1}
+    mapa = canonizar(recuentos, str(tmp_path))
+    assert set(mapa.values()) == {'ACCIONA CONSTRUCCION SA'}
+
+
+@pytest.mark.parametrize('a, b', [
+    ('CONELSAN SA', 'CONELSAN SL'),
+    ('SERVICIOS AEROPORTUARIOS 2 SL', 'SERVICIOS AEROPORTUARIOS 3 SL'),
+    ('UTE CONELSAN SA - ELSAMEX SAU', 'UTE CONELSAN SL - ELSAMEX SAU'),
+    ('UTE INFRAESTRUCTURAS CONELSAN SA-ELSAMEX SAU', 'UTE INFRAESTRUCTURAS CONELSAN SL-ELSAMEX SAU'),
+    ('UTE CONELSAN SA - ELSAMEX SAU', 'CONELSAN SA'),
+])
+def test_empresas_distintas_no_se_agrupan(tmp_path, a, b):
+    mapa = canonizar({a: 1, b: 1}, str(tmp_path))
+    assert mapa[a] != mapa[b]
+
+
+def test_incremental_conserva_empresas_y_usa_los_bloques_guardados(tmp_path):
+    dir_cache = str(tmp_path)
+    canonizar({'ACCIONA CONSTRUCCION SA': 3, 'UTE CONELSAN SA - ELSAMEX SAU': 2, 'FERROVIAL SL': 1}, dir_cache)
+    assert os.path.exists(os.path.join(dir_cache, FICHERO_BLOQUES))
+
+    # Los nombres nuevos se agrupan con las empresas conocidas de sus bloques, con las mismas reglas
+    mapa = canonizar({'Acciona Construcciones, S.A.': 10, 'UTE CONELSAN SL - ELSAMEX SAU': 1,
+                      'FERROVIAL SA': 1, 'ACCIONA CONSTRUCCION SA': 3}, dir_cache)
+    assert mapa['Acciona Construcciones, S.A.'] == 'ACCIONA CONSTRUCCION SA'
+    assert mapa['UTE CONELSAN SL - ELSAMEX SAU'] == 'UTE CONELSAN SL - ELSAMEX SAU'
+    assert mapa['FERROVIAL SA'] == 'FERROVIAL SA'
+
+
+def test_indice_de_bloques_perdido_se_reconstruye(tmp_path):
+    dir_cache = str(tmp_path)
+    canonizar({'ACCIONA CONSTRUCCION SA': 3}, dir_cache)
+    os.remove(os.path.join(dir_cache, FICHERO_BLOQUES))
+    assert canonizar({'ACCIONA CONSTRUCION SA': 1}, dir_cache)['ACCIONA CONSTRUCION SA'] == 'ACCIONA CONSTRUCCION SA'
+    assert len(NormalizadorEmpresas(dir_cache).entidades) == 1
+
+
+def test_conjunto_cargado_usa_los_nombres_canonicos(tmp_path, datos_sinteticos, escribir_libro):
+    datos_sinteticos.loc[15:17, EMPRESA_COL] = 'Construccion y Ñandu SA'
+    datos_sinteticos.loc[18:19, EMPRESA_COL] = 'CONSTRUCCIÓN Y ÑANDÚ SOCIEDAD ANONIMA'
+    ruta = escribir_libro(datos_sinteticos)
+    dir_cache = str(tmp_path / 'cache')
+    contexto = Contexto(sincronizar_almacen(os.path.dirname(ruta), dir_cache=dir_cache), dir_cache)
+    assert contexto.df[EMPRESA_COL].iloc[10:20].tolist() == ['CONSTRUCCIÓN Y ÑANDÚ, S.A.'] * 10
+    assert contexto.opciones.empresas.count('CONSTRUCCIÓN Y ÑANDÚ, S.A.') == 1
+    assert 'Construccion y Ñandu SA' not in contexto.opciones.empresas
@@ -0,0 +1,71 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from agregaciones import FILAS
+from cache_consultas import clave_filtros
+from indice_filtros import IMPORTE_COL, Filtros
+from informes import Contexto
+from instrumentacion import descartar_ejecucion, iniciar_ejecucion
+from refinamiento import SesionConsultas, es_refinamiento
+
+
+def clave(aeropuertos=(), empresas=(), fechas=(), importes=(0, 100), busqueda=''):
+    return clave_filtros(Filtros(aeropuertos, empresas, fechas, importes), busqueda)
+
+
+def test_es_refinamiento():
+    marzo = (datetime.date(2024, 3, 1), datetime.date(2024, 3, 31))
+    base = clave(aeropuertos=('MAD', 'BCN'), fechas=marzo, busqueda='obra')
+    assert es_refinamiento(clave(aeropuertos=('MAD',), fechas=marzo, busqueda='obra'), base)
+    assert es_refinamiento(clave(aeropuertos=('BCN',), fechas=marzo, importes=(10, 50), busqueda='obras'), base)
+    assert es_refinamiento(clave(aeropuertos=('MAD',), empresas=('X',), fechas=(marzo[0], marzo[0]), busqueda='obra'), base)
+    # Ampliar cualquier filtro, o cambiar el término, no es un refinamiento
+    assert not es_refinamiento(clave(aeropuertos=('MAD', 'PMI'), fechas=marzo, busqueda='obra'), base)
+    assert not es_refinamiento(clave(fechas=marzo, busqueda='obra'), base)
+    assert not es_refinamiento(clave(aeropuertos=('MAD',), fechas=(marzo[0], datetime.date(2024, 4, 1)), busqueda='obra'), base)
+    assert not es_refinamiento(clave(aeropuertos=('MAD',), fechas=marzo, importes=(0, 200), busqueda='obra'), base)
+    assert not es_refinamiento(clave(aeropuertos=('MAD',), fechas=marzo, busqueda='obr'), base)
+
+
+@pytest.fixture
+def contexto_busqueda(almacen):
+    manifiesto, dir_cache = almacen
+    return Contexto(manifiesto, dir_cache, con_busqueda=True)
+
+
+def test_sesion_igual_que_sin_sesion(contexto_busqueda):
+    contexto = contexto_busqueda
+    aeropuertos = contexto.opciones.aeropuertos
+    importes = np.nanquantile(contexto.df[IMPORTE_COL], [0.1, 0.3, 0.5])
+    estados = [
+        (contexto.filtros(), ''),
+        (contexto.filtros(importe_min=importes[0]), ''),
+        (contexto.filtros(importe_min=importes[1]), ''),
+        (contexto.filtros(aeropuertos=aeropuertos[:6], importe_min=importes[1]), ''),
+        (contexto.filtros(aeropuertos=aeropuertos[:2], importe_min=importes[2]), ''),
+        # Se amplía: vuelve al recorrido completo
+        (contexto.filtros(aeropuertos=aeropuertos[:8]), ''),
+        (contexto.filtros(aeropuertos=aeropuertos[:8]), 'ma'),
+        (contexto.filtros(aeropuertos=aeropuertos[:8]), 'mal'),
+        (contexto.filtros(aeropuertos=aeropuertos[:3]), 'malaga'),
+        (contexto.filtros(), 'de'),
+    ]
+    sesion = SesionConsultas(contexto.version)
+    ejecucion = iniciar_ejecucion()
+    try:
+        for filtros, busqueda in estados:
+            np.testing.assert_array_equal(contexto.filas(filtros, busqueda, sesion=sesion),
+                                          contexto.filas(filtros, busqueda), err_msg=f"{filtros} {busqueda!r}")
+            medidas = contexto.motor.medidas_filas(filtros, sesion=sesion)
+            esperadas = contexto.motor.base.sumar_filas(contexto.indice.filtrar(*filtros))
+            np.testing.assert_allclose(medidas, esperadas, atol=1e-6)
+            # Las celdas vacías quedan a cero exacto
+            assert np.all(medidas[esperadas[:, FILAS] == 0] == 0)
+    finally:
+        descartar_ejecucion()
+    assert ejecucion.aciertos['refinamiento_filas'] >= 4
+    assert ejecucion.aciertos['refinamiento_busqueda'] >= 2
+    assert ejecucion.aciertos['refinamiento_medidas'] >= 4
+    assert ejecucion.fallos['refinamiento_medidas'] >= 2
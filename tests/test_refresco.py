@@ -0,0 +1,47 @@
+import gc
+import os
+
+import pytest
+
+from almacen_datos import dir_partes_version
+from indice_filtros import IMPORTE_COL, Filtros
+from refresco import VigilanteDatos
+
+backend_sql = pytest.importorskip('backend_sql')
+pytest.importorskip('duckdb')
+
+TODOS = Filtros((), (), (), (0, float('inf')))
+
+
+def test_refresco_no_rompe_un_contexto_sql_antiguo(tmp_path, datos_sinteticos, escribir_libro):
+    ruta = escribir_libro(datos_sinteticos)
+    dir_cache = str(tmp_path / 'cache')
+    vigilante = VigilanteDatos(lambda manifiesto: backend_sql.ContextoSQL(manifiesto, dir_cache),
+                               dir_datos=os.path.dirname(ruta), dir_cache=dir_cache, ingesta_en_proceso=False)
+    antiguo = vigilante.vigente()
+    n_antiguo = antiguo.contar(TODOS)
+    # Las filas sin importe nunca entran en el rango de importes
+    assert n_antiguo == datos_sinteticos[IMPORTE_COL].notna().sum()
+
+    # Se reescribe el libro con menos filas mientras el contexto antiguo sigue en uso
+    recortados = datos_sinteticos.iloc[:250]
+    escribir_libro(recortados)
+    os.utime(ruta, (1, 1))
+    assert vigilante.refrescar()
+    nuevo = vigilante.vigente()
+    assert nuevo.version != antiguo.version
+    assert nuevo.contar(TODOS) == recortados[IMPORTE_COL].notna().sum()
+
+    # Las partes de la versión antigua siguen ahí mientras alguien la usa
+    assert vigilante.purgar_retiradas() == []
+    assert antiguo.contar(TODOS) == n_antiguo
+    assert len(antiguo.pagina(TODOS, pagina=2, tamano_pagina=100)) == 100
+
+    # Al liberarla, el siguiente refresco borra sus partes y conserva las vigentes
+    version_antigua = antiguo.version
+    del antiguo
+    gc.collect()
+    assert not vigilante.refrescar()
+    assert not os.path.exists(dir_partes_version(version_antigua, dir_cache))
+    assert os.path.isdir(dir_partes_version(nuevo.version, dir_cache))
+    assert nuevo.contar(TODOS) == recortados[IMPORTE_COL].notna().sum()
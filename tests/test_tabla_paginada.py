@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from indice_filtros import EMPRESA_COL, FECHA_COL, IMPORTE_COL
+from tabla_paginada import COLUMNAS_TABLA, formatear_pagina, numero_paginas, ordenar_posiciones, posiciones_pagina
+
+
+def orden_referencia(df, posiciones, columna, ascendente):
+    """Orden estable con nulos al final, calculado fila a fila (sorted con reverse también es estable)"""
+    valores = df[columna]
+    con_valor = [p for p in posiciones if not pd.isna(valores.iloc[p])]
+    sin_valor = [p for p in posiciones if pd.isna(valores.iloc[p])]
+    return sorted(con_valor, key=lambda p: valores.iloc[p], reverse=not ascendente) + sin_valor
+
+
+def test_ordenacion_igual_que_referencia(contexto):
+    posiciones = contexto.indice.filtrar(*contexto.filtros(importe_min=20_000))
+    df = contexto.df
+    for columna in (IMPORTE_COL, FECHA_COL, EMPRESA_COL):
+        for ascendente in (True, False):
+            ordenadas = ordenar_posiciones(df, posiciones, columna, ascendente)
+            assert ordenadas.tolist() == orden_referencia(df, posiciones.tolist(), columna, ascendente)
+
+
+def test_paginas_recorren_todas_las_filas(contexto):
+    posiciones = contexto.indice.filtrar(*contexto.filtros())
+    for tamano in (25, 100, 1000):
+        paginas = [posiciones_pagina(posiciones, p, tamano) for p in range(1, numero_paginas(len(posiciones), tamano) + 1)]
+        np.testing.assert_array_equal(np.concatenate(paginas), posiciones)
+        assert all(0 < len(p) <= tamano for p in paginas)
+    assert numero_paginas(0, 25) == 1
+
+
+def test_formato_solo_de_la_pagina(contexto):
+    pagina = formatear_pagina(contexto.df.iloc[posiciones_pagina(np.arange(len(contexto.df)), 2, 25)])
+    assert list(pagina.columns) == COLUMNAS_TABLA and len(pagina) == 25
+    assert pagina[IMPORTE_COL].str.endswith(' €').all()
+    assert pagina[FECHA_COL].str.match(r'\d{2}/\d{2}/\d{4}$').all()
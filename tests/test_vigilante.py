@@ -0,0 +1,68 @@
+import os
+import threading
+from almacen_datos import version_almacen
+from refresco import VigilanteDatos
+
+
+class Paquete:
+    """Paquete mínimo de una versión (admite referencias débiles)"""
+
+    def __init__(self, manifiesto):
+        self.version = version_almacen(manifiesto)
+
+
+def crear_vigilante(ruta, dir_cache, construir=None):
+    construir = construir or Paquete
+    return VigilanteDatos(construir, dir_datos=os.path.dirname(ruta), dir_cache=dir_cache, ingesta_en_proceso=False)
+
+
+def test_sin_cambios_no_reconstruye(tmp_path, datos_sinteticos, escribir_libro):
+    ruta = escribir_libro(datos_sinteticos)
+    construidos = []
+
+    def construir(manifiesto):
+        construidos.append(manifiesto)
+        return Paquete(manifiesto)
+
+    vigilante = crear_vigilante(ruta, str(tmp_path / 'cache'), construir)
+    primero = vigilante.vigente()
+    assert not vigilante.refrescar()
+    assert vigilante.vigente() is primero and len(construidos) == 1
+
+
+def test_sesiones_siguen_con_la_version_anterior_hasta_publicar(tmp_path, datos_sinteticos, escribir_libro):
+    ruta = escribir_libro(datos_sinteticos)
+    construyendo, seguir = threading.Event(), threading.Event()
+
+    def construir(manifiesto):
+        if vigilante._vigente is not None:
+            construyendo.set()
+            assert seguir.wait(10)
+        return Paquete(manifiesto)
+
+    vigilante = crear_vigilante(ruta, str(tmp_path / 'cache'), construir)
+    anterior = vigilante.vigente()
+    escribir_libro(datos_sinteticos.iloc[:100])
+    os.utime(ruta, (1, 1))
+    resultado = []
+    hilo = threading.Thread(target=lambda: resultado.append(vigilante.refrescar()))
+    hilo.start()
+    assert construyendo.wait(10)
+    # Mientras se construye la versión nueva, las sesiones no esperan y ven la anterior
+    assert vigilante.vigente() is anterior
+    seguir.set()
+    hilo.join(10)
+    assert resultado == [True]
+    assert vigilante.vigente().version != anterior.version
+
+
+def test_error_al_refrescar_mantiene_la_version_vigente(tmp_path, datos_sinteticos, escribir_libro):
+    ruta = escribir_libro(datos_sinteticos)
+    vigilante = crear_vigilante(ruta, str(tmp_path / 'cache'))
+    anterior = vigilante.vigente()
+    escribir_libro(datos_sinteticos.iloc[:100])
+    os.utime(ruta, (1, 1))
+    vigilante._construir = lambda manifiesto: 1 / 0
+    assert not vigilante.refrescar()
+    assert isinstance(vigilante.error, ZeroDivisionError)
+    assert vigilante.vigente() is anterior